@@ -0,0 +1,76 @@
+"""
+Micro-benchmark for :py:class:`cate.util.cache.Cache`.
+
+Measures insert (put_value with eviction) and hit (get_value) throughput for
+1k, 10k and 100k cached items for each of the predefined replacement policies.
+
+Usage::
+
+    $ python benchmarks/bench_cache.py [--sizes 1000,10000,100000]
+"""
+
+import argparse
+import random
+import time
+
+from cate.util.cache import Cache, CacheStore, POLICY_LRU, POLICY_MRU, POLICY_LFU, POLICY_RR
+
+POLICIES = [('LRU', POLICY_LRU), ('MRU', POLICY_MRU), ('LFU', POLICY_LFU), ('RR', POLICY_RR)]
+
+
+class UnitSizeCacheStore(CacheStore):
+    """Memory store whose values all have size 1, so that capacity equals the number of items."""
+
+    def can_load_from_key(self, key) -> bool:
+        return False
+
+    def load_from_key(self, key):
+        raise NotImplementedError()
+
+    def store_value(self, key, value):
+        return value, 1
+
+    def restore_value(self, key, stored_value):
+        return stored_value
+
+    def discard_value(self, key, stored_value):
+        pass
+
+
+def bench(policy, num_items: int, num_ops: int):
+    # threshold=1.0 so the cache holds exactly num_items before it starts evicting
+    cache = Cache(UnitSizeCacheStore(), capacity=num_items, threshold=1.0, policy=policy)
+    for i in range(num_items):
+        cache.put_value(i, i)
+
+    t0 = time.perf_counter()
+    for i in range(num_items, num_items + num_ops):
+        cache.put_value(i, i)
+    insert_rate = num_ops / (time.perf_counter() - t0)
+
+    keys = [random.randrange(num_ops, num_items + num_ops) for _ in range(num_ops)]
+    t0 = time.perf_counter()
+    for key in keys:
+        cache.get_value(key)
+    hit_rate = num_ops / (time.perf_counter() - t0)
+
+    return insert_rate, hit_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cache micro-benchmark')
+    parser.add_argument('--sizes', default='1000,10000,100000',
+                        help='comma-separated numbers of cached items')
+    parser.add_argument('--ops', type=int, default=20000,
+                        help='number of inserts and hits per run')
+    args = parser.parse_args()
+
+    print('%-6s %10s %16s %16s' % ('policy', 'items', 'inserts/s', 'hits/s'))
+    for num_items in map(int, args.sizes.split(',')):
+        for name, policy in POLICIES:
+            insert_rate, hit_rate = bench(policy, num_items, args.ops)
+            print('%-6s %10d %16.0f %16.0f' % (name, num_items, insert_rate, hit_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Micro-benchmark for :py:meth:`cate.util.im.image.ColorMappedRgbaImage.compute_tile_from_source_tile`.
+
+Compares the lookup-table based color mapping with the former implementation that normalised
+masked arrays and called the Matplotlib color map for every tile. Reports tiles/second for
+float32 tiles of 256x256 and 512x512 pixels, with and without PNG encoding.
+
+Usage::
+
+    $ python benchmarks/bench_colormap.py [--sizes 256,512] [--tiles 200]
+"""
+
+import argparse
+import io
+import time
+
+import matplotlib.cm as cm
+import numpy as np
+from PIL import Image
+
+from cate.util.im.image import ColorMappedRgbaImage, OpImage
+
+
+class ConstantTileImage(OpImage):
+    def __init__(self, tile):
+        height, width = tile.shape
+        super().__init__((width, height), (width, height), (1, 1), mode=str(tile.dtype), format='ndarray',
+                         tile_cache=None)
+        self.tile = tile
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        return self.tile
+
+
+class LegacyColorMapper:
+    """The color mapping as implemented before lookup tables were introduced."""
+
+    def __init__(self, value_range, cmap_name, no_data_value=None, encode=False, format=None):
+        self._value_range = value_range
+        self._cmap = cm.get_cmap(cmap_name, 256)
+        self._cmap.set_bad('k', 0)
+        self._no_data_value = no_data_value
+        self._encode = encode
+        self._format = format
+
+    def compute_tile_from_source_tile(self, source_tile):
+        value_min, value_max = self._value_range
+        if not np.ma.is_masked(source_tile):
+            if self._no_data_value is not None:
+                array = np.ma.masked_equal(source_tile, self._no_data_value)
+                array = array.clip(value_min, value_max, out=array)
+            else:
+                array = np.ma.masked_invalid(source_tile)
+                array = array.clip(value_min, value_max, out=array)
+        else:
+            array = source_tile.clip(value_min, value_max)
+        array -= value_min
+        array *= 1.0 / (value_max - value_min)
+        array = self._cmap(array, bytes=True)
+        image = Image.fromarray(array, mode='RGBA')
+        if self._encode and self._format:
+            ostream = io.BytesIO()
+            image.save(ostream, format=self._format)
+            return ostream.getvalue()
+        return image
+
+
+def new_tile(size: int) -> np.ndarray:
+    tile = np.random.uniform(270., 310., size=(size, size)).astype(np.float32)
+    tile[:size // 8, :] = np.nan
+    tile[-size // 8:, :] = -999.
+    return tile
+
+
+def bench(compute, tiles) -> float:
+    t0 = time.perf_counter()
+    for tile in tiles:
+        compute(tile)
+    return len(tiles) / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Color mapping micro-benchmark')
+    parser.add_argument('--sizes', default='256,512',
+                        help='comma-separated tile sizes in pixels')
+    parser.add_argument('--tiles', type=int, default=200,
+                        help='number of tiles per run')
+    args = parser.parse_args()
+
+    print('%-6s %-8s %16s %16s %8s' % ('size', 'encode', 'legacy tiles/s', 'LUT tiles/s', 'speedup'))
+    for size in map(int, args.sizes.split(',')):
+        # Distinct tiles, so that we don't just measure CPU caches
+        tiles = [new_tile(size) for _ in range(8)] * (args.tiles // 8)
+        for encode in (False, True):
+            legacy = LegacyColorMapper((270., 310.), 'jet', no_data_value=-999., encode=encode, format='PNG')
+            image = ColorMappedRgbaImage(ConstantTileImage(tiles[0]), value_range=(270., 310.), cmap_name='jet',
+                                         no_data_value=-999., encode=encode, format='PNG')
+            # The legacy implementation modifies its masked input array, hence we pass copies to both
+            legacy_rate = bench(lambda tile: legacy.compute_tile_from_source_tile(tile.copy()), tiles)
+            lut_rate = bench(lambda tile: image.compute_tile_from_source_tile(0, 0, None, tile.copy()), tiles)
+            print('%-6d %-8s %16.1f %16.1f %7.1fx' % (size, encode, legacy_rate, lut_rate, lut_rate / legacy_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark for :py:meth:`cate.core.workflow.Workflow.find_dependent_steps` and
+:py:meth:`cate.core.workflow.Workflow.sort_steps`.
+
+Builds synthetic workflows of 125, 250, 500 and 1000 steps in the shape of a long-lived workspace: resources
+read from file, each followed by a short chain of processing steps, some of which combine the results of two
+chains. For every chain, one edit of its first step is simulated, i.e. an input of the step is changed, which
+discards the reverse dependency index, and its dependent steps are looked up, as
+:py:meth:`cate.core.workspace.Workspace.set_resource` does. Reported are the mean time of such an edit, the time
+of the former scan calling :py:meth:`Step.requires` on every step, and the time of sorting all steps.
+
+Both the edit and the sort are expected to scale linearly with the number of steps. The benchmark therefore
+compares the time per step of every size with that of the smallest size and exits with status 1 if it grows by
+more than ``--max-growth``.
+
+Usage::
+
+    $ python benchmarks/bench_dependent_steps.py [--sizes 125,250,500,1000] [--chain-length 5] [--repeat 5]
+"""
+
+import argparse
+import random
+import sys
+import time
+from collections import OrderedDict
+
+from cate.core.op import op_input, op_output
+from cate.core.workflow import OpStep, Workflow
+from cate.util import OpMetaInfo
+
+
+@op_input('x')
+@op_output('y')
+def unary_op(x):
+    return {'y': x}
+
+
+@op_input('a')
+@op_input('b')
+@op_output('c')
+def binary_op(a, b):
+    return {'c': a + b}
+
+
+def new_workflow(num_steps: int, chain_length: int, seed: int = 0):
+    """Return a new workflow of *num_steps* steps and the list of steps that start a chain."""
+    rng = random.Random(seed)
+    workflow = Workflow(OpMetaInfo('bench', inputs=OrderedDict(p={}), outputs=OrderedDict()))
+    steps = []
+    root_steps = []
+    chain_ends = []
+    while len(steps) < num_steps:
+        if len(chain_ends) >= 2 and rng.random() < 0.2:
+            # Combine two existing chains
+            step = OpStep(binary_op, node_id='step_%d' % len(steps))
+            source1, source2 = rng.sample(chain_ends, 2)
+            step.inputs.a.source = source1
+            step.inputs.b.source = source2
+        else:
+            step = OpStep(unary_op, node_id='step_%d' % len(steps))
+            step.inputs.x.source = workflow.inputs.p
+            root_steps.append(step)
+        steps.append(step)
+        output = step.outputs[:][0]
+        for _ in range(chain_length - 1):
+            if len(steps) >= num_steps:
+                break
+            step = OpStep(unary_op, node_id='step_%d' % len(steps))
+            step.inputs.x.source = output
+            steps.append(step)
+            output = step.outputs.y
+        chain_ends.append(output)
+    workflow.add_steps(*steps)
+    return workflow, root_steps
+
+
+def edit_steps(workflow, root_steps):
+    dependent_ids = []
+    for root_step in root_steps:
+        root_step.inputs.x.source = workflow.inputs.p
+        dependent_ids.append({step.id for step in workflow.find_dependent_steps(root_step.id)})
+    return dependent_ids
+
+
+def legacy_edit_steps(workflow, root_steps):
+    """The former implementation of the dependent step lookup in :py:meth:`Workspace.set_resource`."""
+    dependent_ids = []
+    for root_step in root_steps:
+        root_step.inputs.x.source = workflow.inputs.p
+        dependent_ids.append({step.id for step in workflow.steps if step.requires(root_step)})
+    return dependent_ids
+
+
+def bench(func, repeat: int):
+    durations = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - t0)
+    return min(durations), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workflow dependent step benchmark')
+    parser.add_argument('--sizes', default='125,250,500,1000', help='comma-separated numbers of steps')
+    parser.add_argument('--chain-length', type=int, default=5, help='number of steps per processing chain')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs, the fastest one is reported')
+    parser.add_argument('--max-growth', type=float, default=3.0,
+                        help='maximum growth of the time per step compared to the smallest size')
+    args = parser.parse_args()
+
+    print('%-8s %14s %14s %14s %12s %12s' % ('steps', 'scan [ms]', 'edit [ms]', 'sort [ms]',
+                                             'edit growth', 'sort growth'))
+    base_edit_time = base_sort_time = None
+    is_linear = True
+    for num_steps in map(int, args.sizes.split(',')):
+        workflow, root_steps = new_workflow(num_steps, args.chain_length)
+        steps = workflow.steps
+        num_edits = len(root_steps)
+
+        legacy_duration, legacy_ids = bench(lambda: legacy_edit_steps(workflow, root_steps), 1)
+        edit_duration, dependent_ids = bench(lambda: edit_steps(workflow, root_steps), args.repeat)
+        sort_duration, _ = bench(lambda: Workflow.sort_steps(steps), args.repeat)
+        assert dependent_ids == legacy_ids
+
+        # Time per edit and step, or per sorted step
+        edit_time = edit_duration / num_edits / num_steps
+        sort_time = sort_duration / num_steps
+        if base_edit_time is None:
+            base_edit_time, base_sort_time = edit_time, sort_time
+        edit_growth = edit_time / base_edit_time
+        sort_growth = sort_time / base_sort_time
+        is_linear = is_linear and edit_growth <= args.max_growth and sort_growth <= args.max_growth
+        print('%-8d %14.3f %14.3f %14.3f %11.2fx %11.2fx' % (num_steps,
+                                                             legacy_duration / num_edits * 1000,
+                                                             edit_duration / num_edits * 1000,
+                                                             sort_duration * 1000,
+                                                             edit_growth, sort_growth))
+
+    if not is_linear:
+        print('time per step grew by more than %.1fx, expected linear scaling' % args.max_growth)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark for :py:class:`cate.util.im.image.FastNdarrayDownsamplingImage`.
+
+Writes a synthetic, global, chunked and compressed NetCDF file (by default 7200 x 3600 cells, i.e. 0.05 degrees),
+opens it with and without dask, and reports latency and peak memory (as traced by :py:mod:`tracemalloc`)
+for computing the first tile of every zoom level. The current implementation ("tile") is compared with reading
+the full-resolution window followed by in-memory striding ("window").
+
+Usage::
+
+    $ python benchmarks/bench_downsampling.py [--width 7200] [--height 3600] [--chunk-size 900]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import xarray as xr
+
+from cate.util.im.image import FastNdarrayDownsamplingImage
+
+
+class WindowReadDownsamplingImage(FastNdarrayDownsamplingImage):
+    """Reads the full-resolution window and then strides it."""
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        x, y, w, h = rectangle
+        s = self._step_size
+        tile = self._array[..., y * s:(y + h) * s, x * s:(x + w) * s]
+        if hasattr(tile, 'load'):
+            tile.load()
+        tile = tile[..., ::s, ::s]
+        return self.pad_tile(tile, self.tile_size)
+
+
+def write_dataset(path: str, width: int, height: int, chunk_size: int):
+    res = 360. / width
+    lon = np.linspace(-180. + res / 2, 180. - res / 2, width)
+    lat = np.linspace(90. - res / 2, -90. + res / 2, height)
+    sst = 285. + 15. * np.cos(np.deg2rad(lat))[:, None] + np.random.uniform(0., 1., size=(height, width))
+    dataset = xr.Dataset({'sst': (('time', 'lat', 'lon'), sst.astype(np.float32)[np.newaxis, ...])},
+                         coords=dict(lon=lon, lat=lat, time=[0]))
+    dataset.to_netcdf(path, encoding=dict(sst=dict(zlib=True, chunksizes=(1, chunk_size, chunk_size))))
+
+
+def measure(image_class, array, tile_size, step_exp):
+    image = image_class(array, tile_size, step_exp, tile_cache=None)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    image.compute_tile(0, 0, (0, 0, tile_size[0], tile_size[1]))
+    duration = time.perf_counter() - t0
+    peak_size = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return duration, peak_size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Downsampling image benchmark')
+    parser.add_argument('--width', type=int, default=7200, help='number of grid cells in longitude direction')
+    parser.add_argument('--height', type=int, default=3600, help='number of grid cells in latitude direction')
+    parser.add_argument('--chunk-size', type=int, default=900, help='chunk size of the NetCDF file and dask')
+    parser.add_argument('--tile-size', type=int, default=256, help='tile size in pixels')
+    args = parser.parse_args()
+
+    tile_size = args.tile_size, args.tile_size
+    num_levels = 1
+    while (args.height >> num_levels) >= args.tile_size:
+        num_levels += 1
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'sst.nc')
+        write_dataset(path, args.width, args.height, args.chunk_size)
+
+        print('%-6s %-6s %12s %12s %12s %12s' % ('dask', 'zoom', 'window [ms]', 'window [MB]',
+                                                 'tile [ms]', 'tile [MB]'))
+        for chunks in (None, dict(lat=args.chunk_size, lon=args.chunk_size)):
+            for z_index in range(num_levels):
+                step_exp = num_levels - 1 - z_index
+                results = []
+                for image_class in (WindowReadDownsamplingImage, FastNdarrayDownsamplingImage):
+                    # Reopen for each run, so that no chunks are cached
+                    with xr.open_dataset(path, chunks=chunks) as dataset:
+                        results.append(measure(image_class, dataset.sst[0], tile_size, step_exp))
+                (t1, m1), (t2, m2) = results
+                print('%-6s %-6d %12.1f %12.1f %12.1f %12.1f' % (chunks is not None, z_index,
+                                                                 t1 * 1000, m1 / 2 ** 20, t2 * 1000, m2 / 2 ** 20))
+
+
+if __name__ == '__main__':
+    main()
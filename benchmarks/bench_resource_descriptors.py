@@ -0,0 +1,99 @@
+"""
+Benchmark for building the descriptors of workspace resources, see :py:meth:`cate.core.workspace.Workspace.to_json_dict`.
+
+Creates a workspace with a single dataset resource of 100 variables, like many CCI products comprise, on global grids
+of 1, 0.25 and 0.05 degrees (by default), and reports
+
+* "first [ms]": the time required to build the resource descriptors for the first time;
+* "cached [ms]": the time required to build them again for the unchanged resource;
+* "payload [KB]": the size of the serialised workspace, which includes the values of 1D coordinate variables of at
+  most ``coord_data_max_size`` values;
+* "all coords [KB]": the size it would have, if it included the values of all 1D coordinate variables.
+
+Variables are backed by dask arrays, so that no data is computed.
+
+Usage::
+
+    $ python benchmarks/bench_resource_descriptors.py [--variables 100] [--widths 360,1440,7200] [--repeat 3]
+"""
+
+import argparse
+import json
+import time
+
+import dask.array as da
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from cate.core.op import OP_REGISTRY
+from cate.core.workflow import OpStep, Workflow
+from cate.core.workspace import Workspace
+from cate.util import OpMetaInfo, to_json
+
+
+def new_dataset(num_variables: int, width: int) -> xr.Dataset:
+    height = width // 2
+    res = 360. / width
+    var_attrs = {'units': 'K', 'long_name': 'a variable', 'valid_range': np.array([0., 400.])}
+    data_vars = {'var_%d' % i: (('time', 'lat', 'lon'),
+                                da.zeros((12, height, width), chunks=(1, min(height, 1024), min(width, 1024))),
+                                var_attrs)
+                 for i in range(num_variables)}
+    return xr.Dataset(data_vars=data_vars,
+                      coords={'lon': np.linspace(-180. + res / 2, 180. - res / 2, width),
+                              'lat': np.linspace(90. - res / 2, -90. + res / 2, height),
+                              'time': pd.date_range('2010-01-01', periods=12, freq='MS')})
+
+
+def measure(dataset: xr.Dataset):
+    def dataset_op() -> xr.Dataset:
+        return dataset
+
+    OP_REGISTRY.add_op(dataset_op)
+    try:
+        workflow = Workflow(OpMetaInfo('workspace_workflow'))
+        workflow.add_step(OpStep(dataset_op, node_id='ds'))
+        workspace = Workspace('/path', workflow)
+        workspace.execute_workflow()
+
+        t0 = time.perf_counter()
+        workspace.to_json_dict()
+        first_duration = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        workspace_json = workspace.to_json_dict()
+        cached_duration = time.perf_counter() - t0
+
+        payload_size = len(json.dumps(workspace_json))
+        omitted_size = 0
+        for coord_var in workspace_json['resources'][0]['coordVariables']:
+            if coord_var.get('isDataOmitted'):
+                omitted_size += len(json.dumps(to_json(dataset.coords[coord_var['name']].data)))
+        workspace.close()
+        return first_duration, cached_duration, payload_size, payload_size + omitted_size
+    finally:
+        OP_REGISTRY.remove_op(dataset_op)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workspace resource descriptor benchmark')
+    parser.add_argument('--variables', type=int, default=100, help='number of variables of the dataset')
+    parser.add_argument('--widths', default='360,1440,7200',
+                        help='comma-separated numbers of grid cells in longitude direction')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the fastest one is reported')
+    args = parser.parse_args()
+
+    print('%-8s %12s %12s %14s %16s' % ('width', 'first [ms]', 'cached [ms]', 'payload [KB]', 'all coords [KB]'))
+    for width in map(int, args.widths.split(',')):
+        dataset = new_dataset(args.variables, width)
+        results = [measure(dataset) for _ in range(args.repeat)]
+        first_duration = min(result[0] for result in results)
+        cached_duration = min(result[1] for result in results)
+        _, _, payload_size, all_coords_size = results[0]
+        print('%-8d %12.2f %12.3f %14.1f %16.1f' % (width, first_duration * 1000, cached_duration * 1000,
+                                                    payload_size / 1024, all_coords_size / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark for :py:meth:`cate.core.workflow.Workflow.sort_steps`.
+
+Builds synthetic workflows of 10, 100 and 1000 steps that resemble long-lived workspaces: a number of
+resources read from file, each followed by a short chain of processing steps, some of which combine the
+results of two chains. Compares the topological sort with the former brute-force sort, which computed
+the maximum distance between every pair of steps.
+
+Usage::
+
+    $ python benchmarks/bench_sort_steps.py [--sizes 10,100,1000] [--chain-length 5] [--repeat 3]
+"""
+
+import argparse
+import random
+import time
+from collections import OrderedDict
+
+from cate.core.op import op_input, op_output
+from cate.core.workflow import OpStep, Workflow
+from cate.util import OpMetaInfo
+
+
+@op_input('x')
+@op_output('y')
+def unary_op(x):
+    return {'y': x}
+
+
+@op_input('a')
+@op_input('b')
+@op_output('c')
+def binary_op(a, b):
+    return {'c': a + b}
+
+
+def legacy_sort_steps(steps):
+    """The former implementation of :py:meth:`Workflow.sort_steps`."""
+    n = len(steps)
+    if n < 2:
+        return steps
+    dist_and_step_list = []
+    for i1 in range(n):
+        max_dist = 0
+        step = steps[i1]
+        for i2 in range(n):
+            if i1 != i2:
+                dist = step.max_distance_to(steps[i2])
+                if dist > 0:
+                    max_dist = max(max_dist, dist)
+        dist_and_step_list.append((max_dist, step))
+    sorted_d_and_step_list = sorted(dist_and_step_list, key=lambda dist_and_step: dist_and_step[0])
+    return [dist_and_step[1] for dist_and_step in sorted_d_and_step_list]
+
+
+def new_workflow(num_steps: int, chain_length: int, seed: int = 0) -> Workflow:
+    rng = random.Random(seed)
+    workflow = Workflow(OpMetaInfo('bench', inputs=OrderedDict(p={}), outputs=OrderedDict()))
+    steps = []
+    chain_ends = []
+    while len(steps) < num_steps:
+        if len(chain_ends) >= 2 and rng.random() < 0.2:
+            # Combine two existing chains
+            step = OpStep(binary_op, node_id='step_%d' % len(steps))
+            source1, source2 = rng.sample(chain_ends, 2)
+            step.inputs.a.source = source1
+            step.inputs.b.source = source2
+        else:
+            step = OpStep(unary_op, node_id='step_%d' % len(steps))
+            step.inputs.x.source = workflow.inputs.p
+        steps.append(step)
+        output = step.outputs[:][0]
+        for _ in range(chain_length - 1):
+            if len(steps) >= num_steps:
+                break
+            step = OpStep(unary_op, node_id='step_%d' % len(steps))
+            step.inputs.x.source = output
+            steps.append(step)
+            output = step.outputs.y
+        chain_ends.append(output)
+    # Steps are added in arbitrary order, e.g. after renaming and replacing steps of a workspace
+    rng.shuffle(steps)
+    workflow.add_steps(*steps)
+    return workflow
+
+
+def is_execution_order(steps) -> bool:
+    index = {step: i for i, step in enumerate(steps)}
+    for step in steps:
+        for port in step.inputs[:]:
+            if port.source is not None and port.source.node in index and index[port.source.node] > index[step]:
+                return False
+    return True
+
+
+def bench(sort_steps, steps, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        sorted_steps = sort_steps(steps)
+        durations.append(time.perf_counter() - t0)
+        assert is_execution_order(sorted_steps)
+    return min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workflow step sorting benchmark')
+    parser.add_argument('--sizes', default='10,100,1000', help='comma-separated numbers of steps')
+    parser.add_argument('--chain-length', type=int, default=5, help='number of steps per processing chain')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the fastest one is reported')
+    args = parser.parse_args()
+
+    print('%-8s %14s %14s %10s' % ('steps', 'legacy [ms]', 'topo [ms]', 'speedup'))
+    for num_steps in map(int, args.sizes.split(',')):
+        steps = new_workflow(num_steps, args.chain_length).steps
+        legacy_duration = bench(legacy_sort_steps, steps, args.repeat)
+        duration = bench(Workflow.sort_steps, steps, args.repeat)
+        print('%-8d %14.2f %14.2f %9.0fx' % (num_steps, legacy_duration * 1000, duration * 1000,
+                                             legacy_duration / duration))
+
+
+if __name__ == '__main__':
+    main()
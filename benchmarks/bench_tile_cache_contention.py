@@ -0,0 +1,81 @@
+"""
+Contention benchmark for tile caches used by :py:class:`cate.util.im.OpImage`.
+
+Lets 1, 4 and 16 threads hammer ``OpImage.get_tile()`` of an image whose tiles are cheap to compute,
+so that the run time is dominated by tile cache access. Compares a single-lock
+:py:class:`cate.util.cache.Cache` with a :py:class:`cate.util.cache.StripedCache`.
+
+Usage::
+
+    $ python benchmarks/bench_tile_cache_contention.py [--threads 1,4,16] [--requests 20000]
+"""
+
+import argparse
+import random
+import threading
+import time
+
+import numpy as np
+
+import cate.util.im.image as image
+from cate.util.cache import Cache, StripedCache, MemoryCacheStore
+from cate.util.im import OpImage
+
+TILE_SIZE = 64
+NUM_TILES = 32
+
+
+class CheapImage(OpImage):
+    def __init__(self, tile_cache):
+        super().__init__((TILE_SIZE * NUM_TILES, TILE_SIZE * NUM_TILES),
+                         tile_size=(TILE_SIZE, TILE_SIZE),
+                         num_tiles=(NUM_TILES, NUM_TILES),
+                         image_id='cheap',
+                         tile_cache=tile_cache)
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        return np.full((TILE_SIZE, TILE_SIZE), tile_x + tile_y, dtype=np.float32)
+
+
+def bench(tile_cache, num_threads: int, num_requests: int) -> float:
+    op_image = CheapImage(tile_cache)
+    requests_per_thread = num_requests // num_threads
+    tile_coords = [(random.randrange(NUM_TILES), random.randrange(NUM_TILES)) for _ in range(requests_per_thread)]
+
+    def worker():
+        for tile_x, tile_y in tile_coords:
+            op_image.get_tile(tile_x, tile_y)
+
+    threads = [threading.Thread(target=worker) for _ in range(num_threads)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return requests_per_thread * num_threads / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tile cache contention benchmark')
+    parser.add_argument('--threads', default='1,4,16', help='comma-separated thread counts')
+    parser.add_argument('--requests', type=int, default=20000, help='total number of tile requests per run')
+    parser.add_argument('--stripes', type=int, default=16, help='number of stripes of the striped cache')
+    args = parser.parse_args()
+
+    # Don't let tile tracing dominate the measurements
+    image._DEBUG_OP_IMAGE = False
+
+    # Capacity for roughly half of all tiles, so that both hits and evictions occur
+    capacity = 2 * (NUM_TILES * NUM_TILES // 2) * TILE_SIZE * TILE_SIZE * 4
+
+    print('%-8s %8s %16s' % ('cache', 'threads', 'tiles/s'))
+    for num_threads in map(int, args.threads.split(',')):
+        for name, tile_cache in (('single', Cache(MemoryCacheStore(), capacity=capacity)),
+                                 ('striped', StripedCache(MemoryCacheStore(), capacity=capacity,
+                                                          num_stripes=args.stripes))):
+            rate = bench(tile_cache, num_threads, args.requests)
+            print('%-8s %8d %16.0f' % (name, num_threads, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark for the image tile encodings supported by :py:class:`cate.util.im.image.ColorMappedRgbaImage`.
+
+Reports the mean encoded tile size and the number of tiles/second, including color mapping, for
+synthetic 256x256 tiles that resemble typical CCI data:
+
+* "sst": a smooth sea surface temperature field with a land mask
+* "cloud": a patchy cloud fraction field with random noise and gaps
+
+Usage::
+
+    $ python benchmarks/bench_tile_encoding.py [--size 256] [--tiles 50]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from cate.util.im.image import ColorMappedRgbaImage, OpImage
+
+# (name, format, palette, save_options)
+ENCODINGS = [
+    ('png', 'PNG', False, None),
+    ('png-1', 'PNG', False, dict(compress_level=1)),
+    ('png8', 'PNG', True, None),
+    ('png8-1', 'PNG', True, dict(compress_level=1)),
+    ('webp-80', 'WEBP', False, dict(quality=80)),
+    ('webp-lossless', 'WEBP', False, dict(lossless=True, quality=0, method=0)),
+    ('jpeg-85', 'JPEG', False, dict(quality=85)),
+]
+
+
+class ConstantTileImage(OpImage):
+    def __init__(self, tile):
+        height, width = tile.shape
+        super().__init__((width, height), (width, height), (1, 1), mode=str(tile.dtype), format='ndarray',
+                         tile_cache=None)
+        self.tile = tile
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        return self.tile
+
+
+def new_sst_tile(size: int, seed: int) -> np.ndarray:
+    rng = np.random.RandomState(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+    sst = 285. + 15. * np.cos(np.pi * (y - 0.5)) + 2. * np.sin(2 * np.pi * (x * 3 + rng.rand())) \
+        + rng.normal(0., 0.1, size=(size, size))
+    land = np.hypot(x - rng.rand(), y - rng.rand()) < 0.3
+    sst[land] = np.nan
+    return sst.astype(np.float32)
+
+
+def new_cloud_tile(size: int, seed: int) -> np.ndarray:
+    rng = np.random.RandomState(seed)
+    coarse = rng.rand(size // 16, size // 16)
+    cfc = np.kron(coarse, np.ones((16, 16))) + rng.normal(0., 0.15, size=(size, size))
+    cfc = np.clip(cfc, 0., 1.)
+    cfc[rng.rand(size, size) < 0.05] = np.nan
+    return cfc.astype(np.float32)
+
+
+def bench(tiles, value_range, format, palette, save_options):
+    images = [ColorMappedRgbaImage(ConstantTileImage(tile), value_range=value_range, cmap_name='jet',
+                                   encode=True, format=format, palette=palette, save_options=save_options)
+              for tile in tiles]
+    num_bytes = 0
+    t0 = time.perf_counter()
+    for image, tile in zip(images, tiles):
+        num_bytes += len(image.compute_tile_from_source_tile(0, 0, None, tile))
+    duration = time.perf_counter() - t0
+    return num_bytes / len(tiles), len(tiles) / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Tile encoding benchmark')
+    parser.add_argument('--size', type=int, default=256, help='tile size in pixels')
+    parser.add_argument('--tiles', type=int, default=50, help='number of tiles per run')
+    args = parser.parse_args()
+
+    datasets = [('sst', (270., 305.), new_sst_tile), ('cloud', (0., 1.), new_cloud_tile)]
+    print('%-6s %-14s %12s %10s' % ('data', 'encoding', 'bytes/tile', 'tiles/s'))
+    for data_name, value_range, tile_factory in datasets:
+        tiles = [tile_factory(args.size, seed) for seed in range(args.tiles)]
+        for name, format, palette, save_options in ENCODINGS:
+            size, rate = bench(tiles, value_range, format, palette, save_options)
+            print('%-6s %-14s %12.0f %10.1f' % (data_name, name, size, rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+"""
+Load test for the WebAPI's ``/ws/res/tile`` route served by :py:class:`cate.webapi.rest.ResVarTileHandler`.
+
+Starts a Tornado server in-process which serves a synthetic global dataset, fires many concurrent
+tile requests and, at the same time, requests to a trivial "ping" route. Reports p50/p99 latencies
+for both. If tiles were computed on the IOLoop thread, ping latencies would be as high as tile latencies.
+
+Usage::
+
+    $ python benchmarks/bench_tile_server.py [--concurrency 32] [--requests 256]
+"""
+
+import argparse
+import time
+
+import numpy as np
+import tornado.gen
+import tornado.httpclient
+import tornado.httpserver
+import tornado.ioloop
+import tornado.testing
+import tornado.web
+import xarray as xr
+
+import cate.util.im.image as image
+from cate.core.cdm import get_tiling_scheme
+from cate.core.workflow import ValueCache
+from cate.util.web.webapi import url_pattern
+from cate.webapi.rest import ResVarTileHandler, MEM_TILE_CACHE
+
+
+class FakeWorkspace:
+    def __init__(self, resources):
+        self.base_dir = 'ws'
+        self.resource_cache = ValueCache()
+        for res_name, value in resources.items():
+            self.resource_cache[res_name] = value
+
+
+class FakeWorkspaceManager:
+    def __init__(self, workspace):
+        self.workspace = workspace
+
+    def get_workspace(self, base_dir):
+        return self.workspace
+
+
+# noinspection PyAbstractClass
+class PingHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write('pong')
+
+
+def new_dataset(width: int, height: int, chunk_size: int):
+    lon = np.linspace(-180. + 180. / width, 180. - 180. / width, width)
+    lat = np.linspace(90. - 90. / height, -90. + 90. / height, height)
+    sst = np.random.uniform(270., 310., size=(1, height, width)).astype(np.float32)
+    dataset = xr.Dataset({'sst': (('time', 'lat', 'lon'), sst)}, coords={'lon': lon, 'lat': lat, 'time': [1]})
+    return dataset.chunk({'lat': chunk_size, 'lon': chunk_size})
+
+
+def percentile(latencies, q):
+    return 1000. * float(np.percentile(latencies, q))
+
+
+@tornado.gen.coroutine
+def run_load(port: int, tile_urls, concurrency: int):
+    client = tornado.httpclient.AsyncHTTPClient(max_clients=concurrency)
+    tile_latencies = []
+    ping_latencies = []
+    pending = list(tile_urls)
+    done = [False]
+
+    @tornado.gen.coroutine
+    def fetch_tiles():
+        while pending:
+            url = pending.pop()
+            t0 = time.perf_counter()
+            response = yield client.fetch('http://localhost:%d%s' % (port, url), raise_error=False)
+            tile_latencies.append(time.perf_counter() - t0)
+            if response.code != 200:
+                print('error:', response.code, url)
+
+    @tornado.gen.coroutine
+    def ping():
+        ping_client = tornado.httpclient.AsyncHTTPClient(force_instance=True)
+        while not done[0]:
+            t0 = time.perf_counter()
+            yield ping_client.fetch('http://localhost:%d/ping' % port)
+            ping_latencies.append(time.perf_counter() - t0)
+            yield tornado.gen.sleep(0.01)
+
+    ping_future = ping()
+    yield [fetch_tiles() for _ in range(concurrency)]
+    done[0] = True
+    yield ping_future
+    return tile_latencies, ping_latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='WebAPI tile server load test')
+    parser.add_argument('--concurrency', type=int, default=32, help='number of concurrent tile requests')
+    parser.add_argument('--requests', type=int, default=256, help='total number of tile requests')
+    parser.add_argument('--width', type=int, default=7200, help='width of the synthetic dataset')
+    args = parser.parse_args()
+
+    image._DEBUG_OP_IMAGE = False
+    MEM_TILE_CACHE.clear()
+
+    width = args.width
+    height = width // 2
+    application = tornado.web.Application([
+        ('/ping', PingHandler),
+        (url_pattern('/ws/res/tile/{{base_dir}}/{{res_name}}/{{z}}/{{y}}/{{x}}.png'), ResVarTileHandler),
+    ])
+    dataset = new_dataset(width, height, 720)
+    application.workspace_manager = FakeWorkspaceManager(FakeWorkspace(dict(ds=dataset)))
+
+    # Request distinct tiles from the highest level downwards, so that no request is a cache hit
+    tiling_scheme = get_tiling_scheme(dataset['sst'])
+    tile_urls = []
+    for z in reversed(range(tiling_scheme.num_levels)):
+        for y in range(tiling_scheme.num_tiles_y(z)):
+            for x in range(tiling_scheme.num_tiles_x(z)):
+                tile_urls.append('/ws/res/tile/ws/ds/%d/%d/%d.png?var=sst&min=270&max=310' % (z, y, x))
+    tile_urls = tile_urls[:args.requests]
+
+    sock, port = tornado.testing.bind_unused_port()
+    server = tornado.httpserver.HTTPServer(application)
+    server.add_sockets([sock])
+
+    t0 = time.perf_counter()
+    tile_latencies, ping_latencies = tornado.ioloop.IOLoop.current().run_sync(
+        lambda: run_load(port, tile_urls, args.concurrency))
+    total_time = time.perf_counter() - t0
+    server.stop()
+
+    print('%d tile requests, concurrency %d, %.2f s total' % (len(tile_latencies), args.concurrency, total_time))
+    print('tile latency: p50 = %8.1f ms, p99 = %8.1f ms' % (percentile(tile_latencies, 50),
+                                                             percentile(tile_latencies, 99)))
+    print('ping latency: p50 = %8.1f ms, p99 = %8.1f ms' % (percentile(ping_latencies, 50),
+                                                             percentile(ping_latencies, 99)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark for opening workspaces with persistent resources, see :py:meth:`cate.core.workspace.Workspace.open`.
+
+Creates a workspace with a number of persistent dataset resources (50 by default) and reports the latency of
+
+* "open": opening the workspace;
+* "open+exec": opening it and executing its workflow, as done by the workspace manager;
+* "open+exec+json": additionally serialising all resource descriptors, as requested by the GUI.
+
+The former eager opening of all resource files is emulated by accessing every resource right after opening.
+
+Usage::
+
+    $ python benchmarks/bench_workspace_open.py [--resources 50] [--size 1000] [--repeat 3]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import xarray as xr
+
+# Registers the operations
+import cate.ops
+from cate.core.workspace import Workspace, mk_op_kwargs
+
+
+def write_dataset(path: str, size: int, index: int):
+    res = 360. / size
+    lon = np.linspace(-180. + res / 2, 180. - res / 2, size)
+    lat = np.linspace(-90. + res / 2, 90. - res / 2, size // 2)
+    time_ = np.arange(4)
+    data = np.random.uniform(size=(4, size // 2, size)).astype(np.float32) + index
+    dataset = xr.Dataset({'v%d' % i: (('time', 'lat', 'lon'), data) for i in range(4)},
+                         coords=dict(time=time_, lat=lat, lon=lon))
+    dataset.to_netcdf(path)
+
+
+def create_workspace(base_dir: str, data_dir: str, num_resources: int, size: int):
+    workspace = Workspace.create(base_dir)
+    for i in range(num_resources):
+        path = os.path.join(data_dir, 'ds_%d.nc' % i)
+        write_dataset(path, size, i)
+        res_name = 'ds_%d' % i
+        workspace.set_resource('cate.ops.io.read_netcdf', mk_op_kwargs(file=path), res_name=res_name)
+        workspace.set_resource_persistence(res_name, True)
+    workspace.execute_workflow()
+    workspace.save()
+    workspace.close()
+
+
+def measure(base_dir: str, eager: bool, execute: bool, to_json: bool) -> float:
+    t0 = time.perf_counter()
+    workspace = Workspace.open(base_dir)
+    if eager:
+        for res_name in list(workspace.resource_cache.keys()):
+            # noinspection PyStatementEffect
+            workspace.resource_cache[res_name]
+    if execute:
+        workspace.execute_workflow()
+    if to_json:
+        workspace.to_json_dict()
+    duration = time.perf_counter() - t0
+    workspace.resource_cache.close()
+    return duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workspace open benchmark')
+    parser.add_argument('--resources', type=int, default=50, help='number of persistent resources')
+    parser.add_argument('--size', type=int, default=1000, help='number of grid cells in longitude direction')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the fastest one is reported')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        base_dir = os.path.join(temp_dir, 'workspace')
+        data_dir = os.path.join(temp_dir, 'data')
+        os.mkdir(data_dir)
+        create_workspace(base_dir, data_dir, args.resources, args.size)
+
+        print('%-16s %14s %14s' % ('scenario', 'eager [ms]', 'lazy [ms]'))
+        for name, execute, to_json in (('open', False, False),
+                                       ('open+exec', True, False),
+                                       ('open+exec+json', True, True)):
+            eager_duration = min(measure(base_dir, True, execute, to_json) for _ in range(args.repeat))
+            lazy_duration = min(measure(base_dir, False, execute, to_json) for _ in range(args.repeat))
+            print('%-16s %14.1f %14.1f' % (name, eager_duration * 1000, lazy_duration * 1000))
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
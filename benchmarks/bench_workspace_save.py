@@ -0,0 +1,94 @@
+"""
+Benchmark for saving workspaces with persistent resources, see :py:meth:`cate.core.workspace.Workspace.save`.
+
+Creates a workspace with a number of persistent dataset resources (50 by default), saves it once, and then reports
+the latency of saving it again
+
+* "unchanged": after no change at all;
+* "one changed": after one resource has been replaced;
+* "all changed": after all resources have been replaced, which is what every save did before.
+
+Usage::
+
+    $ python benchmarks/bench_workspace_save.py [--resources 50] [--size 500] [--repeat 3]
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import xarray as xr
+
+# Registers the operations
+import cate.ops
+from cate.core.workspace import Workspace, mk_op_kwargs
+
+
+def write_dataset(path: str, size: int, index: int):
+    res = 360. / size
+    lon = np.linspace(-180. + res / 2, 180. - res / 2, size)
+    lat = np.linspace(-90. + res / 2, 90. - res / 2, size // 2)
+    time_ = np.arange(4)
+    data = np.random.uniform(size=(4, size // 2, size)).astype(np.float32) + index
+    dataset = xr.Dataset({'v%d' % i: (('time', 'lat', 'lon'), data) for i in range(4)},
+                         coords=dict(time=time_, lat=lat, lon=lon))
+    dataset.to_netcdf(path)
+
+
+def create_workspace(base_dir: str, data_dir: str, num_resources: int, size: int) -> Workspace:
+    workspace = Workspace.create(base_dir)
+    for i in range(num_resources):
+        path = os.path.join(data_dir, 'ds_%d.nc' % i)
+        write_dataset(path, size, i)
+        res_name = 'ds_%d' % i
+        workspace.set_resource('cate.ops.io.read_netcdf', mk_op_kwargs(file=path), res_name=res_name)
+        workspace.set_resource_persistence(res_name, True)
+    workspace.execute_workflow()
+    workspace.save()
+    return workspace
+
+
+def touch_resources(workspace: Workspace, res_names):
+    # Replacing a value counts as an update of the resource
+    for res_name in res_names:
+        workspace.resource_cache[res_name] = workspace.resource_cache[res_name]
+
+
+def measure(workspace: Workspace, res_names) -> float:
+    touch_resources(workspace, res_names)
+    t0 = time.perf_counter()
+    workspace.save()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Workspace save benchmark')
+    parser.add_argument('--resources', type=int, default=50, help='number of persistent resources')
+    parser.add_argument('--size', type=int, default=500, help='number of grid cells in longitude direction')
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the fastest one is reported')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        base_dir = os.path.join(temp_dir, 'workspace')
+        data_dir = os.path.join(temp_dir, 'data')
+        os.mkdir(data_dir)
+        workspace = create_workspace(base_dir, data_dir, args.resources, args.size)
+        res_names = list(workspace.resource_cache.keys())
+
+        print('%-12s %14s' % ('scenario', 'save [ms]'))
+        for name, changed_res_names in (('unchanged', []),
+                                        ('one changed', res_names[:1]),
+                                        ('all changed', res_names)):
+            duration = min(measure(workspace, changed_res_names) for _ in range(args.repeat))
+            print('%-12s %14.1f' % (name, duration * 1000))
+        workspace.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -98,6 +98,7 @@ Components
 import warnings
 warnings.filterwarnings("ignore")  # never print any warnings to users
 import argparse
+import json
 import os
 import os.path
 import pprint
@@ -111,6 +112,7 @@ from cate.core.ds import DATA_STORE_REGISTRY, find_data_sources, format_cached_d
 from cate.core.objectio import OBJECT_IO_REGISTRY, find_writer, read_object
 from cate.core.op import OP_REGISTRY
 from cate.core.plugin import PLUGIN_REGISTRY
+from cate.core.profiler import format_profile, to_chrome_trace
 from cate.core.types import Like, TimeRangeLike, PolygonLike, VarNamesLike
 from cate.core.workflow import Workflow
 from cate.core.workspace import WorkspaceError, mk_op_kwargs, OpKwArgs, OpArgs
@@ -630,6 +632,11 @@ class WorkspaceCommand(SubCommandCommand):
         run_parser.add_argument('op_name', metavar='OP',
                                 help='Operation name or Workflow file path. '
                                      'Type "cate op list" to list available operations.')
+        run_parser.add_argument('--profile', dest='profile', action='store_true',
+                                help='Print the wall time, CPU time, number of dask tasks, bytes loaded '
+                                     'and peak memory growth of every workflow step.')
+        run_parser.add_argument('--trace', dest='trace_file', metavar='FILE',
+                                help='Write the profile to FILE in Chrome trace event format. Implies --profile.')
         run_parser.add_argument('op_args', metavar='...', nargs=argparse.REMAINDER,
                                 help=OP_ARGS_RES_HELP)
         run_parser.set_defaults(sub_command_function=cls._execute_run)
@@ -737,11 +744,22 @@ class WorkspaceCommand(SubCommandCommand):
         op_args, op_kwargs = _parse_op_args(command_args.op_args, input_props=op.op_meta_info.inputs)
         if op_args:
             raise CommandError("positional arguments not yet supported, please provide keyword=value pairs only")
-        workspace_manager.run_op_in_workspace(_base_dir(command_args.base_dir),
+        base_dir = _base_dir(command_args.base_dir)
+        profile = command_args.profile or bool(command_args.trace_file)
+        workspace_manager.run_op_in_workspace(base_dir,
                                               command_args.op_name,
                                               op_kwargs,
-                                              monitor=cls.new_monitor())
+                                              monitor=cls.new_monitor(),
+                                              profile=profile)
         print("Operation '%s' executed." % command_args.op_name)
+        if profile:
+            profile_json_dict = workspace_manager.get_workspace_profile(base_dir)
+            if profile_json_dict:
+                print(format_profile(profile_json_dict))
+                if command_args.trace_file:
+                    with open(command_args.trace_file, 'w') as fp:
+                        json.dump(to_chrome_trace(profile_json_dict), fp)
+                    print('Trace written to "%s".' % command_args.trace_file)
 
     @classmethod
     def _execute_status(cls, command_args):
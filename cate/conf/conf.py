@@ -26,7 +26,7 @@ from typing import Any, Dict, Optional
 
 from .defaults import GLOBAL_CONF_FILE, LOCAL_CONF_FILE, LOCATION_FILE, VERSION_CONF_FILE, \
     VARIABLE_DISPLAY_SETTINGS, DEFAULT_DATA_PATH, DEFAULT_COLOR_MAP, DEFAULT_RES_PATTERN, \
-    WEBAPI_USE_WORKSPACE_IMAGERY_CACHE
+    WEBAPI_USE_WORKSPACE_IMAGERY_CACHE, WORKFLOW_MAX_WORKERS, USE_STEP_RESULT_CACHE, WORKSPACE_COORD_DATA_MAX_SIZE
 
 _CONFIG = None
 
@@ -72,6 +72,36 @@ def get_use_workspace_imagery_cache() -> bool:
     return get_config_value('use_workspace_imagery_cache', WEBAPI_USE_WORKSPACE_IMAGERY_CACHE)
 
 
+def get_workflow_max_workers() -> int:
+    """
+    Get the maximum number of workflow steps executed concurrently.
+
+    :return: Effectively reads the value of the configuration parameter ``workflow_max_workers``, if any.
+             Otherwise return the default value ``1``, which means steps are executed one after the other.
+    """
+    return get_config_value('workflow_max_workers', WORKFLOW_MAX_WORKERS)
+
+
+def get_use_step_result_cache() -> bool:
+    """
+    Get whether results of workflow steps shall be kept in a persistent file cache.
+
+    :return: Effectively reads the value of the configuration parameter ``use_step_result_cache``, if any.
+             Otherwise return the default value ``False``.
+    """
+    return get_config_value('use_step_result_cache', USE_STEP_RESULT_CACHE)
+
+
+def get_coord_data_max_size() -> int:
+    """
+    Get the maximum number of values of 1D coordinate variables included in workspace resource descriptors.
+
+    :return: Effectively reads the value of the configuration parameter ``coord_data_max_size``, if any.
+             Otherwise return the default value ``2048``.
+    """
+    return get_config_value('coord_data_max_size', WORKSPACE_COORD_DATA_MAX_SIZE)
+
+
 def get_default_res_pattern() -> str:
     """
     Get the default prefix for names generated for new workspace resources originating from opening data sources
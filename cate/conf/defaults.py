@@ -45,18 +45,100 @@ DEFAULT_RES_PATTERN = 'res_{index}'
 
 NETCDF_COMPRESSION_LEVEL = 9
 
+#: The maximum number of workflow steps executed concurrently, 1 means steps are executed one after the other
+WORKFLOW_MAX_WORKERS = 1
+
 _ONE_MIB = 1024 * 1024
 _ONE_GIB = 1024 * _ONE_MIB
 
-#: Use a per-workspace file imagery cache, see REST "/res/tile/" API
+#: The maximum number of child processes run at the same time by sub-process operations, None means number of CPUs
+SUBPROCESS_MAX_PROCESSES = None
+
+#: The default limit of the CPU time of child processes in seconds, None means unlimited
+SUBPROCESS_CPU_TIME_LIMIT = None
+
+#: The default limit of the memory of child processes in bytes, None means unlimited
+SUBPROCESS_MEMORY_LIMIT = None
+
+#: The maximum number of values of 1D coordinate variables included in workspace resource descriptors.
+#: Values of larger coordinate variables are fetched from the WebAPI's "/ws/res/coords" REST endpoint.
+WORKSPACE_COORD_DATA_MAX_SIZE = 2048
+
+#: Use a persistent file cache for the results of workflow steps, shared by all workspaces and sessions
+USE_STEP_RESULT_CACHE = False
+
+#: The directory of the workflow step result cache
+STEP_RESULT_CACHE_DIR = os.path.join(DEFAULT_VERSION_DATA_PATH, 'step_cache')
+
+#: The number of bytes in the workflow step result cache
+STEP_RESULT_CACHE_CAPACITY = 16 * _ONE_GIB
+
+#: Use a file imagery cache, see REST "/res/tile/" API
 WEBAPI_USE_WORKSPACE_IMAGERY_CACHE = False
 
-# The number of bytes in a workspace's image file cache
-WEBAPI_WORKSPACE_FILE_TILE_CACHE_CAPACITY = 1 * _ONE_GIB
+#: The directory of the image file cache shared by all workspaces
+WEBAPI_FILE_TILE_CACHE_DIR = os.path.join(DEFAULT_VERSION_DATA_PATH, 'tile_cache')
+
+# The number of bytes in the image file cache shared by all workspaces
+WEBAPI_FILE_TILE_CACHE_CAPACITY = 1 * _ONE_GIB
 
 # The number of bytes in a workspace's image in-memory cache
 WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY = 256 * _ONE_MIB
 
+# The number of independently locked stripes of a workspace's image in-memory cache
+WEBAPI_WORKSPACE_MEM_TILE_CACHE_NUM_STRIPES = 16
+
+#: The maximum number of image tiles computed in parallel by the WebAPI service
+WEBAPI_TILE_COMPUTE_MAX_WORKERS = 4
+
+#: The maximum number of image tile requests being computed or waiting to be computed by the WebAPI service.
+#: Further tile requests are rejected with HTTP status 503.
+WEBAPI_TILE_COMPUTE_MAX_QUEUE_SIZE = 256
+
+#: The default format of image tiles, one of "png", "png8" (palette PNG), "webp", "jpeg"
+WEBAPI_TILE_FORMAT = 'png'
+
+#: The default zlib compression level (0-9) of PNG image tiles
+WEBAPI_TILE_COMPRESS_LEVEL = 6
+
+#: The default quality (0-100) of WebP and JPEG image tiles
+WEBAPI_TILE_QUALITY = 80
+
+#: The zlib compression level (0-9) of WebSocket messages sent to clients supporting the "permessage-deflate"
+#: extension, None disables compression
+WEBAPI_WEBSOCKET_COMPRESSION_LEVEL = 6
+
+#: The number of threads of the WebAPI service running quick JSON-RPC calls, e.g. calls returning metadata
+WEBAPI_RPC_FAST_MAX_WORKERS = 4
+
+#: The number of threads of the WebAPI service running long-running JSON-RPC calls, e.g. calls opening datasets
+WEBAPI_RPC_SLOW_MAX_WORKERS = 2
+
+#: The maximum number of JSON-RPC calls of a single WebSocket connection running in parallel in the same lane,
+#: None means no limit
+WEBAPI_RPC_MAX_CALLS_PER_CONNECTION = 4
+
+#: Maps JSON-RPC method names to the maximum number of calls of the method running in parallel
+WEBAPI_RPC_METHOD_LIMITS = {}
+
+#: Names of the JSON-RPC methods run by the slow threads in addition to methods that report progress.
+#: These methods don't report progress but may compute or read data, render images or write files.
+WEBAPI_RPC_SLOW_METHODS = [
+    'get_color_maps',
+    'get_data_stores',
+    'get_workspace_variable_statistics',
+    'print_workspace_resource',
+    'write_workspace_resource',
+    'save_workspace',
+    'save_workspace_as',
+    'save_all_workspaces',
+    'clean_workspace',
+    'delete_workspace',
+]
+
+#: The maximum number of image pyramids kept by the WebAPI service. Least recently used pyramids are disposed first.
+WEBAPI_MAX_NUM_IMAGE_PYRAMIDS = 64
+
 #: where the information about a running WebAPI service is stored
 WEBAPI_INFO_FILE = os.path.join(DEFAULT_VERSION_DATA_PATH, 'webapi.json')
 
@@ -13,11 +13,93 @@
 # data_stores_path = '~/.cate/data_stores'
 
 
-# If 'use_workspace_imagery_cache' is True, Cate will maintain a per-workspace
+# If 'use_workspace_imagery_cache' is True, Cate will maintain a file
 # cache for imagery generated from dataset variables. Such cache can accelerate
 # image display, however at the cost of disk space.
+# The cache is shared by all workspaces and lives in 'file_tile_cache_dir'.
+# Least recently used images are removed if it exceeds 'file_tile_cache_capacity' bytes.
 #
 # use_workspace_imagery_cache = False
+# file_tile_cache_dir = '~/.cate/<version>/tile_cache'
+# file_tile_cache_capacity = 1024 * 1024 * 1024
+
+# The WebAPI service computes image tiles in a pool of 'tile_compute_max_workers' threads.
+# At most 'tile_compute_max_queue_size' tile requests may be computed or wait to be computed at any time,
+# further requests are rejected until some complete.
+#
+# tile_compute_max_workers = 4
+# tile_compute_max_queue_size = 256
+
+# Image tiles are encoded in 'tile_format' which is one of 'png' (lossless RGBA PNG), 'png8' (palette PNG with 255
+# colors), 'webp', or 'jpeg' (no transparency). PNG tiles are compressed using the zlib level 'tile_compress_level'
+# (0-9), WebP and JPEG tiles using 'tile_quality' (0-100). Clients may override these settings using the
+# 'format', 'compress_level', and 'quality' query parameters of tile requests.
+# Setting 'tile_format' to 'png8' encodes tiles 5 to 14 times faster and yields 30 to 40 percent smaller tiles,
+# however colors are quantized to the 255 colors of the color map, so color bars and smooth gradients may differ
+# slightly from RGBA PNG tiles.
+#
+# tile_format = 'png'
+# tile_compress_level = 6
+# tile_quality = 80
+
+# The WebAPI service keeps the image pyramids of at most 'max_num_image_pyramids' resource variables
+# and color mappings. Disposing the least recently used pyramids releases their image tiles from memory.
+#
+# max_num_image_pyramids = 64
+
+# WebSocket messages of the WebAPI service are compressed using the zlib level 'websocket_compression_level' (0-9),
+# if the client supports the "permessage-deflate" extension. Setting it to None disables compression.
+#
+# websocket_compression_level = 6
+
+# JSON-RPC calls of the WebAPI service run in two lanes: quick calls, e.g. calls returning metadata, are run by up to
+# 'rpc_fast_max_workers' threads, long-running calls by up to 'rpc_slow_max_workers' threads. Calls of methods that
+# report progress and of the methods listed in 'rpc_slow_methods' are long-running. By default, the latter are the
+# methods that compute or read data, render images or write files, e.g. 'get_workspace_variable_statistics',
+# 'get_color_maps' and 'save_workspace'. At most 'rpc_max_calls_per_connection' calls of a single WebSocket
+# connection run in parallel in the same lane, None means no limit. 'rpc_method_limits' maps method names to the
+# number of calls of the method that may run in parallel. The current state of the lanes is served by the
+# "/api/metrics" endpoint.
+#
+# rpc_fast_max_workers = 4
+# rpc_slow_max_workers = 2
+# rpc_max_calls_per_connection = 4
+# rpc_method_limits = {'open_workspace': 2, 'set_workspace_resource': 2}
+# rpc_slow_methods = ['get_color_maps', 'get_data_stores', 'get_workspace_variable_statistics',
+#                     'print_workspace_resource', 'write_workspace_resource', 'save_workspace', 'save_workspace_as',
+#                     'save_all_workspaces', 'clean_workspace', 'delete_workspace']
+
+# Independent workspace workflow steps are executed concurrently by up to 'workflow_max_workers' threads.
+# Setting it to 1 executes steps one after the other.
+#
+# workflow_max_workers = 1
+
+# Workspace resource descriptors include the values of 1D coordinate variables, e.g. to label axes, if they have
+# at most 'coord_data_max_size' values. The descriptors of larger coordinate variables have their 'isDataOmitted'
+# property set, clients fetch their values page-wise from the "/ws/res/coords" endpoint of the WebAPI service.
+#
+# coord_data_max_size = 2048
+
+# Operations and workflow steps that run external programs share a pool of at most 'subprocess_max_processes'
+# child processes, by default the number of CPUs. Other callers wait until a process of the pool has finished.
+# Every child process is limited to 'subprocess_cpu_time_limit' seconds of CPU time and 'subprocess_memory_limit'
+# bytes of memory, unless a step gives its own limits. By default, processes are not limited.
+#
+# subprocess_max_processes = 4
+# subprocess_cpu_time_limit = 3600
+# subprocess_memory_limit = 4 * 1024 * 1024 * 1024
+
+# If 'use_step_result_cache' is True, results of workspace workflow steps are kept in a persistent file cache,
+# so that reopened workspaces don't need to recompute them. Datasets are stored as compressed NetCDF files,
+# other results are pickled. The cache is shared by all workspaces and lives in 'step_result_cache_dir'.
+# Pickled results are only written and read if that directory is private to the user, because reading them
+# may execute arbitrary code. Results of steps reading files are recomputed once the files change, results of
+# steps opening datasets from data stores are never cached.
+# Least recently used results are removed if it exceeds 'step_result_cache_capacity' bytes.
+#
+# use_step_result_cache = False
+# step_result_cache_dir = '~/.cate/<version>/step_cache'
+# step_result_cache_capacity = 16 * 1024 * 1024 * 1024
 
 # Default prefix for names generated for new workspace resources originating from opening data sources
 # or executing workflow steps.
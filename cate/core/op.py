@@ -105,13 +105,16 @@ Components
 """
 
 import sys
+import threading
 from collections import OrderedDict
 from typing import Union, Callable, Optional, Dict
 
 import xarray as xr
 
+from ..conf import get_config_value
+from ..conf.defaults import SUBPROCESS_MAX_PROCESSES, SUBPROCESS_CPU_TIME_LIMIT, SUBPROCESS_MEMORY_LIMIT
 from ..util import OpMetaInfo, object_to_qualified_name, Monitor, UNDEFINED, safe_eval
-from ..util.process import run_subprocess, ProcessOutputMonitor
+from ..util.process import ProcessPool, ProcessOutputMonitor
 from ..util.tmpfile import new_temp_file, del_temp_file
 from ..version import __version__
 
@@ -671,9 +674,13 @@ def new_subprocess_op(op_meta_info: OpMetaInfo,
                       shell: bool = False,
                       started: Union[str, Callable] = None,
                       progress: Union[str, Callable] = None,
-                      done: Union[str, Callable] = None) -> Operation:
+                      done: Union[str, Callable] = None,
+                      cpu_time_limit: Optional[float] = None,
+                      memory_limit: Optional[int] = None) -> Operation:
     """
     Create an operation for a child program run in a new process.
+    The process is run by the pool returned by :py:func:`get_process_pool`, so that operations invoked
+    concurrently, e.g. by independent workflow steps, run their processes in parallel up to the pool's limit.
 
     :param op_meta_info: Meta-information about the resulting operation and the operation's inputs and outputs.
     :param command_pattern: A pattern that will be interpolated to obtain the actual command to be executed.
@@ -698,6 +705,10 @@ def new_subprocess_op(op_meta_info: OpMetaInfo,
     :param done: Either a callable that receives a text line a text line from the executable's stdout
            and returns True or False or a regex that must match
            in order to signal the end of progress monitoring.
+    :param cpu_time_limit: Optional limit of the CPU time of the process in seconds,
+           defaults to the configuration parameter ``subprocess_cpu_time_limit``.
+    :param memory_limit: Optional limit of the memory of the process in bytes,
+           defaults to the configuration parameter ``subprocess_memory_limit``.
     :return: The executable wrapped into an operation.
     """
 
@@ -757,10 +768,12 @@ def new_subprocess_op(op_meta_info: OpMetaInfo,
         if run_python:
             command = '"{}" {}'.format(sys.executable, command)
 
-        exit_code = run_subprocess(command,
-                                   cwd=cwd, env=env, shell=shell,
-                                   stdout_handler=stdout_handler,
-                                   is_cancelled=monitor.is_cancelled if monitor else None)
+        exit_code = get_process_pool().run(command,
+                                           cwd=cwd, env=env, shell=shell,
+                                           stdout_handler=stdout_handler,
+                                           is_cancelled=monitor.is_cancelled if monitor else None,
+                                           cpu_time_limit=cpu_time_limit,
+                                           memory_limit=memory_limit)
 
         for file in temp_input_files.values():
             del_temp_file(file)
@@ -790,6 +803,26 @@ def new_subprocess_op(op_meta_info: OpMetaInfo,
     return Operation(run_executable, op_meta_info=op_meta_info)
 
 
+_PROCESS_POOL = None
+_PROCESS_POOL_LOCK = threading.Lock()
+
+
+def get_process_pool() -> ProcessPool:
+    """
+    Get the pool of child processes shared by all operations created by :py:func:`new_subprocess_op`.
+    It is created on first use from the configuration parameters ``subprocess_max_processes``,
+    ``subprocess_cpu_time_limit`` and ``subprocess_memory_limit``.
+    """
+    global _PROCESS_POOL
+    with _PROCESS_POOL_LOCK:
+        if _PROCESS_POOL is None:
+            _PROCESS_POOL = ProcessPool(
+                max_processes=get_config_value('subprocess_max_processes', SUBPROCESS_MAX_PROCESSES),
+                cpu_time_limit=get_config_value('subprocess_cpu_time_limit', SUBPROCESS_CPU_TIME_LIMIT),
+                memory_limit=get_config_value('subprocess_memory_limit', SUBPROCESS_MEMORY_LIMIT))
+        return _PROCESS_POOL
+
+
 def new_expression_op(op_meta_info: OpMetaInfo, expression: str) -> Operation:
     """
     Create an operation that wraps a Python expression.
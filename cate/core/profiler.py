@@ -0,0 +1,297 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Description
+===========
+
+Profiling of workflow runs.
+
+A :py:class:`WorkflowProfile` passed as "workflow_profile" entry of the execution context records for every
+step invoked by :py:meth:`cate.core.workflow.Workflow.invoke_steps` its wall time, the CPU time of the invoking
+thread, the number of dask tasks computed, the number of bytes of the arrays computed by these tasks
+and by how much the peak resident set size (RSS) of the process grew. On platforms that do not report the
+CPU time per thread, the CPU time of the process is recorded instead.
+
+Dask tasks are only counted for the local schedulers, which run task callbacks in the thread that
+computes the graph. Dask passes its global callbacks only to the outermost of the computations running at the
+same time, so if steps are executed concurrently, the tasks of a computation started while another one is
+running are not counted. Likewise, the growth of the process' peak RSS is attributed to every step running
+at that time.
+
+A profile may be exported in the Chrome trace event format, see :py:func:`to_chrome_trace`, and
+viewed using the "chrome://tracing" page of the Chrome browser.
+
+Components
+==========
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List
+
+import numpy as np
+import psutil
+from dask.callbacks import Callback
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+
+class StepProfile:
+    """
+    The measurements taken while invoking a single workflow step.
+    """
+
+    def __init__(self, step_id: str, start_time: float, thread_id: int, depth: int = 0):
+        #: The step's ID.
+        self.step_id = step_id
+        #: The nesting depth, greater than zero for steps of workflows invoked by other steps.
+        self.depth = depth
+        #: Start time in seconds relative to the start of the profile.
+        self.start_time = start_time
+        #: The ID of the thread that invoked the step.
+        self.thread_id = thread_id
+        #: Wall time in seconds.
+        self.wall_time = 0.
+        #: CPU time of the invoking thread in seconds.
+        self.cpu_time = 0.
+        #: Number of dask tasks computed.
+        self.num_dask_tasks = 0
+        #: Number of bytes of the arrays computed by dask tasks.
+        self.bytes_loaded = 0
+        #: Growth of the process' peak resident set size in bytes.
+        self.peak_rss_delta = 0
+        #: Whether the step failed.
+        self.failed = False
+
+    def to_json_dict(self):
+        """
+        Return a JSON-serializable dictionary representation of this object.
+
+        :return: A JSON-serializable dictionary
+        """
+        return OrderedDict([('step_id', self.step_id),
+                            ('start_time', self.start_time),
+                            ('thread_id', self.thread_id),
+                            ('depth', self.depth),
+                            ('wall_time', self.wall_time),
+                            ('cpu_time', self.cpu_time),
+                            ('num_dask_tasks', self.num_dask_tasks),
+                            ('bytes_loaded', self.bytes_loaded),
+                            ('peak_rss_delta', self.peak_rss_delta),
+                            ('failed', self.failed)])
+
+
+class WorkflowProfile:
+    """
+    Records a :py:class:`StepProfile` for every step measured during a workflow run.
+    A ``WorkflowProfile`` is passed as "workflow_profile" entry of the execution context.
+    """
+
+    def __init__(self):
+        self._start_counter = time.perf_counter()
+        self._step_profiles = []
+        self._lock = threading.Lock()
+        self._thread_local = threading.local()
+
+    @property
+    def step_profiles(self) -> List[StepProfile]:
+        """The step profiles in the order the steps have been started."""
+        with self._lock:
+            return list(self._step_profiles)
+
+    @property
+    def wall_time(self) -> float:
+        """Wall time in seconds from the start of the first step to the end of the last step."""
+        step_profiles = [p for p in self.step_profiles if p.depth == 0]
+        if not step_profiles:
+            return 0.
+        return max(p.start_time + p.wall_time for p in step_profiles) - min(p.start_time for p in step_profiles)
+
+    @contextmanager
+    def measuring(self, step_id: str):
+        """
+        Return a context manager that measures the invocation of the step with given *step_id*
+        in the current thread.
+
+        :param step_id: The step's ID.
+        """
+        outer_step_profile = getattr(self._thread_local, 'step_profile', None)
+        step_profile = StepProfile(step_id,
+                                   time.perf_counter() - self._start_counter,
+                                   threading.get_ident(),
+                                   depth=outer_step_profile.depth + 1 if outer_step_profile is not None else 0)
+        with self._lock:
+            self._step_profiles.append(step_profile)
+        # Registering again puts the counter into the set of global callbacks, in case dask replaced the set
+        # while computing in another thread
+        _DASK_TASK_COUNTER.register()
+        outer_counted_step_profile = getattr(_DASK_TASK_COUNTER.thread_local, 'step_profile', None)
+        _DASK_TASK_COUNTER.thread_local.step_profile = step_profile
+        self._thread_local.step_profile = step_profile
+        start_peak_rss = _get_peak_rss()
+        start_cpu_time = _get_thread_cpu_time()
+        start_counter = time.perf_counter()
+        try:
+            yield step_profile
+        except BaseException:
+            step_profile.failed = True
+            raise
+        finally:
+            step_profile.wall_time = time.perf_counter() - start_counter
+            step_profile.cpu_time = _get_thread_cpu_time() - start_cpu_time
+            step_profile.peak_rss_delta = _get_peak_rss() - start_peak_rss
+            self._thread_local.step_profile = outer_step_profile
+            _DASK_TASK_COUNTER.thread_local.step_profile = outer_counted_step_profile
+
+    def to_chrome_trace(self) -> Dict:
+        """
+        Return this profile in the Chrome trace event format.
+
+        :return: A JSON-serializable dictionary
+        """
+        return to_chrome_trace(self.to_json_dict())
+
+    def to_json_dict(self):
+        """
+        Return a JSON-serializable dictionary representation of this object.
+
+        :return: A JSON-serializable dictionary
+        """
+        step_profiles = self.step_profiles
+        # Nested steps are already included in the measurements of their outer steps
+        outer_step_profiles = [p for p in step_profiles if p.depth == 0]
+        return OrderedDict([('wall_time', self.wall_time),
+                            ('cpu_time', sum(p.cpu_time for p in outer_step_profiles)),
+                            ('num_dask_tasks', sum(p.num_dask_tasks for p in outer_step_profiles)),
+                            ('bytes_loaded', sum(p.bytes_loaded for p in outer_step_profiles)),
+                            ('steps', [p.to_json_dict() for p in step_profiles])])
+
+    def __str__(self):
+        return format_profile(self.to_json_dict())
+
+
+def to_chrome_trace(profile_json_dict: Dict) -> Dict:
+    """
+    Convert the JSON representation of a :py:class:`WorkflowProfile` into the Chrome trace event format.
+    Every step becomes a "complete" event on the track of the thread that invoked it.
+
+    :param profile_json_dict: The JSON representation of a workflow profile.
+    :return: A JSON-serializable dictionary
+    """
+    trace_events = []
+    for step in profile_json_dict.get('steps', []):
+        args = OrderedDict((name, step[name]) for name in ('cpu_time', 'num_dask_tasks', 'bytes_loaded',
+                                                           'peak_rss_delta', 'failed'))
+        trace_events.append(OrderedDict([('name', step['step_id']),
+                                         ('cat', 'step'),
+                                         ('ph', 'X'),
+                                         ('ts', round(step['start_time'] * 1e6)),
+                                         ('dur', round(step['wall_time'] * 1e6)),
+                                         ('pid', 1),
+                                         ('tid', step['thread_id']),
+                                         ('args', args)]))
+    return OrderedDict([('traceEvents', trace_events), ('displayTimeUnit', 'ms')])
+
+
+def format_profile(profile_json_dict: Dict) -> str:
+    """
+    Format the JSON representation of a :py:class:`WorkflowProfile` as a human-readable table.
+
+    :param profile_json_dict: The JSON representation of a workflow profile.
+    :return: The table text.
+    """
+    header = ('Step', 'Wall [s]', 'CPU [s]', 'Tasks', 'Loaded [MB]', 'Peak RSS +[MB]')
+    rows = []
+    for step in profile_json_dict.get('steps', []):
+        rows.append(('  ' * step.get('depth', 0) + step['step_id'] + (' (failed)' if step['failed'] else ''),
+                     '%.3f' % step['wall_time'],
+                     '%.3f' % step['cpu_time'],
+                     '%d' % step['num_dask_tasks'],
+                     '%.1f' % (step['bytes_loaded'] / (1024 * 1024)),
+                     '%.1f' % (step['peak_rss_delta'] / (1024 * 1024))))
+    rows.append(('Total',
+                 '%.3f' % profile_json_dict.get('wall_time', 0.),
+                 '%.3f' % profile_json_dict.get('cpu_time', 0.),
+                 '%d' % profile_json_dict.get('num_dask_tasks', 0),
+                 '%.1f' % (profile_json_dict.get('bytes_loaded', 0) / (1024 * 1024)),
+                 ''))
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = []
+    for row in [header] + rows:
+        lines.append('  '.join([row[0].ljust(widths[0])] +
+                               [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]).rstrip())
+    return '\n'.join(lines)
+
+
+class _DaskTaskCounter(Callback):
+    """
+    Counts the tasks computed by dask's local schedulers and the bytes of the arrays they computed.
+    The counts are added to the step profile of the thread that computes the graph.
+
+    A single instance stays registered once it has been used. It is never unregistered, because dask replaces
+    its set of global callbacks while computing, so that unregistering from another thread may fail.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.thread_local = threading.local()
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        step_profile = getattr(self.thread_local, 'step_profile', None)
+        if step_profile is not None:
+            step_profile.num_dask_tasks += 1
+            if isinstance(result, np.ndarray):
+                step_profile.bytes_loaded += result.nbytes
+
+
+_DASK_TASK_COUNTER = _DaskTaskCounter()
+
+
+def _get_thread_cpu_time() -> float:
+    """
+    Get the CPU time of the current thread in seconds.
+    Where per-thread usage is not available (e.g. on Windows and macOS), the CPU time of the process is used.
+    """
+    # time.thread_time() would do, but requires Python 3.7
+    if resource is not None and hasattr(resource, 'RUSAGE_THREAD'):
+        usage = resource.getrusage(resource.RUSAGE_THREAD)
+        return usage.ru_utime + usage.ru_stime
+    return time.process_time()
+
+
+def _get_peak_rss() -> int:
+    """Get the peak resident set size of this process in bytes."""
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+    memory_info = psutil.Process().memory_info()
+    return getattr(memory_info, 'peak_wset', memory_info.rss)
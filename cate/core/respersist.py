@@ -0,0 +1,319 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Description
+===========
+
+Formats used to persist the resources of workspaces, operating on a global registry
+``RESOURCE_FORMAT_REGISTRY`` singleton.
+
+A resource is written to the file ``<res_name><filename_ext>`` in the workspace directory by the
+:py:class:`ResourceFormat` with the highest write fitness for its value. Plugins may register further formats.
+
+The default format writes ``xarray`` datasets and data arrays as NetCDF4 files whose data variables are
+compressed and chunked. Chunks match the dask chunks of a variable, if any, or otherwise cover spatial tiles,
+so that image tiles of reopened resources only read the chunks they display. Resources are reopened lazily
+with dask chunks matching the chunks of the file. ``pandas`` data frames and ``geopandas`` geo data frames are
+written column by column, every column is a compressed NetCDF variable and geometries are stored as WKT.
+
+Components
+==========
+"""
+
+import json
+import os.path
+from abc import ABCMeta, abstractmethod
+from typing import Any, List, Optional, Tuple
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely.wkt
+import xarray as xr
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+#: The name of the global NetCDF attribute that records the type of resources other than datasets
+_RESOURCE_TYPE_ATTR_NAME = 'cate_resource_type'
+_NETCDF_COMPRESSION_LEVEL = 4
+#: Size of the chunks of the two innermost dimensions of data variables which have no chunks yet
+_NETCDF_TILE_SIZE = 512
+#: Encoding keys of data variables that are kept when a dataset is written
+_NETCDF_VALUE_ENCODING_KEYS = ('dtype', '_FillValue', 'scale_factor', 'add_offset', 'units', 'calendar')
+
+
+class ResourceFormat(metaclass=ABCMeta):
+    """
+    Interface that formats in the ``RESOURCE_FORMAT_REGISTRY`` must adhere to.
+    """
+
+    @property
+    @abstractmethod
+    def format_name(self) -> str:
+        """The name of the format."""
+
+    @property
+    @abstractmethod
+    def filename_ext(self) -> str:
+        """The filename extension of resource files including the leading dot, e.g. ``'.nc'``."""
+
+    @abstractmethod
+    def write_fitness(self, value) -> int:
+        """
+        Get the fitness of this format for writing *value*.
+
+        :param value: A resource value.
+        :return: A non-negative number, the higher the better, or ``-1``, if *value* cannot be written.
+        """
+
+    @abstractmethod
+    def write(self, value, file: str) -> None:
+        """
+        Write *value* to *file*.
+
+        :param value: A resource value.
+        :param file: The file path.
+        """
+
+    @abstractmethod
+    def read(self, file: str) -> Any:
+        """
+        Read a resource value from *file*. Large values should be read lazily.
+
+        :param file: The file path.
+        :return: The resource value.
+        """
+
+
+class ResourceFormatRegistry:
+    """
+    Registry of :py:class:`ResourceFormat` instances.
+    """
+
+    def __init__(self):
+        self._formats = []
+
+    @property
+    def formats(self) -> List[ResourceFormat]:
+        return list(self._formats)
+
+    def add_format(self, resource_format: ResourceFormat) -> None:
+        self._formats.append(resource_format)
+
+    def remove_format(self, resource_format: ResourceFormat) -> None:
+        self._formats.remove(resource_format)
+
+    def find_writer(self, value) -> Optional[ResourceFormat]:
+        """
+        Find the most suitable format for writing *value*.
+
+        :param value: A resource value.
+        :return: A :py:class:`ResourceFormat` or ``None``, if *value* cannot be written.
+        """
+        best_format = None
+        max_fitness = -1
+        for resource_format in self._formats:
+            fitness = resource_format.write_fitness(value)
+            if fitness > max_fitness:
+                best_format = resource_format
+                max_fitness = fitness
+        return best_format
+
+    def find_resource_files(self, dir_path: str, res_name: str) -> List[Tuple[ResourceFormat, str]]:
+        """
+        Find the existing files of the resource named *res_name* in *dir_path*.
+
+        :param dir_path: The directory path.
+        :param res_name: The resource name.
+        :return: A list of pairs (*format*, *file*).
+        """
+        resource_files = []
+        for resource_format in self._formats:
+            file = os.path.join(dir_path, res_name + resource_format.filename_ext)
+            if os.path.isfile(file):
+                resource_files.append((resource_format, file))
+        return resource_files
+
+    def get_res_name(self, filename: str) -> Optional[str]:
+        """
+        Get the name of the resource stored in the file named *filename*.
+
+        :param filename: A file name without directory.
+        :return: The resource name or ``None``, if *filename* is not the name of a resource file.
+        """
+        for resource_format in self._formats:
+            filename_ext = resource_format.filename_ext
+            if filename.endswith(filename_ext):
+                res_name = filename[0: -len(filename_ext)]
+                # Resource names are identifiers
+                if res_name and '.' not in res_name:
+                    return res_name
+        return None
+
+
+class NetCDFResourceFormat(ResourceFormat):
+    """
+    Writes datasets, data arrays, data frames and geo data frames as compressed and chunked NetCDF4 files.
+    """
+
+    @property
+    def format_name(self) -> str:
+        return 'NETCDF4'
+
+    @property
+    def filename_ext(self) -> str:
+        return '.nc'
+
+    def write_fitness(self, value) -> int:
+        if isinstance(value, (xr.Dataset, xr.DataArray)):
+            return 1
+        if isinstance(value, pd.DataFrame) and not isinstance(value.index, pd.MultiIndex) \
+                and all(isinstance(column, str) for column in value.columns) \
+                and _is_netcdf_encodable(value.index) \
+                and all(_is_netcdf_encodable(value[column]) for column in value.columns
+                        if not _is_geometry_column(value, column)):
+            return 1
+        return -1
+
+    def write(self, value, file: str) -> None:
+        if isinstance(value, xr.DataArray):
+            dataset = value.to_dataset(name=value.name or 'data')
+            dataset.attrs[_RESOURCE_TYPE_ATTR_NAME] = 'DataArray'
+        elif isinstance(value, pd.DataFrame):
+            dataset = _data_frame_to_dataset(value)
+        else:
+            dataset = value
+        dataset.to_netcdf(file, encoding=_new_netcdf_encoding(dataset))
+
+    def read(self, file: str) -> Any:
+        dataset = xr.open_dataset(file)
+        resource_type = dataset.attrs.get(_RESOURCE_TYPE_ATTR_NAME)
+        if resource_type in ('DataFrame', 'GeoDataFrame'):
+            try:
+                return _dataset_to_data_frame(dataset.load())
+            finally:
+                dataset.close()
+        chunks = _get_file_chunks(dataset)
+        if chunks:
+            dataset = dataset.chunk(chunks)
+        if resource_type == 'DataArray':
+            del dataset.attrs[_RESOURCE_TYPE_ATTR_NAME]
+            data_array = next(iter(dataset.data_vars.values()))
+            return data_array.rename(None) if data_array.name == 'data' else data_array
+        return dataset
+
+
+def _new_netcdf_encoding(dataset: xr.Dataset) -> dict:
+    encoding = dict()
+    for var_name, variable in dataset.data_vars.items():
+        var_encoding = {key: value for key, value in variable.encoding.items()
+                        if key in _NETCDF_VALUE_ENCODING_KEYS}
+        if variable.dtype.kind in 'biufcmM':
+            var_encoding.update(zlib=True, complevel=_NETCDF_COMPRESSION_LEVEL)
+            chunk_sizes = _get_chunk_sizes(variable)
+            if chunk_sizes:
+                var_encoding.update(chunksizes=chunk_sizes)
+        encoding[var_name] = var_encoding
+    return encoding
+
+
+def _get_chunk_sizes(variable: xr.DataArray) -> Optional[Tuple[int, ...]]:
+    shape = variable.shape
+    if len(shape) < 2 or 0 in shape:
+        return None
+    if variable.chunks:
+        # NetCDF chunks are uniform, the first dask chunk of a dimension is its largest
+        return tuple(dim_chunks[0] for dim_chunks in variable.chunks)
+    chunk_sizes = variable.encoding.get('chunksizes')
+    if chunk_sizes and len(chunk_sizes) == len(shape) \
+            and all(0 < chunk_size <= size for chunk_size, size in zip(chunk_sizes, shape)):
+        return tuple(chunk_sizes)
+    return (1,) * (len(shape) - 2) + tuple(min(size, _NETCDF_TILE_SIZE) for size in shape[-2:])
+
+
+def _get_file_chunks(dataset: xr.Dataset) -> dict:
+    chunks = dict()
+    for variable in dataset.data_vars.values():
+        chunk_sizes = variable.encoding.get('chunksizes')
+        if chunk_sizes and len(variable.dims) >= 2:
+            for dim, chunk_size in zip(variable.dims, chunk_sizes):
+                chunks.setdefault(dim, chunk_size)
+    return chunks
+
+
+def _is_geometry_column(data_frame: pd.DataFrame, column: str) -> bool:
+    return isinstance(data_frame, gpd.GeoDataFrame) and column == data_frame.geometry.name
+
+
+def _is_netcdf_encodable(values) -> bool:
+    """Test whether the values of a data frame column or index can be written to NetCDF."""
+    dtype = values.dtype
+    if not isinstance(dtype, np.dtype):
+        # Extension types such as categories
+        return False
+    if dtype.kind in 'biufcmMSU':
+        return True
+    # Object columns are written as variable-length strings, if all values are strings
+    return dtype.kind == 'O' and all(isinstance(value, str) for value in values)
+
+
+def _data_frame_to_dataset(data_frame: pd.DataFrame) -> xr.Dataset:
+    attrs = {_RESOURCE_TYPE_ATTR_NAME: 'DataFrame'}
+    if data_frame.index.name is None:
+        attrs['index_name'] = ''
+    if isinstance(data_frame, gpd.GeoDataFrame):
+        geometry_name = data_frame.geometry.name
+        attrs[_RESOURCE_TYPE_ATTR_NAME] = 'GeoDataFrame'
+        attrs['geometry_column'] = geometry_name
+        crs = data_frame.crs
+        if crs:
+            attrs['crs'] = crs.to_wkt() if hasattr(crs, 'to_wkt') else json.dumps(crs)
+        # assign() returns a new frame, setting the column would change the GeoDataFrame itself
+        data_frame = pd.DataFrame(data_frame).assign(**{geometry_name: [geometry.wkt if geometry is not None else ''
+                                                                        for geometry in data_frame[geometry_name]]})
+    dataset = xr.Dataset.from_dataframe(data_frame)
+    dataset.attrs.update(attrs)
+    return dataset
+
+
+def _dataset_to_data_frame(dataset: xr.Dataset) -> pd.DataFrame:
+    attrs = dataset.attrs
+    data_frame = dataset.to_dataframe()
+    if attrs.get('index_name') == '':
+        data_frame.index.name = None
+    if attrs[_RESOURCE_TYPE_ATTR_NAME] == 'GeoDataFrame':
+        geometry_name = attrs['geometry_column']
+        geometries = [shapely.wkt.loads(wkt) if wkt else None for wkt in data_frame[geometry_name]]
+        crs = attrs.get('crs')
+        if crs and crs.startswith('{'):
+            crs = json.loads(crs)
+        # Avoid drop(columns=...) and rename_geometry(), which require pandas 0.21 and geopandas 0.5
+        data_frame = gpd.GeoDataFrame(data_frame.drop(geometry_name, axis=1))
+        data_frame[geometry_name] = gpd.GeoSeries(geometries, index=data_frame.index)
+        data_frame = data_frame.set_geometry(geometry_name, crs=crs or None)
+        # Restore the order of columns
+        data_frame = data_frame[list(dataset.data_vars.keys())]
+    return data_frame
+
+
+RESOURCE_FORMAT_REGISTRY = ResourceFormatRegistry()
+RESOURCE_FORMAT_REGISTRY.add_format(NetCDFResourceFormat())
@@ -0,0 +1,278 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Description
+===========
+
+A persistent, size-bounded cache for the results of workflow steps, so that results survive sessions.
+
+Results are keyed by the fingerprint of their computation, see :py:attr:`cate.core.workflow.Node.fingerprint`.
+Every result is stored in a directory of its own, which contains a file for each output value:
+``xarray`` datasets and data arrays are written as compressed NetCDF files, all other values are pickled.
+Least recently used results are removed once the cache exceeds its capacity.
+
+Because unpickling a file may execute arbitrary code, pickled values are only written and read if the cache
+directory is private, i.e. owned by the current user and not writable by others. The cache directory is
+created accordingly. Results comprising other values than datasets are not cached in a shared directory.
+
+Workspaces use the cache returned by :py:func:`get_step_result_cache`, if the configuration parameter
+``use_step_result_cache`` is ``True``.
+
+Components
+==========
+"""
+
+import json
+import os
+import os.path
+import pickle
+import shutil
+import stat
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import xarray as xr
+
+from ..conf import get_config_path, get_config_value
+from ..conf.defaults import STEP_RESULT_CACHE_DIR, STEP_RESULT_CACHE_CAPACITY
+from ..util.cache import Cache, CacheStore, POLICY_LRU
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+_INDEX_FILE_NAME = 'result.json'
+_TEMP_DIR_EXT = '.tmp'
+_NETCDF_COMPRESSION_LEVEL = 4
+
+
+class StepResultStore(CacheStore):
+    """
+    A cache store for step results, which are mappings from output names to output values.
+
+    Results are written to a temporary directory first, which is then renamed, so that multiple processes
+    can share the same *cache_dir*. The index file of a result is touched whenever the result is restored,
+    so that the least recently used results can be determined after restart.
+
+    :param cache_dir: The cache directory.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    @property
+    def allows_pickle(self) -> bool:
+        """Whether values may be pickled, which requires the cache directory to be private."""
+        return _is_private_dir(self.cache_dir)
+
+    def can_load_from_key(self, key) -> bool:
+        return os.path.isfile(os.path.join(self._key_to_path(key), _INDEX_FILE_NAME))
+
+    def load_from_key(self, key):
+        path = self._key_to_path(key)
+        return path, _get_dir_size(path)
+
+    def store_value(self, key, value: Dict):
+        path = self._key_to_path(key)
+        parent_dir = os.path.dirname(path)
+        if not os.path.exists(parent_dir):
+            os.makedirs(parent_dir, exist_ok=True)
+        temp_path = '%s.%s%s' % (path, uuid.uuid4().hex, _TEMP_DIR_EXT)
+        try:
+            os.mkdir(temp_path)
+            outputs = OrderedDict()
+            allows_pickle = self.allows_pickle
+            for index, (output_name, output_value) in enumerate(value.items()):
+                outputs[output_name] = _write_value(output_value, temp_path, 'output_%d' % index, allows_pickle)
+            with open(os.path.join(temp_path, _INDEX_FILE_NAME), 'w') as fp:
+                json.dump(dict(outputs=outputs), fp, indent='  ')
+            try:
+                os.replace(temp_path, path)
+            except OSError:
+                if not self.can_load_from_key(key):
+                    raise
+                # Another process has stored the same result in the meantime
+                shutil.rmtree(temp_path, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(temp_path, ignore_errors=True)
+            raise
+        return path, _get_dir_size(path)
+
+    def restore_value(self, key, stored_value) -> Dict:
+        path = self._key_to_path(key)
+        index_file = os.path.join(path, _INDEX_FILE_NAME)
+        with open(index_file, 'r') as fp:
+            index = json.load(fp)
+        value = OrderedDict()
+        allows_pickle = self.allows_pickle
+        for output_name, output_info in index['outputs'].items():
+            value[output_name] = _read_value(output_info, path, allows_pickle)
+        try:
+            # Record access, so that recency of use survives restarts
+            os.utime(index_file)
+        except OSError:
+            pass
+        return value
+
+    def discard_value(self, key, stored_value):
+        shutil.rmtree(self._key_to_path(key), ignore_errors=True)
+
+    def get_stored_keys(self) -> List:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        mtimes_and_keys = []
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                if key.endswith(_TEMP_DIR_EXT):
+                    continue
+                try:
+                    mtime = os.path.getmtime(os.path.join(prefix_dir, key, _INDEX_FILE_NAME))
+                except OSError:
+                    # Not a result or removed by another process in the meantime
+                    continue
+                mtimes_and_keys.append((mtime, key))
+        mtimes_and_keys.sort()
+        return [key for _, key in mtimes_and_keys]
+
+    def _key_to_path(self, key):
+        key = str(key)
+        return os.path.join(self.cache_dir, key[:2], key)
+
+
+class StepResultCache:
+    """
+    A persistent cache for the results of workflow steps.
+
+    Results that cannot be written, e.g. because they cannot be pickled, are silently not cached.
+    Results are written without locking the cache, so that steps executed concurrently may store
+    their results in parallel.
+
+    :param cache_dir: The cache directory. It is created, if it does not exist, and then is private to the user.
+    :param capacity: The capacity in bytes.
+    """
+
+    def __init__(self, cache_dir: str, capacity: int):
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        self._cache = Cache(StepResultStore(cache_dir), capacity=capacity, threshold=0.75, policy=POLICY_LRU)
+
+    @property
+    def cache(self) -> Cache:
+        """The underlying cache."""
+        return self._cache
+
+    def get_result(self, fingerprint: str) -> Optional[Dict]:
+        """
+        Get the result computed with the given *fingerprint*.
+
+        :param fingerprint: The fingerprint of the computation.
+        :return: A mapping from output names to output values or ``None``, if no such result is cached.
+        """
+        # noinspection PyBroadException
+        try:
+            return self._cache.get_value(fingerprint)
+        except Exception as e:
+            print('warning: failed to restore cached step result %s: %s' % (fingerprint, e))
+            self._cache.remove_value(fingerprint)
+            return None
+
+    def put_result(self, fingerprint: str, result: Dict) -> bool:
+        """
+        Put the result computed with the given *fingerprint*.
+
+        :param fingerprint: The fingerprint of the computation.
+        :param result: A mapping from output names to output values.
+        :return: ``True``, if the result has been cached.
+        """
+        # noinspection PyBroadException
+        try:
+            # Write outside of the cache's lock, which is held while restoring or writing any other result
+            self._cache.store.store_value(fingerprint, result)
+        except Exception:
+            return False
+        return self._cache.add_stored_value(fingerprint)
+
+
+_STEP_RESULT_CACHE = None
+_STEP_RESULT_CACHE_LOCK = threading.Lock()
+
+
+def get_step_result_cache() -> StepResultCache:
+    """
+    Get the persistent step result cache which is shared by all workspaces.
+    It is created on first use and then indexes all results written by previous or concurrent sessions.
+    """
+    global _STEP_RESULT_CACHE
+    with _STEP_RESULT_CACHE_LOCK:
+        if _STEP_RESULT_CACHE is None:
+            cache_dir = get_config_path('step_result_cache_dir', STEP_RESULT_CACHE_DIR)
+            capacity = get_config_value('step_result_cache_capacity', STEP_RESULT_CACHE_CAPACITY)
+            _STEP_RESULT_CACHE = StepResultCache(cache_dir, capacity)
+        return _STEP_RESULT_CACHE
+
+
+def _write_value(value, dir_path: str, file_name: str, allows_pickle: bool) -> Dict:
+    if isinstance(value, (xr.Dataset, xr.DataArray)):
+        file_name += '.nc'
+        encoding = {var_name: dict(zlib=True, complevel=_NETCDF_COMPRESSION_LEVEL)
+                    for var_name in (value.data_vars if isinstance(value, xr.Dataset) else [])}
+        value.to_netcdf(os.path.join(dir_path, file_name), encoding=encoding)
+        return dict(format='netcdf', type=type(value).__name__, file=file_name)
+    if not allows_pickle:
+        raise ValueError('values of type %s are only cached in a private directory' % type(value).__name__)
+    file_name += '.pickle'
+    with open(os.path.join(dir_path, file_name), 'wb') as fp:
+        pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+    return dict(format='pickle', file=file_name)
+
+
+def _read_value(output_info: Dict, dir_path: str, allows_pickle: bool):
+    path = os.path.join(dir_path, output_info['file'])
+    if output_info['format'] == 'netcdf':
+        if output_info.get('type') == 'DataArray':
+            return xr.open_dataarray(path)
+        return xr.open_dataset(path)
+    if not allows_pickle:
+        raise ValueError('refusing to unpickle %s from a directory that is not private' % path)
+    with open(path, 'rb') as fp:
+        return pickle.load(fp)
+
+
+def _get_dir_size(dir_path: str) -> int:
+    size = 0
+    for file_name in os.listdir(dir_path):
+        size += os.path.getsize(os.path.join(dir_path, file_name))
+    return size
+
+
+def _is_private_dir(dir_path: str) -> bool:
+    """Test whether the directory *dir_path* is owned by the current user and not writable by others."""
+    if not hasattr(os, 'getuid'):
+        # Windows, where user directories are protected by ACLs
+        return True
+    try:
+        dir_stat = os.stat(dir_path)
+    except OSError:
+        return False
+    return dir_stat.st_uid == os.getuid() and not dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
@@ -113,14 +113,18 @@ Components
 ==========
 """
 
+import concurrent.futures
+import hashlib
+import os
+import threading
 from abc import ABCMeta, abstractmethod
 from collections import OrderedDict, namedtuple
 from io import IOBase
 from itertools import chain
-from typing import Optional, Union, List, Dict
+from typing import Optional, Union, List, Dict, Any, Tuple, Set
 
 from .op import OP_REGISTRY, Operation, Monitor, new_expression_op, new_subprocess_op
-from ..util import Namespace, UNDEFINED, safe_eval, OpMetaInfo
+from ..util import Namespace, UNDEFINED, safe_eval, OpMetaInfo, SynchronizedMonitor
 
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)"
 
@@ -149,6 +153,8 @@ class Node(metaclass=ABCMeta):
         self._op_meta_info = op_meta_info
         self._id = node_id or self.gen_id()
         self._persistent = False
+        self._checkpoint = False
+        self._fingerprint = None
         self._inputs = self._new_input_namespace()
         self._outputs = self._new_output_namespace()
 
@@ -162,6 +168,14 @@ class Node(metaclass=ABCMeta):
         """The node's identifier. """
         return self._id
 
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """
+        The fingerprint of the computation performed by the node's last invocation or ``None``, if it is not known.
+        Nodes with equal fingerprints compute equal output values.
+        """
+        return self._fingerprint
+
     def gen_id(self):
         return type(self).__name__.lower() + '_' + hex(id(self))[2:]
 
@@ -468,6 +482,8 @@ class Workflow(Node):
         # The list of steps
         self._steps = []
         self._steps_dict = {}
+        # Maps step IDs to the IDs of the steps directly depending on them, built on demand
+        self._dependents_index = None
 
     @property
     def steps(self) -> List['Step']:
@@ -481,27 +497,67 @@ class Workflow(Node):
 
     @classmethod
     def sort_steps(cls, steps: List['Step']):
-        """Sorts the list of workflow steps in the order they they can be executed."""
-        # Note: Try find a replacement for this brute-force sorting algorithm.
-        #       It is ok for a small number of steps only.
-        #       order(sort_steps, N, Ni) = order(sorted, N) + N^2 * Ni^2
-        #       where N is the number of steps and Ni is the number of inputs per step
+        """
+        Sorts the list of workflow steps in the order they they can be executed.
+
+        Steps are ordered by their maximum distance to any other of the given steps they depend on, either directly
+        or through steps not in *steps*. Steps of equal distance keep their given order.
+        The time required is linear in the number of steps and their inputs.
+        """
         n = len(steps)
         if n < 2:
             return steps
-        dist_and_step_list = []
-        for i1 in range(n):
-            max_dist = 0
-            step = steps[i1]
-            for i2 in range(n):
-                if i1 != i2:
-                    dist = step.max_distance_to(steps[i2])
-                    if dist > 0:
-                        max_dist = max(max_dist, dist)
-            dist_and_step_list.append((max_dist, step))
-        sorted_d_and_step_list = sorted(dist_and_step_list, key=lambda dist_and_step: dist_and_step[0])
-        sorted_steps = [dist_and_step[1] for dist_and_step in sorted_d_and_step_list]
-        return sorted_steps
+        step_set = set(steps)
+        step_dict = {step.id: step for step in steps}
+        # Maps each visited node to its maximum distance to any of the given steps or -1 if it doesn't depend on
+        # any of them. Nodes currently being visited are mapped to None.
+        max_dists = {}
+        for step in steps:
+            if step in max_dists:
+                continue
+            # Depth-first search in post-order, not recursive, as steps may form long chains
+            max_dists[step] = None
+            stack = [(step, cls._get_source_nodes(step, step_dict), 0)]
+            while stack:
+                node, source_nodes, index = stack.pop()
+                if index < len(source_nodes):
+                    stack.append((node, source_nodes, index + 1))
+                    source_node = source_nodes[index]
+                    if source_node not in max_dists:
+                        max_dists[source_node] = None
+                        stack.append((source_node, cls._get_source_nodes(source_node, step_dict), 0))
+                    elif max_dists[source_node] is None:
+                        raise ValueError('steps must not form a cycle')
+                    continue
+                max_dist = -1
+                for source_node in source_nodes:
+                    source_dist = max_dists[source_node]
+                    if source_node in step_set:
+                        max_dist = max(max_dist, 1, source_dist + 1)
+                    elif source_dist > 0:
+                        max_dist = max(max_dist, source_dist + 1)
+                max_dists[node] = max_dist
+        # Stable bucket sort by distance
+        buckets = [[] for _ in range(max(max_dists[step] for step in steps) + 2)]
+        for step in steps:
+            buckets[max(0, max_dists[step])].append(step)
+        return [step for bucket in buckets for step in bucket]
+
+    @classmethod
+    def _get_source_nodes(cls, node: Node, step_dict: Dict[str, 'Step']) -> List[Node]:
+        source_nodes = []
+        for port in node.inputs[:]:
+            if port.source is not None:
+                source_node = port.source.node
+            elif port.source_ref is not None:
+                # Source references not resolved yet
+                source_node_id, _ = port.source_ref
+                source_node = step_dict.get(source_node_id)
+            else:
+                source_node = None
+            if source_node is not None and source_node is not node and source_node not in source_nodes:
+                source_nodes.append(source_node)
+        return source_nodes
 
     def find_steps_to_compute(self, step_id: str) -> List['Step']:
         """
@@ -518,6 +574,44 @@ class Workflow(Node):
         step.collect_predecessors(steps, [self])
         return steps
 
+    def find_dependent_steps(self, step_id: str) -> List['Step']:
+        """
+        Find the steps that depend directly or indirectly on the step with the given *step_id*.
+        The workflow maintains a reverse dependency index for this purpose, which is rebuilt after steps or
+        their inputs have changed. Once built, the time required is linear in the number of dependent steps.
+
+        :param step_id: The ID of the step whose dependent steps are requested.
+        :return: a list of dependent steps in breadth-first order, which doesn't include the step itself
+        """
+        dependents_index = self._get_dependents_index()
+        dependent_ids = []
+        visited_ids = {step_id}
+        queue = [step_id]
+        while queue:
+            next_queue = []
+            for source_id in queue:
+                for target_id in dependents_index.get(source_id, ()):
+                    if target_id not in visited_ids:
+                        visited_ids.add(target_id)
+                        dependent_ids.append(target_id)
+                        next_queue.append(target_id)
+            queue = next_queue
+        return [self._steps_dict[dependent_id] for dependent_id in dependent_ids]
+
+    def _get_dependents_index(self) -> Dict[str, List[str]]:
+        dependents_index = self._dependents_index
+        if dependents_index is None:
+            dependents_index = {}
+            for step in self._steps:
+                for source_node in self._get_source_nodes(step, self._steps_dict):
+                    if self._steps_dict.get(source_node.id) is source_node:
+                        dependents_index.setdefault(source_node.id, []).append(step.id)
+            self._dependents_index = dependents_index
+        return dependents_index
+
+    def _invalidate_dependents_index(self) -> None:
+        self._dependents_index = None
+
     def find_node(self, step_id: str) -> Optional['Step']:
         # is it the ID of one of the direct children?
         step = self._steps_dict.get(step_id)
@@ -549,6 +643,8 @@ class Workflow(Node):
 
         new_step._parent_node = self
 
+        self._invalidate_dependents_index()
+
         if old_step and old_step is not new_step:
             # If the step already existed before, we must resolve source references again
             self.update_sources()
@@ -568,6 +664,7 @@ class Workflow(Node):
         assert old_step is not None
         self._steps.remove(old_step)
         old_step._parent_node = None
+        self._invalidate_dependents_index()
         # After removing old_step, remove ports whose source is still old_step.
         self.remove_orphaned_sources(old_step)
         return old_step
@@ -584,6 +681,7 @@ class Workflow(Node):
         if old_id in self._steps_dict:
             self._steps_dict.pop(old_id)
             self._steps_dict[changed_node.id] = changed_node
+        self._invalidate_dependents_index()
         for step in self._steps:
             step.update_sources_node_id(changed_node, old_id)
 
@@ -609,24 +707,136 @@ class Workflow(Node):
                      steps: List['Step'],
                      context: Dict = None,
                      monitor_label: str = None,
-                     monitor=Monitor.NONE) -> None:
+                     monitor=Monitor.NONE,
+                     max_workers: int = None) -> None:
         """
         Invoke just the given steps.
 
+        If *max_workers* is greater than one, steps are invoked by a pool of *max_workers* threads.
+        A step is invoked as soon as all of the given steps it depends on, either directly or through other steps
+        of this workflow, have been invoked, so that independent branches of the workflow are executed concurrently.
+        Otherwise steps are invoked one after the other in the given order, which therefore must be an execution
+        order.
+
         :param steps: Selected steps of this workflow.
         :param context: An optional execution context
         :param monitor_label: An optional label for the progress monitor.
         :param monitor: The progress monitor.
+        :param max_workers: The maximum number of steps invoked concurrently.
         """
         context = _new_context(context, workflow=self)
         step_count = len(steps)
         if step_count == 1:
-            steps[0].invoke(context=context, monitor=monitor)
+            _invoke_step(steps[0], context, monitor)
         elif step_count > 1:
             monitor_label = monitor_label or "Executing {step_count} workflow step(s)"
             with monitor.starting(monitor_label.format(step_count=step_count), step_count):
-                for step in steps:
-                    step.invoke(context=context, monitor=monitor.child(work=1))
+                if max_workers and max_workers > 1:
+                    self._invoke_steps_concurrently(steps, context, monitor, max_workers)
+                else:
+                    for step in steps:
+                        _invoke_step(step, context, monitor.child(work=1))
+
+    def _invoke_steps_concurrently(self, steps: List['Step'], context: Dict, monitor: Monitor, max_workers: int):
+        # The number of given steps each step depends on, and the given steps that depend on each step
+        step_indexes = {step: index for index, step in enumerate(steps)}
+        num_sources = {step: 0 for step in steps}
+        targets = {step: [] for step in steps}
+        for step, source_steps in self._find_given_source_steps(steps).items():
+            for source_step in source_steps:
+                num_sources[step] += 1
+                targets[source_step].append(step)
+
+        # Monitors are usually not thread-safe
+        monitor = SynchronizedMonitor(monitor)
+        ready_steps = [step for step in steps if num_sources[step] == 0]
+        future_steps = {}
+        pending_futures = set()
+        error = None
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while ready_steps or pending_futures:
+                # Stop invoking new steps if a step failed or if we have been cancelled.
+                # Running steps are waited for, they observe the cancellation themselves.
+                if error is None and not monitor.is_cancelled():
+                    for step in ready_steps:
+                        future = executor.submit(_invoke_step, step, context, monitor.child(work=1))
+                        future_steps[future] = step
+                        pending_futures.add(future)
+                ready_steps = []
+                if not pending_futures:
+                    break
+                done_futures, pending_futures = concurrent.futures.wait(pending_futures,
+                                                                        return_when=concurrent.futures.FIRST_COMPLETED)
+                # Keep the given order of steps among those that became ready
+                for future in sorted(done_futures, key=lambda f: step_indexes[future_steps[f]]):
+                    if future.exception() is not None:
+                        error = error or future.exception()
+                        continue
+                    for target_step in targets[future_steps.pop(future)]:
+                        num_sources[target_step] -= 1
+                        if num_sources[target_step] == 0:
+                            ready_steps.append(target_step)
+        if error is not None:
+            raise error
+        monitor.check_for_cancellation()
+        if any(num_sources[step] > 0 for step in steps):
+            raise ValueError('steps must not form a cycle')
+
+    def _find_given_source_steps(self, steps: List['Step']) -> Dict['Step', Set['Step']]:
+        """
+        Map each of the given steps to the given steps it depends on, either directly or through steps of this
+        workflow that are not given. The latter are not invoked, but their outputs may still be read.
+        """
+        step_set = set(steps)
+        # Maps steps of this workflow not in *steps* to the given steps they depend on.
+        # Steps currently being visited are mapped to None.
+        other_sources = {}
+
+        def get_source_nodes(node: Node) -> List[Node]:
+            # Only steps of this workflow are followed, not its inputs or nodes of other workflows
+            return [source_node for source_node in self._get_source_nodes(node, self._steps_dict)
+                    if self._steps_dict.get(source_node.id) is source_node]
+
+        def visit(start_node: Node) -> Set['Step']:
+            # Depth-first search in post-order, not recursive, as steps may form long chains
+            if start_node in other_sources:
+                if other_sources[start_node] is None:
+                    raise ValueError('steps must not form a cycle')
+                return other_sources[start_node]
+            other_sources[start_node] = None
+            stack = [(start_node, get_source_nodes(start_node), 0)]
+            while stack:
+                node, source_nodes, index = stack.pop()
+                if index < len(source_nodes):
+                    stack.append((node, source_nodes, index + 1))
+                    source_node = source_nodes[index]
+                    if source_node not in step_set:
+                        if source_node not in other_sources:
+                            other_sources[source_node] = None
+                            stack.append((source_node, get_source_nodes(source_node), 0))
+                        elif other_sources[source_node] is None:
+                            raise ValueError('steps must not form a cycle')
+                    continue
+                source_steps = set()
+                for source_node in source_nodes:
+                    if source_node in step_set:
+                        source_steps.add(source_node)
+                    else:
+                        source_steps.update(other_sources[source_node])
+                other_sources[node] = source_steps
+            return other_sources[start_node]
+
+        given_source_steps = {}
+        for step in steps:
+            source_steps = set()
+            for source_node in get_source_nodes(step):
+                if source_node in step_set:
+                    source_steps.add(source_node)
+                else:
+                    source_steps.update(visit(source_node))
+            source_steps.discard(step)
+            given_source_steps[step] = source_steps
+        return given_source_steps
 
     @classmethod
     def load(cls, file_path_or_fp: Union[str, IOBase], registry=OP_REGISTRY) -> 'Workflow':
@@ -788,6 +998,26 @@ class Step(Node):
         self._persistent = value
         # print('persistent: ', self._persistent)
 
+    @property
+    def checkpoint(self):
+        """
+        Return whether this step is a checkpoint.
+        Results of workflow steps are usually deferred ``dask`` computations, which are performed only once
+        values are actually needed, e.g. by image tiles, plots or when resources are written. Every such access
+        computes the whole chain of steps again. The dask-backed results of a checkpoint step are computed once
+        and kept in memory, so that steps using them start from the computed values.
+        :return: True, if so, False otherwise
+        """
+        return self._checkpoint
+
+    @checkpoint.setter
+    def checkpoint(self, value: bool):
+        """
+        Set whether this step is a checkpoint. See :py:meth:`checkpoint`.
+        :param value: True, if so, False otherwise
+        """
+        self._checkpoint = value
+
     @property
     def parent_node(self):
         """The node's ID."""
@@ -800,6 +1030,7 @@ class Step(Node):
             return None
 
         step.persistent = json_dict.get('persistent', False)
+        step.checkpoint = json_dict.get('checkpoint', False)
 
         step_inputs_json_dict = json_dict.get('inputs', {})
         for name, step_input_json in step_inputs_json_dict.items():
@@ -840,6 +1071,9 @@ class Step(Node):
         if self.persistent:
             step_json_dict['persistent'] = True
 
+        if self.checkpoint:
+            step_json_dict['checkpoint'] = True
+
         self.enhance_json_dict(step_json_dict)
 
         inputs_json_dict = self.get_inputs_json_dict()
@@ -963,27 +1197,123 @@ class OpStepBase(Step, metaclass=ABCMeta):
         :param context: The current execution context. Should always be given.
         :param monitor: An optional progress monitor.
         """
+        # Lazy input values are loaded only if this step's operation must actually be invoked
         input_values = OrderedDict()
         for node_input in self.inputs[:]:
             if node_input.has_value:
-                input_values[node_input.name] = node_input.value
+                input_values[node_input.name] = node_input._get_value()
 
         self._set_context_values(context, input_values)
 
         value_cache = self._get_value_cache(context)
-        if value_cache is not None and self.id in value_cache and value_cache[self.id] is not UNDEFINED:
-            return_value = value_cache[self.id]
+        if value_cache is not None:
+            fingerprint = self._new_fingerprint(input_values)
+            if isinstance(value_cache, ValueCache):
+                return_value, outcome = value_cache.get_memoized_value(self.id, fingerprint)
+            elif self.id in value_cache and value_cache[self.id] is not UNDEFINED:
+                return_value, outcome = value_cache[self.id], MemoReport.HIT
+            else:
+                return_value, outcome = UNDEFINED, MemoReport.MISS
+            if return_value is UNDEFINED:
+                return_value = self._restore_result(context, fingerprint)
+                if return_value is not UNDEFINED:
+                    outcome = MemoReport.RESTORED
+                else:
+                    return_value = self._op(monitor=monitor, **self._load_input_values(input_values))
+                if self.checkpoint:
+                    return_value = self._persist_result(return_value)
+                if outcome != MemoReport.RESTORED:
+                    self._store_result(context, fingerprint, return_value)
+                if isinstance(value_cache, ValueCache):
+                    value_cache.set_memoized_value(self.id, return_value, fingerprint)
+                else:
+                    value_cache[self.id] = return_value
+            memo_report = context.get('memo_report')
+            if memo_report is not None:
+                memo_report.record(self.id, outcome)
         else:
-            return_value = self._op(monitor=monitor, **input_values)
-            if value_cache is not None:
-                value_cache[self.id] = return_value
+            fingerprint = None
+            return_value = self._op(monitor=monitor, **self._load_input_values(input_values))
+            if self.checkpoint:
+                return_value = self._persist_result(return_value)
+        self._fingerprint = fingerprint
 
         if self.op_meta_info.has_named_outputs:
-            for output_name, output_value in return_value.items():
+            for output_name, output_value in _load_value(return_value).items():
                 self.outputs[output_name].value = output_value
         else:
             self.outputs[OpMetaInfo.RETURN_OUTPUT_NAME].value = return_value
 
+    def _persist_result(self, return_value):
+        """Compute the dask-backed values of the *return_value* of a checkpoint step and keep them in memory."""
+        if self.op_meta_info.has_named_outputs:
+            return OrderedDict((name, _persist_value(value)) for name, value in _load_value(return_value).items())
+        return _persist_value(return_value)
+
+    @classmethod
+    def _load_input_values(cls, input_values: Dict) -> Dict:
+        return OrderedDict((name, _load_value(value)) for name, value in input_values.items())
+
+    def _restore_result(self, context: Dict, fingerprint: Optional[str]):
+        """
+        Restore the return value computed with the given *fingerprint* from the persistent
+        'step_result_cache' entry of the *context*, if any.
+
+        :return: The return value or ``UNDEFINED``, if it is not available.
+        """
+        step_result_cache = context.get('step_result_cache')
+        if step_result_cache is None or fingerprint is None:
+            return UNDEFINED
+        result = step_result_cache.get_result(fingerprint)
+        if result is None:
+            return UNDEFINED
+        if self.op_meta_info.has_named_outputs:
+            return result
+        return result.get(OpMetaInfo.RETURN_OUTPUT_NAME, UNDEFINED)
+
+    def _store_result(self, context: Dict, fingerprint: Optional[str], return_value) -> None:
+        """Store the *return_value* computed with the given *fingerprint* in the 'step_result_cache', if any."""
+        step_result_cache = context.get('step_result_cache')
+        if step_result_cache is None or fingerprint is None:
+            return
+        if self.op_meta_info.has_named_outputs:
+            if isinstance(return_value, dict):
+                step_result_cache.put_result(fingerprint, return_value)
+        else:
+            step_result_cache.put_result(fingerprint, {OpMetaInfo.RETURN_OUTPUT_NAME: return_value})
+
+    def _new_fingerprint(self, input_values: Dict) -> Optional[str]:
+        """
+        Compute the fingerprint of invoking this step's operation with the given *input_values* from
+        the operation's name and version, constant input values and the fingerprints of input sources.
+
+        Input values naming existing files or directories also contribute their modification time and size,
+        so that results are recomputed once the files change. Operations tagged "input" that have no such
+        input value, e.g. operations opening datasets from data stores, read data that may change without
+        notice and are therefore not fingerprinted.
+
+        :param input_values: The input values.
+        :return: The fingerprint or ``None``, if any of the input values cannot be fingerprinted.
+        """
+        op_meta_info = self.op_meta_info
+        parts = [op_meta_info.qualified_name, str(op_meta_info.header.get('version')), self._body_string() or '']
+        has_file_input = False
+        for input_name in sorted(input_values.keys()):
+            if input_name in self.inputs and not op_meta_info.inputs.get(input_name, {}).get('context'):
+                input_fingerprint = self.inputs[input_name].fingerprint
+            else:
+                input_fingerprint = _new_value_fingerprint(input_values[input_name])
+            if input_fingerprint is None:
+                return None
+            parts.append('%s=%s' % (input_name, input_fingerprint))
+            file_state = _get_file_state(input_values[input_name])
+            if file_state is not None:
+                has_file_input = True
+                parts.append('%s@%s' % (input_name, file_state))
+        if not has_file_input and 'input' in (op_meta_info.header.get('tags') or []):
+            return None
+        return _new_fingerprint(*parts)
+
     def __call__(self, monitor=Monitor.NONE, **input_values):
         """
         Make this class instance's callable.
@@ -1113,6 +1443,8 @@ class SubProcessStep(OpStepBase):
            e.g. "(?P<msg>\w+)" or "(?P<work>\d+)"
     :param done_re: A regex that must match a text line from the process' stdout
            in order to signal the end of progress monitoring.
+    :param cpu_time_limit: Optional limit of the CPU time of the process in seconds.
+    :param memory_limit: Optional limit of the memory of the process in bytes.
     :param inputs: input name to input properties mapping.
     :param outputs: output name to output properties mapping.
     :param node_id: A node ID. If None, an ID will be generated.
@@ -1127,6 +1459,8 @@ class SubProcessStep(OpStepBase):
                  started_re: str = None,
                  progress_re: str = None,
                  done_re: str = None,
+                 cpu_time_limit: float = None,
+                 memory_limit: int = None,
                  inputs: Dict[str, Dict] = None,
                  outputs: Dict[str, Dict] = None,
                  node_id: str = None):
@@ -1143,6 +1477,8 @@ class SubProcessStep(OpStepBase):
         self._started_re = started_re
         self._progress_re = progress_re
         self._done_re = done_re
+        self._cpu_time_limit = cpu_time_limit
+        self._memory_limit = memory_limit
         op = new_subprocess_op(op_meta_info,
                                command,
                                run_python=run_python,
@@ -1151,7 +1487,9 @@ class SubProcessStep(OpStepBase):
                                shell=shell,
                                started=started_re,
                                progress=progress_re,
-                               done=done_re)
+                               done=done_re,
+                               cpu_time_limit=cpu_time_limit,
+                               memory_limit=memory_limit)
         super(SubProcessStep, self).__init__(op, node_id=op_meta_info.qualified_name)
 
     @classmethod
@@ -1166,6 +1504,8 @@ class SubProcessStep(OpStepBase):
         started_re = json_dict.get('started_re')
         progress_re = json_dict.get('progress_re')
         done_re = json_dict.get('done_re')
+        cpu_time_limit = json_dict.get('cpu_time_limit')
+        memory_limit = json_dict.get('memory_limit')
         return cls(command,
                    run_python=run_python,
                    cwd=cwd,
@@ -1174,6 +1514,8 @@ class SubProcessStep(OpStepBase):
                    started_re=started_re,
                    progress_re=progress_re,
                    done_re=done_re,
+                   cpu_time_limit=cpu_time_limit,
+                   memory_limit=memory_limit,
                    node_id=json_dict.get('id'))
 
     def enhance_json_dict(self, node_dict: OrderedDict):
@@ -1192,6 +1534,10 @@ class SubProcessStep(OpStepBase):
             node_dict['progress_re'] = self._progress_re
         if self._done_re:
             node_dict['done_re'] = self._done_re
+        if self._cpu_time_limit:
+            node_dict['cpu_time_limit'] = self._cpu_time_limit
+        if self._memory_limit:
+            node_dict['memory_limit'] = self._memory_limit
 
     def _body_string(self):
         return '"%s"' % self._command
@@ -1287,8 +1633,12 @@ class NodePort:
 
     @property
     def value(self):
+        return _load_value(self._get_value())
+
+    def _get_value(self):
+        # Like value, but lazy values are not loaded
         if self._source:
-            return self._source.value
+            return self._source._get_value()
         elif self._value is UNDEFINED:
             return None
         else:
@@ -1299,11 +1649,22 @@ class NodePort:
         self._value = new_value
         self._source = None
         self._source_ref = None
+        self._invalidate_dependents_index()
 
     @property
     def source_ref(self) -> SourceRef:
         return self._source_ref
 
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """The fingerprint of this port's value or ``None``, if it is not known."""
+        if self._source:
+            return self._source.fingerprint
+        if self._name in self._node.outputs and self._node.outputs[self._name] is self:
+            node_fingerprint = self._node.fingerprint
+            return _new_fingerprint(node_fingerprint, self._name) if node_fingerprint else None
+        return _new_value_fingerprint(self._value) if self._value is not UNDEFINED else None
+
     @property
     def is_source(self) -> bool:
         return self._source is not None
@@ -1319,6 +1680,15 @@ class NodePort:
         self._source = new_source
         self._source_ref = SourceRef(new_source.node_id, new_source.name) if new_source else None
         self._value = UNDEFINED
+        self._invalidate_dependents_index()
+
+    def _invalidate_dependents_index(self):
+        # Dependencies between steps are given by their inputs only, setting output values must stay cheap
+        if self._name not in self._node.inputs or self._node.inputs[self._name] is not self:
+            return
+        parent_node = self._node.parent_node
+        if isinstance(parent_node, Workflow):
+            parent_node._invalidate_dependents_index()
 
     def update_source_node_id(self, node: Node, old_node_id: str) -> None:
         """
@@ -1519,50 +1889,193 @@ def _wire_target_port_graph_nodes(target_port, graph_nodes):
     source_gnode.find_port(source_port.name).connect(target_gnode.find_port(target_port.name))
 
 
+class LazyValue:
+    """
+    A value that is loaded on first use by calling *loader*, e.g. a workspace resource read from a file.
+
+    A ``LazyValue`` may be set as value of a :py:class:`ValueCache` or a :py:class:`NodePort`,
+    both return the loaded value on access. Steps pass lazy values on to their outputs without loading them.
+
+    :param loader: A function without arguments that returns the value.
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._value = UNDEFINED
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        """Whether the value has been loaded."""
+        return self._value is not UNDEFINED
+
+    def get(self):
+        """Return the value, load it on first call."""
+        with self._lock:
+            if self._value is UNDEFINED:
+                self._value = self._loader()
+                self._loader = None
+            return self._value
+
+    def close(self):
+        """Close the value, if it has been loaded and it is closable."""
+        if self._value is not UNDEFINED and hasattr(self._value, 'close'):
+            self._value.close()
+
+
+class MemoReport:
+    """
+    Reports how the results of workflow steps have been obtained during a workflow run.
+    A ``MemoReport`` is passed as "memo_report" entry of the execution context.
+    """
+
+    #: The step's cached result has been reused.
+    HIT = 'hit'
+    #: The cached result of another step with equal fingerprint has been reused.
+    SHARED = 'shared'
+    #: The step's result has been restored from a persistent cache.
+    RESTORED = 'restored'
+    #: The step's result has been computed.
+    MISS = 'miss'
+    #: The step's result has been computed, because its cached result was computed from other inputs.
+    INVALIDATED = 'invalidated'
+
+    def __init__(self):
+        self._outcomes = OrderedDict()
+
+    def record(self, step_id: str, outcome: str) -> None:
+        """Record the *outcome* of invoking the step with given *step_id*."""
+        self._outcomes[step_id] = outcome
+
+    @property
+    def outcomes(self) -> Dict[str, str]:
+        """Mapping of step IDs to outcomes in invocation order."""
+        return OrderedDict(self._outcomes)
+
+    @property
+    def num_hits(self) -> int:
+        """Number of steps whose result has been reused, including shared and restored results."""
+        return self._count(MemoReport.HIT) + self._count(MemoReport.SHARED) + self._count(MemoReport.RESTORED)
+
+    @property
+    def num_misses(self) -> int:
+        """Number of steps whose result has been computed, including invalidated results."""
+        return self._count(MemoReport.MISS) + self._count(MemoReport.INVALIDATED)
+
+    def _count(self, outcome: str) -> int:
+        return sum(1 for o in self._outcomes.values() if o == outcome)
+
+    def to_json_dict(self):
+        """
+        Return a JSON-serializable dictionary representation of this object.
+
+        :return: A JSON-serializable dictionary
+        """
+        return OrderedDict([('hits', self._count(MemoReport.HIT)),
+                            ('shared', self._count(MemoReport.SHARED)),
+                            ('restored', self._count(MemoReport.RESTORED)),
+                            ('misses', self._count(MemoReport.MISS)),
+                            ('invalidated', self._count(MemoReport.INVALIDATED)),
+                            ('steps', self.outcomes)])
+
+    def __str__(self):
+        return '%d hit(s), %d shared, %d restored, %d miss(es), %d invalidated' % (self._count(MemoReport.HIT),
+                                                                                   self._count(MemoReport.SHARED),
+                                                                                   self._count(MemoReport.RESTORED),
+                                                                                   self._count(MemoReport.MISS),
+                                                                                   self._count(MemoReport.INVALIDATED))
+
+
 class ValueCache(dict):
     """
     ``ValueCache`` is a closable dictionary that maintains unique IDs for it's keys.
     If a ``ValueCache`` is closed, all closable values are also closed.
     A value is closeable if it has a ``close`` attribute whose value is a callable.
+
+    Values may be memoized together with a fingerprint of their computation, see :py:meth:`set_memoized_value`.
+    Values with equal fingerprints are shared between keys, a shared value is closed once no key refers to it anymore.
+
+    Values may be :py:class:`LazyValue` objects, which are loaded on access by key, see :py:meth:`__getitem__`
+    and :py:meth:`get`. ``values()`` and ``items()`` are the views of ``dict`` and pass lazy values on unloaded,
+    use :py:meth:`loaded_values` and :py:meth:`loaded_items` to load them.
+
+    Setting, deleting, renaming and memoizing values is thread-safe, as workflow steps may be invoked concurrently.
     """
 
     def __init__(self):
         super(ValueCache, self).__init__()
         self._id_infos = dict()
+        # Maps IDs back to their keys
+        self._id_keys = dict()
         self._last_id = 0
+        # Guards IDs, fingerprints and reference counts, as workflow steps may be invoked concurrently
+        self._lock = threading.RLock()
+        self._fingerprints = dict()
+        self._fingerprint_keys = dict()
+        # Maps id(value) to the number of keys referring to value, for values referred to by more than one key
+        self._value_ref_counts = dict()
 
     def __del__(self):
         """Override the ``dict`` method to close any old values."""
         self._close_values()
 
+    def _get(self, key, default=None):
+        return super(ValueCache, self).get(key, default)
+
     def _set(self, key, value):
         super(ValueCache, self).__setitem__(key, value)
 
+    def __getitem__(self, key):
+        """Override the ``dict`` method to load lazy values."""
+        return _load_value(super(ValueCache, self).__getitem__(key))
+
+    def get(self, key, default=None):
+        """Override the ``dict`` method to load lazy values."""
+        return _load_value(super(ValueCache, self).get(key, default))
+
+    def loaded_values(self) -> List:
+        """Return a list of all values, lazy values are loaded."""
+        return [_load_value(value) for value in self.values()]
+
+    def loaded_items(self) -> List[Tuple[str, Any]]:
+        """Return a list of all (key, value) pairs, lazy values are loaded."""
+        return [(key, _load_value(value)) for key, value in self.items()]
+
+    def is_lazy(self, key: str) -> bool:
+        """Test whether the value for given *key* is a :py:class:`LazyValue`, which may not have been loaded yet."""
+        return isinstance(self._get(key), LazyValue)
+
     def __setitem__(self, key, value):
         """
         Override the ``dict`` method to close any old value and generate a new ID,
         if *key* didn't exist before.
         """
-        old_value = self.get(key)
-        id_info = self._id_infos.get(key)
-        self._set(key, value)
-        if id_info:
-            self._id_infos[key] = id_info[0], id_info[1] + 1
-        else:
-            self._id_infos[key] = self._gen_id(), 0
-        if old_value is not value:
-            self._close_value(old_value)
+        with self._lock:
+            old_value = self._get(key)
+            id_info = self._id_infos.get(key)
+            self._set(key, value)
+            self._forget_fingerprint(key)
+            if id_info:
+                self._id_infos[key] = id_info[0], id_info[1] + 1
+            else:
+                new_id = self._gen_id()
+                self._id_infos[key] = new_id, 0
+                self._id_keys[new_id] = key
+            if old_value is not value:
+                self._release_value(old_value)
 
     def _del(self, key):
         super(ValueCache, self).__delitem__(key)
 
     def __delitem__(self, key):
         """Override the ``dict`` method to close the value and remove its ID."""
-        old_value = self.get(key)
-        self._del(key)
-        del self._id_infos[key]
-        if old_value is not None:
-            self._close_value(old_value)
+        with self._lock:
+            old_value = self._get(key)
+            self._del(key)
+            self._forget_fingerprint(key)
+            self._forget_id(key)
+            if old_value is not None:
+                self._release_value(old_value)
 
     def get_value_by_id(self, id: int, default=UNDEFINED):
         """Return the value for the given integer *id* or return *default*."""
@@ -1579,19 +2092,85 @@ class ValueCache(dict):
         id_info = self._id_infos.get(key)
         return id_info[1] if id_info else None
 
+    def get_fingerprint(self, key: str) -> Optional[str]:
+        """Return the fingerprint of the value for given *key* or ``None``."""
+        return self._fingerprints.get(key)
+
+    def get_memoized_value(self, key: str, fingerprint: Optional[str]) -> Tuple[Any, str]:
+        """
+        Get the memoized value for given *key* whose computation has the given *fingerprint*.
+
+        The value for *key* is returned if its fingerprint equals *fingerprint* or if either fingerprint is not known.
+        Otherwise, if another key has a value with equal fingerprint, that value is shared with *key* and returned.
+
+        :param key: The key.
+        :param fingerprint: The fingerprint of the computation or ``None``, if it is not known.
+        :return: A pair comprising the value or ``UNDEFINED``, if it must be computed, and the outcome as one of
+                 the :py:class:`MemoReport` constants.
+        """
+        with self._lock:
+            outcome = MemoReport.MISS
+            # Lazy values are passed on unloaded
+            value = self._get(key, UNDEFINED)
+            if value is not UNDEFINED:
+                old_fingerprint = self._fingerprints.get(key)
+                if fingerprint is None or old_fingerprint is None or old_fingerprint == fingerprint:
+                    if fingerprint is not None and old_fingerprint is None:
+                        self._set_fingerprint(key, fingerprint)
+                    return value, MemoReport.HIT
+                outcome = MemoReport.INVALIDATED
+            if fingerprint is not None:
+                other_key = self._fingerprint_keys.get(fingerprint)
+                if other_key is not None and other_key != key:
+                    other_value = self._get(other_key, UNDEFINED)
+                    if other_value is not UNDEFINED:
+                        if other_value is not value:
+                            self._value_ref_counts[id(other_value)] = \
+                                self._value_ref_counts.get(id(other_value), 1) + 1
+                        self[key] = other_value
+                        self._set_fingerprint(key, fingerprint)
+                        return other_value, MemoReport.SHARED
+            return UNDEFINED, outcome
+
+    def set_memoized_value(self, key: str, value, fingerprint: Optional[str]) -> None:
+        """
+        Set the *value* for given *key* computed with given *fingerprint*.
+
+        :param key: The key.
+        :param value: The value.
+        :param fingerprint: The fingerprint of the computation or ``None``, if it is not known.
+        """
+        with self._lock:
+            self[key] = value
+            if fingerprint is not None:
+                self._set_fingerprint(key, fingerprint)
+
+    def _set_fingerprint(self, key: str, fingerprint: str) -> None:
+        self._forget_fingerprint(key)
+        self._fingerprints[key] = fingerprint
+        self._fingerprint_keys[fingerprint] = key
+
+    def _forget_fingerprint(self, key: str) -> None:
+        fingerprint = self._fingerprints.pop(key, None)
+        if fingerprint is not None and self._fingerprint_keys.get(fingerprint) == key:
+            del self._fingerprint_keys[fingerprint]
+
     def get_key(self, id: int):
         """Return the key for given integer *id* or ``None``."""
-        for key, id_info in self._id_infos.items():
-            if id_info[0] == id:
-                return key
-        return None
+        return self._id_keys.get(id)
+
+    def _forget_id(self, key: str) -> None:
+        id_info = self._id_infos.pop(key, None)
+        if id_info is not None:
+            del self._id_keys[id_info[0]]
 
     def child(self, key: str) -> 'ValueCache':
         """Return the child ``ValueCache`` for given *key*."""
         child_key = key + '._child'
-        if child_key not in self:
-            self._set(child_key, ValueCache())
-        return self[child_key]
+        with self._lock:
+            if child_key not in self:
+                self._set(child_key, ValueCache())
+            return self[child_key]
 
     def rename_key(self, key: str, new_key: str) -> None:
         """
@@ -1603,42 +2182,72 @@ class ValueCache(dict):
         if key == new_key:
             return
 
-        value = self[key]
-        self._del(key)
-        self._set(new_key, value)
+        with self._lock:
+            value = self._get(key)
+            self._del(key)
+            self._set(new_key, value)
 
-        id_info = self._id_infos[key]
-        del self._id_infos[key]
-        self._id_infos[new_key] = id_info
+            id_info = self._id_infos[key]
+            del self._id_infos[key]
+            self._forget_id(new_key)
+            self._id_infos[new_key] = id_info
+            self._id_keys[id_info[0]] = new_key
 
-        child_key = key + '._child'
-        if child_key in self:
-            child_cache = self[child_key]
-            self._del(child_key)
-            self._set(new_key + '._child', child_cache)
+            fingerprint = self._fingerprints.get(key)
+            self._forget_fingerprint(key)
+            if fingerprint is not None:
+                self._set_fingerprint(new_key, fingerprint)
+
+            child_key = key + '._child'
+            if child_key in self:
+                child_cache = self._get(child_key)
+                self._del(child_key)
+                self._set(new_key + '._child', child_cache)
 
     def pop(self, key, default=None):
-        """Override the ``dict`` method to close the value and remove its ID."""
-        existed_before = key in self
-        value = super(ValueCache, self).pop(key, default=default)
-        if existed_before:
-            self._close_value(value)
-            del self._id_infos[key]
-        return value
+        """
+        Override the ``dict`` method to close the value and remove its ID.
+        Lazy values are released and returned without loading them.
+        """
+        with self._lock:
+            existed_before = key in self
+            value = super(ValueCache, self).pop(key, default)
+            if existed_before:
+                self._release_value(value)
+                self._forget_fingerprint(key)
+                self._forget_id(key)
+            return value
 
     def clear(self) -> None:
         """Override the ``dict`` method to closes values and remove all IDs."""
-        self._close_values()
-        super(ValueCache, self).clear()
-        self._id_infos.clear()
+        with self._lock:
+            self._close_values()
+            super(ValueCache, self).clear()
+            self._id_infos.clear()
+            self._id_keys.clear()
+            self._fingerprints.clear()
+            self._fingerprint_keys.clear()
+            self._value_ref_counts.clear()
 
     def close(self) -> None:
         """Close all values and remove all IDs."""
         self.clear()
 
     def _close_values(self) -> None:
-        values = list(self.values())
-        for value in values:
+        # Shared values are closed once only, lazy values that have not been loaded are not loaded
+        values = {id(value): value for value in self.values()}
+        for value in values.values():
+            self._close_value(value)
+
+    def _release_value(self, value) -> None:
+        ref_count = self._value_ref_counts.get(id(value))
+        if ref_count:
+            # Still referred to by another key
+            if ref_count > 2:
+                self._value_ref_counts[id(value)] = ref_count - 1
+            else:
+                del self._value_ref_counts[id(value)]
+        else:
             self._close_value(value)
 
     @classmethod
@@ -1651,11 +2260,77 @@ class ValueCache(dict):
                 pass
 
     def _gen_id(self) -> int:
-        new_id = self._last_id + 1
-        self._last_id = new_id
+        with self._lock:
+            new_id = self._last_id + 1
+            self._last_id = new_id
         return new_id
 
 
+def _load_value(value):
+    return value.get() if isinstance(value, LazyValue) else value
+
+
+def _new_fingerprint(*parts: str) -> str:
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def _new_value_fingerprint(value) -> Optional[str]:
+    """Return the fingerprint of a constant *value* or ``None``, if the value cannot be fingerprinted."""
+    value_repr = _get_value_repr(value)
+    return _new_fingerprint(value_repr) if value_repr is not None else None
+
+
+def _get_file_state(value) -> Optional[str]:
+    """Return the modification time and size of the file or directory named by *value* or ``None``."""
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        file_stat = os.stat(value)
+    except (OSError, ValueError):
+        # Not a path or no such file
+        return None
+    return '%d:%d' % (file_stat.st_mtime_ns, file_stat.st_size)
+
+
+def _get_value_repr(value) -> Optional[str]:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return '%s:%r' % (type(value).__name__, value)
+    if isinstance(value, (list, tuple)):
+        item_reprs = [_get_value_repr(item) for item in value]
+        if None in item_reprs:
+            return None
+        return '%s:[%s]' % (type(value).__name__, ','.join(item_reprs))
+    if isinstance(value, dict):
+        item_reprs = []
+        for item_key, item_value in value.items():
+            key_repr = _get_value_repr(item_key)
+            value_repr = _get_value_repr(item_value)
+            if key_repr is None or value_repr is None:
+                return None
+            item_reprs.append('%s=%s' % (key_repr, value_repr))
+        return 'dict:{%s}' % ','.join(sorted(item_reprs))
+    # Any other object, we don't know whether its repr() is stable or unique
+    return None
+
+
+def _persist_value(value):
+    """Persist the ``dask`` arrays of *value*, if it is an ``xarray`` dataset or data array backed by them."""
+    value = _load_value(value)
+    # Datasets have a mapping of chunks, which is empty if they are not backed by dask arrays
+    if hasattr(value, 'persist') and getattr(value, 'chunks', None):
+        return value.persist()
+    return value
+
+
+def _invoke_step(step: Step, context: Dict, monitor: Monitor) -> None:
+    workflow_profile = context.get('workflow_profile')
+    if workflow_profile is None:
+        step.invoke(context=context, monitor=monitor)
+    else:
+        with workflow_profile.measuring(step.id):
+            step.invoke(context=context, monitor=monitor)
+
+
 def _new_context(context: Optional[Dict], **kwargs) -> Dict:
     new_context = dict() if context is None else dict(context)
     new_context.update(kwargs)
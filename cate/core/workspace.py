@@ -23,18 +23,23 @@
 This module defines the ``Workspace`` class and the ``WorkspaceError`` exception type.
 """
 
+import io
 import os
 import shutil
 import sys
+import uuid
 from collections import OrderedDict
 from threading import RLock
-from typing import List, Any, Dict, Optional
+from typing import List, Any, Dict, Optional, Tuple
 
 import fiona
 import pandas as pd
 import xarray as xr
 
-from .workflow import Workflow, OpStep, NodePort, ValueCache
+from .profiler import WorkflowProfile
+from .respersist import RESOURCE_FORMAT_REGISTRY
+from .stepcache import get_step_result_cache
+from .workflow import Workflow, OpStep, NodePort, ValueCache, MemoReport, LazyValue
 from ..conf import conf
 from ..conf.defaults import WORKSPACE_DATA_DIR_NAME, WORKSPACE_WORKFLOW_FILE_NAME, SCRATCH_WORKSPACES_PATH
 from ..core.cdm import get_tiling_scheme
@@ -95,6 +100,13 @@ class Workspace:
         self._is_modified = is_modified
         self._is_closed = False
         self._resource_cache = ValueCache()
+        self._memo_report = None
+        self._workflow_profile = None
+        # The workflow JSON text and resource versions as last written to or read from files
+        self._saved_workflow_text = None
+        self._saved_res_versions = dict()
+        # Maps resource IDs to the names and update counts of resources and their descriptors
+        self._res_descriptors = dict()
         self._user_data = dict()
         self._lock = RLock()
 
@@ -117,6 +129,16 @@ class Workspace:
         """The Workspace's resource cache."""
         return self._resource_cache
 
+    @property
+    def memo_report(self) -> Optional[MemoReport]:
+        """Reports which resources have been reused or computed by the last workflow execution, if any."""
+        return self._memo_report
+
+    @property
+    def workflow_profile(self) -> Optional[WorkflowProfile]:
+        """The profile of the last workflow execution, if it has been profiled."""
+        return self._workflow_profile
+
     @property
     def is_scratch(self) -> bool:
         return self._is_scratch
@@ -168,7 +190,7 @@ class Workspace:
             workflow = Workflow.load(workflow_file)
             workspace = Workspace(base_dir, workflow)
 
-            # Read resources for persistent steps
+            # Register resources of persistent steps, they are read on first use
             persistent_steps = [step for step in workflow.steps if step.persistent]
             if persistent_steps:
                 with monitor.starting('Reading resources', len(persistent_steps)):
@@ -185,14 +207,15 @@ class Workspace:
             return
         with self._lock:
             self._resource_cache.close()
+            self._res_descriptors.clear()
             # Remove all resource files that are no longer required
             if os.path.isdir(self.workspace_dir):
                 persistent_ids = {step.id for step in self.workflow.steps if step.persistent}
                 for filename in os.listdir(self.workspace_dir):
                     res_file = os.path.join(self.workspace_dir, filename)
-                    if os.path.isfile(res_file) and filename.endswith('.nc'):
-                        res_name = filename[0: -3]
-                        if res_name not in persistent_ids:
+                    if os.path.isfile(res_file):
+                        res_name = RESOURCE_FORMAT_REGISTRY.get_res_name(filename)
+                        if res_name is not None and res_name not in persistent_ids:
                             try:
                                 os.remove(res_file)
                             except (OSError, IOError) as e:
@@ -208,39 +231,74 @@ class Workspace:
                 workspace_dir = self.workspace_dir
                 if not os.path.isdir(workspace_dir):
                     os.mkdir(workspace_dir)
-                self.workflow.store(self.workflow_file)
-
-                # Write resources for all persistent steps
-                persistent_steps = [step for step in self.workflow.steps if step.persistent]
-                if persistent_steps:
-                    with monitor.starting('Writing resources', len(persistent_steps)):
-                        for step in persistent_steps:
-                            self._write_resource_to_file(step.id)
+                self._write_workflow_file()
+
+                # Write resources of persistent steps that changed since they have been written or read
+                res_names = [step.id for step in self.workflow.steps
+                             if step.persistent and self._is_resource_modified(step.id)]
+                if res_names:
+                    # Resources are written one after the other, because the NetCDF library is not thread-safe
+                    with monitor.starting('Writing resources', len(res_names)):
+                        for res_name in res_names:
+                            self._write_resource_to_file(res_name)
                             monitor.progress(1)
 
                 self._is_modified = False
             except (IOError, OSError) as e:
                 raise WorkspaceError(e)
 
+    def _write_workflow_file(self):
+        text_io = io.StringIO()
+        self.workflow.store(text_io)
+        workflow_text = text_io.getvalue()
+        workflow_file = self.workflow_file
+        if workflow_text == self._saved_workflow_text and os.path.isfile(workflow_file):
+            return
+        _write_file_atomically(workflow_file, lambda path: _write_text(path, workflow_text))
+        self._saved_workflow_text = workflow_text
+
+    def _get_resource_version(self, res_name):
+        res_id = self._resource_cache.get_id(res_name)
+        return (res_id, self._resource_cache.get_update_count(res_name)) if res_id is not None else None
+
+    def _is_resource_modified(self, res_name):
+        res_version = self._get_resource_version(res_name)
+        if res_version is None:
+            return False
+        return self._saved_res_versions.get(res_name) != res_version \
+            or not RESOURCE_FORMAT_REGISTRY.find_resource_files(self.workspace_dir, res_name)
+
     def _write_resource_to_file(self, res_name):
+        res_version = self._get_resource_version(res_name)
         res_value = self._resource_cache.get(res_name)
-        if res_value is not None:
-            resource_file = os.path.join(self.workspace_dir, res_name + '.nc')
-            try:
-                res_value.to_netcdf(resource_file)
-            except AttributeError:
-                pass
-            except Exception as e:
-                print('error:', e)
+        if res_value is None:
+            return
+        resource_format = RESOURCE_FORMAT_REGISTRY.find_writer(res_value)
+        if resource_format is None:
+            # Resources of other types are not persisted
+            return
+        resource_file = os.path.join(self.workspace_dir, res_name + resource_format.filename_ext)
+        try:
+            # Never write into the file a lazy resource may currently be read from
+            _write_file_atomically(resource_file, lambda path: resource_format.write(res_value, path))
+            self._saved_res_versions[res_name] = res_version
+        except Exception as e:
+            print('error:', e)
+            return
+        # Remove files of the resource written in other formats before
+        for _, other_file in RESOURCE_FORMAT_REGISTRY.find_resource_files(self.workspace_dir, res_name):
+            if other_file != resource_file:
+                try:
+                    os.remove(other_file)
+                except (OSError, IOError) as e:
+                    print('error:', e)
 
     def _read_resource_from_file(self, res_name):
-        res_file = os.path.join(self.workspace_dir, res_name + '.nc')
-        if os.path.isfile(res_file):
-            try:
-                res_value = xr.open_dataset(res_file)
-                self._resource_cache[res_name] = res_value
-            except Exception as e:
-                print('error:', e)
+        resource_files = RESOURCE_FORMAT_REGISTRY.find_resource_files(self.workspace_dir, res_name)
+        if resource_files:
+            resource_format, res_file = resource_files[0]
+            self._resource_cache[res_name] = LazyValue(lambda: resource_format.read(res_file))
+            self._saved_res_versions[res_name] = self._get_resource_version(res_name)
 
     # <<< Issue #270
 
@@ -254,6 +312,26 @@ class Workspace:
                 return
             res_step.persistent = persistent
 
+    def set_resource_checkpoint(self, res_name: str, checkpoint: bool):
+        with self._lock:
+            self._assert_open()
+            res_step = self.workflow.find_node(res_name)
+            if res_step is None:
+                raise WorkspaceError('Resource "%s" not found' % res_name)
+            if res_step.checkpoint == checkpoint:
+                return
+            res_step.checkpoint = checkpoint
+            self._is_modified = True
+
+            # Recompute the resource and the resources that depend on it on next use,
+            # so that they start from the persisted values or no longer keep them
+            ids_of_invalidated_steps = {res_name}
+            for step in self.workflow.find_dependent_steps(res_name):
+                ids_of_invalidated_steps.add(step.id)
+            for key in ids_of_invalidated_steps:
+                if key in self._resource_cache:
+                    self._resource_cache[key] = UNDEFINED
+
     @classmethod
     def from_json_dict(cls, json_dict):
         base_dir = json_dict.get('base_dir', None)
@@ -262,37 +340,71 @@ class Workspace:
         workflow = Workflow.from_json_dict(workflow_json)
         return Workspace(base_dir, workflow, is_modified=is_modified)
 
-    def to_json_dict(self):
+    def to_json_dict(self, known_res_versions: Dict[int, Tuple[str, int]] = None):
+        """
+        Return a JSON-serializable dictionary representation of this workspace.
+
+        If *known_res_versions* is given, the dictionary describes the changes only: "resources" comprises
+        the descriptors of resources that are not known or whose name or update count has changed,
+        and "resource_ids" lists the IDs of all resources in the order of their workflow steps.
+        Resources whose descriptors are not returned are not loaded.
+
+        :param known_res_versions: Optional mapping of resource IDs to the names and update counts of the
+               resource descriptors known by a client.
+        :return: A JSON-serializable dictionary
+        """
         with self._lock:
             self._assert_open()
-            return OrderedDict([('base_dir', self.base_dir),
-                                ('is_scratch', self.is_scratch),
-                                ('is_modified', self.is_modified),
-                                ('is_saved', os.path.exists(self.workspace_dir)),
-                                ('workflow', self.workflow.to_json_dict()),
-                                ('resources', self._resources_to_json_list())
-                                ])
-
-    def _resources_to_json_list(self):
+            json_dict = OrderedDict([('base_dir', self.base_dir),
+                                     ('is_scratch', self.is_scratch),
+                                     ('is_modified', self.is_modified),
+                                     ('is_saved', os.path.exists(self.workspace_dir)),
+                                     ('workflow', self.workflow.to_json_dict()),
+                                     ('resources', self._resources_to_json_list(known_res_versions))
+                                     ])
+            if known_res_versions is not None:
+                json_dict['resource_ids'] = [self._resource_cache.get_id(res_name)
+                                             for res_name in self._get_res_names()]
+            return json_dict
+
+    def _resources_to_json_list(self, known_res_versions: Dict[int, Tuple[str, int]] = None):
         resource_descriptors = []
-        resource_cache = dict(self._resource_cache)
-        for res_step in self.workflow.steps:
-            res_name = res_step.id
-            if res_name in resource_cache:
-                res_id = self._resource_cache.get_id(res_name)
-                res_update_count = self._resource_cache.get_update_count(res_name)
-                resource = resource_cache.pop(res_name)
-                resource_descriptor = self._get_resource_descriptor(res_id, res_update_count, res_name, resource)
-                resource_descriptors.append(resource_descriptor)
-        if len(resource_cache) > 0:
-            # We should not get here as all resources should have an associated workflow step!
-            for res_name, resource in resource_cache.items():
-                res_id = self._resource_cache.get_id(res_name)
-                res_update_count = self._resource_cache.get_update_count(res_name)
-                resource_descriptor = self._get_resource_descriptor(res_id, res_update_count, res_name, resource)
-                resource_descriptors.append(resource_descriptor)
+        res_ids = set()
+        for res_name in self._get_res_names():
+            res_id = self._resource_cache.get_id(res_name)
+            res_update_count = self._resource_cache.get_update_count(res_name)
+            res_ids.add(res_id)
+            if known_res_versions is not None and res_id is not None \
+                    and known_res_versions.get(res_id) == (res_name, res_update_count):
+                continue
+            resource_descriptors.append(self._get_cached_resource_descriptor(res_id, res_update_count, res_name))
+        # Forget the descriptors of deleted resources
+        for res_id in self._res_descriptors.keys() - res_ids:
+            del self._res_descriptors[res_id]
         return resource_descriptors
 
+    def _get_cached_resource_descriptor(self, res_id: Optional[int], res_update_count: Optional[int], res_name: str):
+        # Descriptors must not be modified, they are shared by subsequent calls until the resource changes
+        res_version = res_name, res_update_count
+        if res_id is not None:
+            cached_res_version, resource_descriptor = self._res_descriptors.get(res_id, (None, None))
+            if cached_res_version == res_version:
+                return resource_descriptor
+        # Loads lazy resources
+        resource = self._resource_cache.get(res_name)
+        resource_descriptor = self._get_resource_descriptor(res_id, res_update_count, res_name, resource)
+        if res_id is not None:
+            self._res_descriptors[res_id] = res_version, resource_descriptor
+        return resource_descriptor
+
+    def _get_res_names(self) -> List[str]:
+        res_names = [res_step.id for res_step in self.workflow.steps if res_step.id in self._resource_cache]
+        if len(res_names) < len(self._resource_cache):
+            # We should not get here as all resources should have an associated workflow step!
+            step_res_names = set(res_names)
+            res_names.extend(res_name for res_name in self._resource_cache.keys() if res_name not in step_res_names)
+        return res_names
+
     def _get_resource_descriptor(self, res_id: int, res_update_count: int, res_name: str, resource):
         variable_descriptors = []
         coords_descriptors = []
@@ -379,10 +491,12 @@ class Workspace:
                 variable_info['imageLayout'] = tiling_scheme.to_json()
                 variable_info['isYFlipped'] = tiling_scheme.geo_extent.inv_y
         elif variable.ndim == 1:
-            # Serialize data of coordinate variables.
-            # To limit data transfer volume, we serialize data arrays only if they are 1D.
-            # Note that the 'data' field is used to display coordinate labels in the GUI only.
-            variable_info['data'] = to_json(variable.data)
+            # Serialize data of small 1D coordinate variables, e.g. to display coordinate labels in the GUI.
+            # Clients fetch the values of larger ones page-wise using the "/ws/res/coords" REST endpoint.
+            if variable.size <= conf.get_coord_data_max_size():
+                variable_info['data'] = to_json(variable.data)
+            else:
+                variable_info['isDataOmitted'] = True
 
         display_settings = conf.get_variable_display_settings(variable.name)
         if display_settings:
@@ -409,12 +523,11 @@ class Workspace:
             if res_step is None:
                 raise WorkspaceError('Resource "%s" not found' % res_name)
 
-            dependent_steps = []
-            for step in self.workflow.steps:
-                if step is not res_step and step.requires(res_step):
-                    dependent_steps.append(step.id)
+            dependent_ids = {step.id for step in self.workflow.find_dependent_steps(res_name)}
 
-            if dependent_steps:
+            if dependent_ids:
+                # Report the dependent resources in the order they have been added
+                dependent_steps = [step.id for step in self.workflow.steps if step.id in dependent_ids]
                 raise WorkspaceError('Cannot delete resource "%s" because the following resource(s) '
                                      'depend on it: %s' % (res_name, ', '.join(dependent_steps)))
 
@@ -531,10 +644,8 @@ class Workspace:
             ids_of_invalidated_steps = {res_name}
             if old_step is not None:
                 # Collect all IDs of steps that depend on old_step, if any
-                for step in workflow.steps:
-                    requires = step.requires(old_step)
-                    if requires:
-                        ids_of_invalidated_steps.add(step.id)
+                for step in workflow.find_dependent_steps(res_name):
+                    ids_of_invalidated_steps.add(step.id)
 
             workflow = self._workflow
             # noinspection PyUnusedLocal
@@ -548,7 +659,7 @@ class Workspace:
 
         return res_name
 
-    def run_op(self, op_name: str, op_kwargs: OpKwArgs, monitor=Monitor.NONE):
+    def run_op(self, op_name: str, op_kwargs: OpKwArgs, monitor=Monitor.NONE, profile: bool = False):
         assert op_name
         assert op_kwargs is not None
 
@@ -564,11 +675,28 @@ class Workspace:
                 elif 'value' in input_value:
                     unpacked_op_kwargs[input_name] = input_value['value']
 
+            context = self._new_context()
+            self._workflow_profile = WorkflowProfile() if profile else None
+            if self._workflow_profile is not None:
+                context['workflow_profile'] = self._workflow_profile
             with monitor.starting("Running operation '%s'" % op_name, 2):
-                self.workflow.invoke(context=self._new_context(), monitor=monitor.child(work=1))
-                op(monitor=monitor.child(work=1), **unpacked_op_kwargs)
+                self.workflow.invoke(context=context, monitor=monitor.child(work=1))
+                if self._workflow_profile is not None:
+                    with self._workflow_profile.measuring(op_name):
+                        op(monitor=monitor.child(work=1), **unpacked_op_kwargs)
+                else:
+                    op(monitor=monitor.child(work=1), **unpacked_op_kwargs)
+
+    def execute_workflow(self, res_name: str = None, monitor: Monitor = Monitor.NONE, profile: bool = False):
+        """
+        Execute the steps required to compute the resource *res_name* or all steps, if *res_name* is not given.
 
-    def execute_workflow(self, res_name: str = None, monitor: Monitor = Monitor.NONE):
+        :param res_name: An optional resource name.
+        :param monitor: A progress monitor.
+        :param profile: Whether to profile the execution, see :py:attr:`workflow_profile`.
+        :return: The value of the resource *res_name*, if given, otherwise ``None``, so that resources
+                 read lazily from files are not loaded.
+        """
         self._assert_open()
 
         with self._lock:
@@ -580,13 +708,23 @@ class Workspace:
                     raise WorkspaceError('Resource "%s" not found' % res_name)
                 steps = self.workflow.find_steps_to_compute(res_step.id)
             if len(steps):
-                self.workflow.invoke_steps(steps, context=self._new_context(), monitor=monitor)
-                return steps[-1].get_output_value()
+                self._memo_report = MemoReport()
+                context = self._new_context()
+                context['memo_report'] = self._memo_report
+                self._workflow_profile = WorkflowProfile() if profile else None
+                if self._workflow_profile is not None:
+                    context['workflow_profile'] = self._workflow_profile
+                self.workflow.invoke_steps(steps, context=context, monitor=monitor,
+                                           max_workers=conf.get_workflow_max_workers())
+                return steps[-1].get_output_value() if res_name else None
             else:
                 return None
 
     def _new_context(self):
-        return dict(value_cache=self._resource_cache, workspace=self)
+        context = dict(value_cache=self._resource_cache, workspace=self)
+        if conf.get_use_step_result_cache():
+            context['step_result_cache'] = get_step_result_cache()
+        return context
 
     def _assert_open(self):
         if self._is_closed:
@@ -604,6 +742,23 @@ class Workspace:
                 "except for the first character, the digits 0 through 9." % res_name)
 
 
+def _write_file_atomically(path: str, write):
+    """Call *write* with a temporary file path, then rename the temporary file into *path*."""
+    temp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _write_text(path: str, text: str):
+    with open(path, 'w') as fp:
+        fp.write(text)
+
+
 # noinspection PyArgumentList
 class WorkspaceError(Exception):
     def __init__(self, cause, *args, **kwargs):
@@ -92,7 +92,12 @@ class WorkspaceManager(metaclass=ABCMeta):
     @abstractmethod
     def run_op_in_workspace(self, base_dir: str,
                             op_name: str, op_args: OpKwArgs,
-                            monitor: Monitor = Monitor.NONE) -> Workspace:
+                            monitor: Monitor = Monitor.NONE,
+                            profile: bool = False) -> Workspace:
+        pass
+
+    @abstractmethod
+    def get_workspace_profile(self, base_dir: str) -> Optional[dict]:
         pass
 
     @abstractmethod
@@ -118,6 +123,10 @@ class WorkspaceManager(metaclass=ABCMeta):
     def set_workspace_resource_persistence(self, base_dir: str, res_name: str, persistent: bool) -> Workspace:
         pass
 
+    @abstractmethod
+    def set_workspace_resource_checkpoint(self, base_dir: str, res_name: str, checkpoint: bool) -> Workspace:
+        pass
+
     @abstractmethod
     def write_workspace_resource(self, base_dir: str, res_name: str,
                                  file_path: str, format_name: str = None,
@@ -304,11 +313,17 @@ class FSWorkspaceManager(WorkspaceManager):
 
     def run_op_in_workspace(self, base_dir: str,
                             op_name: str, op_args: OpKwArgs,
-                            monitor: Monitor = Monitor.NONE) -> Workspace:
+                            monitor: Monitor = Monitor.NONE,
+                            profile: bool = False) -> Workspace:
         workspace = self.get_workspace(base_dir)
-        workspace.run_op(op_name, op_args, monitor=monitor)
+        workspace.run_op(op_name, op_args, monitor=monitor, profile=profile)
         return workspace
 
+    def get_workspace_profile(self, base_dir: str) -> Optional[dict]:
+        workspace = self.get_workspace(base_dir)
+        workflow_profile = workspace.workflow_profile
+        return workflow_profile.to_json_dict() if workflow_profile is not None else None
+
     def set_workspace_resource(self,
                                base_dir: str,
                                op_name: str,
@@ -337,6 +352,11 @@ class FSWorkspaceManager(WorkspaceManager):
         workspace.set_resource_persistence(res_name, persistent)
         return workspace
 
+    def set_workspace_resource_checkpoint(self, base_dir: str, res_name: str, checkpoint: bool) -> Workspace:
+        workspace = self.get_workspace(base_dir)
+        workspace.set_resource_checkpoint(res_name, checkpoint)
+        return workspace
+
     def write_workspace_resource(self, base_dir: str, res_name: str,
                                  file_path: str, format_name: str = None,
                                  monitor: Monitor = Monitor.NONE) -> None:
@@ -394,7 +414,7 @@ class FSWorkspaceManager(WorkspaceManager):
     def _get_resource_value(self, workspace, res_name_or_expr, monitor):
         value = UNDEFINED
         if res_name_or_expr is None:
-            value = workspace.resource_cache
+            value = OrderedDict(workspace.resource_cache.loaded_items())
         elif res_name_or_expr.isidentifier() and workspace.workflow.find_node(res_name_or_expr) is not None:
             value = workspace.execute_workflow(res_name=res_name_or_expr, monitor=monitor)
         if value is UNDEFINED:
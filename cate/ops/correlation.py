@@ -29,6 +29,7 @@ Functions
 =========
 """
 
+import dask.array as da
 import xarray as xr
 import numpy as np
 import pandas as pd
@@ -247,20 +248,13 @@ def _pearsonr(x: xr.DataArray, y: xr.DataArray, monitor: Monitor) -> xr.Dataset:
 
         # Presumably, if abs(r) > 1, then it is only some small artifact of floating
         # point arithmetic.
-        # At this point r should be a lon/lat dataArray, so it should be safe to
-        # load it in memory explicitly. This may take time as it will kick-start
-        # deferred processing.
-        # Comparing with NaN produces warnings that can be safely ignored
+        # Clipping keeps deferred (dask) processing deferred, r is computed only
+        # once its values are actually needed. Comparing with NaN produces
+        # warnings that can be safely ignored.
         default_warning_settings = np.seterr(invalid='ignore')
-        with monitor.child(1).observing("task 1"):
-            negativ_r = r.values < -1.0
-        with monitor.child(1).observing("task 2"):
-            r.values[negativ_r] = -1.0
-        with monitor.child(1).observing("task 3"):
-            positiv_r = r.values > 1.0
-        with monitor.child(1).observing("task 4"):
-            r.values[positiv_r] = 1.0
+        r = r.clip(-1.0, 1.0)
         np.seterr(**default_warning_settings)
+        monitor.progress(4)
         r.attrs = {'description': 'Correlation coefficients between'
                    ' {} and {}.'.format(x.name, y.name)}
 
@@ -268,10 +262,8 @@ def _pearsonr(x: xr.DataArray, y: xr.DataArray, monitor: Monitor) -> xr.Dataset:
         t_squared = xr.ufuncs.square(r) * (df / ((1.0 - r.where(r != 1)) *
                                                  (1.0 + r.where(r != -1))))
         prob = df / (df + t_squared)
-        with monitor.child(1).observing("task 5"):
-            prob_values_in = prob.values
-        with monitor.child(1).observing("task 6"):
-            prob.values = betainc(0.5 * df, 0.5, prob_values_in)
+        with monitor.child(2).observing("Calculate p-values"):
+            prob = _betainc(0.5 * df, 0.5, prob)
         prob.attrs = {'description': 'Rough indicator of probability of an'
                       ' uncorrelated system producing datasets that have a Pearson'
                       ' correlation at least as extreme as the one computed from'
@@ -281,3 +273,15 @@ def _pearsonr(x: xr.DataArray, y: xr.DataArray, monitor: Monitor) -> xr.Dataset:
         retset = xr.Dataset({'corr_coef': r,
                              'p_value': prob})
     return retset
+
+
+def _betainc(a: float, b: float, x: xr.DataArray) -> xr.DataArray:
+    """
+    Apply the regularized incomplete beta function to *x*, block-wise if *x* is
+    backed by a dask array.
+    """
+    if isinstance(x.data, da.Array):
+        data = x.data.map_blocks(lambda block: betainc(a, b, block), dtype=x.dtype)
+    else:
+        data = betainc(a, b, x.values)
+    return xr.DataArray(data, coords=x.coords, dims=x.dims, name=x.name)
@@ -87,23 +87,25 @@ def detect_outliers(ds: xr.Dataset,
     with monitor.starting("detect_outliers", total_work=len(variables) * 3):
         for var_name in variables:
             if quantiles:
-                # Get threshold values
-                with monitor.child(1).observing("quantile low"):
-                    threshold_low = ret_ds[var_name].quantile(threshold_low)
-                with monitor.child(1).observing("quantile high"):
-                    threshold_high = ret_ds[var_name].quantile(threshold_high)
+                # Get both threshold values from a single pass over the data,
+                # so that deferred (dask) data is computed only once
+                with monitor.child(2).observing("quantiles"):
+                    var_threshold_low, var_threshold_high = np.nanpercentile(ret_ds[var_name].values,
+                                                                             [threshold_low * 100.,
+                                                                              threshold_high * 100.])
             else:
+                var_threshold_low, var_threshold_high = threshold_low, threshold_high
                 monitor.progress(2)
             # If not mask, put nans in the data arrays for min/max outliers
             if not mask:
                 arr = ret_ds[var_name]
                 attrs = arr.attrs
-                ret_ds[var_name] = arr.where((arr > threshold_low) & (arr < threshold_high))
+                ret_ds[var_name] = arr.where((arr > var_threshold_low) & (arr < var_threshold_high))
                 ret_ds[var_name].attrs = attrs
             else:
                 # Create and add a data variable containing the mask for this data
                 # variable
-                _mask_outliers(ret_ds, var_name, threshold_low, threshold_high)
+                _mask_outliers(ret_ds, var_name, var_threshold_low, var_threshold_high)
             monitor.progress(1)
 
     return ret_ds
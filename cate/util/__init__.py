@@ -42,11 +42,11 @@ Components
 
 from .extend import extend
 from .misc import *
-from .monitor import Monitor, ChildMonitor, ConsoleMonitor, Cancellation
+from .monitor import Monitor, ChildMonitor, ConsoleMonitor, SynchronizedMonitor, Cancellation
 from .namespace import Namespace
 from .opmetainf import OpMetaInfo
 from .undefined import UNDEFINED
 from .safe import safe_eval, get_safe_globals
-from .process import run_subprocess, ProcessOutputMonitor
+from .process import run_subprocess, ProcessOutputMonitor, ProcessPool
 from .tmpfile import new_temp_file, del_temp_file, del_temp_files
 from .opimpl import normalize_impl, adjust_temporal_attrs_impl, adjust_spatial_attrs_impl
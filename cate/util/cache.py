@@ -28,6 +28,8 @@ Description
 This module defines the :py:class:`Cache` class which represents a general-purpose cache.
 A cache is configured by a :py:class:`CacheStore` which is responsible for storing and reloading cached items.
 
+Use :py:class:`StripedCache` to reduce lock contention if a cache is accessed by many threads concurrently.
+
 The default cache stores are
 
 * :py:class:`MemoryCacheStore`
@@ -51,10 +53,14 @@ Components
 
 import os
 import os.path
+import random
 import sys
 import time
+import uuid
 from abc import ABCMeta, abstractmethod
-from threading import RLock
+from collections import OrderedDict
+from threading import Lock
+from typing import List
 
 # _DEBUG_CACHE = True
 _DEBUG_CACHE = False
@@ -112,6 +118,15 @@ class CacheStore(metaclass=ABCMeta):
         """
         pass
 
+    def get_stored_keys(self) -> List:
+        """
+        Get the keys of values that are already present in the store, e.g. because the store is persistent.
+        A :py:class:`Cache` will index these values when it is created.
+        The default implementation returns an empty list.
+        :return: a list of keys, least recently used first
+        """
+        return []
+
 
 class MemoryCacheStore(CacheStore):
     """
@@ -158,6 +173,11 @@ class MemoryCacheStore(CacheStore):
 class FileCacheStore(CacheStore):
     """
     Simple file store for values which can be written and read as bytes, e.g. encoded PNG images.
+
+    Files are written atomically, so that multiple processes can share the same *cache_dir*.
+    Values found in *cache_dir* are reported by :py:meth:`get_stored_keys`, so that a cache using this store
+    can be restored after restart. Their order is given by the files' modification times, which are updated
+    whenever a value is restored.
     """
 
     def __init__(self, cache_dir: str, ext: str):
@@ -177,14 +197,27 @@ class FileCacheStore(CacheStore):
         dir_path = os.path.dirname(path)
         if not os.path.exists(dir_path):
             os.makedirs(dir_path, exist_ok=True)
-        with open(path, 'wb') as fp:
-            fp.write(value)
-        return path, os.path.getsize(path)
+        # Write to a temporary file first, so that other processes never see partially written files
+        temp_path = '%s.%s%s' % (path, uuid.uuid4().hex, _TEMP_FILE_EXT)
+        try:
+            with open(temp_path, 'wb') as fp:
+                fp.write(value)
+            os.replace(temp_path, path)
+        except BaseException:
+            _remove_file(temp_path)
+            raise
+        return path, len(value)
 
     def restore_value(self, key, stored_value):
         path = self._key_to_path(key)
         with open(path, 'rb') as fp:
-            return fp.read()
+            value = fp.read()
+        try:
+            # Record access, so that recency of use survives restarts
+            os.utime(path)
+        except OSError:
+            pass
+        return value
 
     def discard_value(self, key, stored_value):
         path = self._key_to_path(key)
@@ -194,10 +227,41 @@ class FileCacheStore(CacheStore):
         except IOError:
             pass
 
+    def get_stored_keys(self) -> List:
+        if not os.path.isdir(self.cache_dir):
+            return []
+        ext = self.ext
+        mtimes_and_keys = []
+        for dir_path, _, file_names in os.walk(self.cache_dir):
+            for file_name in file_names:
+                if not file_name.endswith(ext) or file_name.endswith(_TEMP_FILE_EXT):
+                    continue
+                path = os.path.join(dir_path, file_name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    # File has been removed by another process in the meantime
+                    continue
+                rel_path = os.path.relpath(path, self.cache_dir)
+                key = rel_path[:len(rel_path) - len(ext)].replace(os.sep, '/')
+                mtimes_and_keys.append((mtime, key))
+        mtimes_and_keys.sort()
+        return [key for _, key in mtimes_and_keys]
+
     def _key_to_path(self, key):
         return os.path.join(self.cache_dir, str(key) + self.ext)
 
 
+_TEMP_FILE_EXT = '.tmp'
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
 def _policy_lru(item):
     return item.access_time
 
@@ -226,10 +290,198 @@ POLICY_RR = _policy_rr
 _T0 = time.clock()
 
 
+class _EvictionIndex(metaclass=ABCMeta):
+    """
+    Cache-private index which keeps track of the order in which the items of a :py:class:`Cache`
+    are discarded, so that the next item to be discarded can be found without sorting all items.
+    """
+
+    @abstractmethod
+    def add(self, item):
+        """Add a new item."""
+
+    @abstractmethod
+    def remove(self, item):
+        """Remove an existing item."""
+
+    @abstractmethod
+    def touch(self, item):
+        """Notify the index that an existing item has been accessed."""
+
+    @abstractmethod
+    def victim(self):
+        """Return the item to be discarded next, or None if the index is empty."""
+
+
+class _RecencyEvictionIndex(_EvictionIndex):
+    """
+    Index for :py:data:`POLICY_LRU` and :py:data:`POLICY_MRU`: items are kept in an ordered dictionary
+    with the most recently used item at its end. All operations are O(1).
+    """
+
+    def __init__(self, most_recent_first: bool):
+        self._most_recent_first = most_recent_first
+        self._items = OrderedDict()
+
+    def add(self, item):
+        self._items[item.key] = item
+
+    def remove(self, item):
+        del self._items[item.key]
+
+    def touch(self, item):
+        self._items.move_to_end(item.key)
+
+    def victim(self):
+        if not self._items:
+            return None
+        values = self._items.values()
+        return next(reversed(values) if self._most_recent_first else iter(values))
+
+
+class _FrequencyEvictionIndex(_EvictionIndex):
+    """
+    Index for :py:data:`POLICY_LFU`: items are kept in a doubly-linked list of buckets of equal access count,
+    ordered by increasing access count. Within a bucket, items are ordered by the time they entered it.
+    All operations are O(1).
+    """
+
+    class _Bucket:
+        __slots__ = ('count', 'items', 'prev', 'next')
+
+        def __init__(self, count: int):
+            self.count = count
+            self.items = OrderedDict()
+            self.prev = None
+            self.next = None
+
+    def __init__(self):
+        self._head = None
+        self._buckets = {}
+
+    def add(self, item):
+        bucket = self._head
+        if bucket is None or bucket.count != 1:
+            bucket = self._insert_bucket_after(None, 1)
+        bucket.items[item.key] = item
+        self._buckets[item.key] = bucket
+
+    def remove(self, item):
+        bucket = self._buckets.pop(item.key)
+        del bucket.items[item.key]
+        if not bucket.items:
+            self._unlink_bucket(bucket)
+
+    def touch(self, item):
+        bucket = self._buckets[item.key]
+        next_bucket = bucket.next
+        if next_bucket is None or next_bucket.count != bucket.count + 1:
+            next_bucket = self._insert_bucket_after(bucket, bucket.count + 1)
+        del bucket.items[item.key]
+        next_bucket.items[item.key] = item
+        self._buckets[item.key] = next_bucket
+        if not bucket.items:
+            self._unlink_bucket(bucket)
+
+    def victim(self):
+        if self._head is None:
+            return None
+        return next(iter(self._head.items.values()))
+
+    def _insert_bucket_after(self, prev_bucket, count: int):
+        bucket = _FrequencyEvictionIndex._Bucket(count)
+        bucket.prev = prev_bucket
+        bucket.next = self._head if prev_bucket is None else prev_bucket.next
+        if bucket.next is not None:
+            bucket.next.prev = bucket
+        if prev_bucket is None:
+            self._head = bucket
+        else:
+            prev_bucket.next = bucket
+        return bucket
+
+    def _unlink_bucket(self, bucket):
+        if bucket.prev is None:
+            self._head = bucket.next
+        else:
+            bucket.prev.next = bucket.next
+        if bucket.next is not None:
+            bucket.next.prev = bucket.prev
+
+
+class _RandomEvictionIndex(_EvictionIndex):
+    """
+    Index for :py:data:`POLICY_RR`: items are kept in an array so that a random item can be picked in O(1).
+    Removal swaps the removed item with the last one, hence is O(1) too.
+    """
+
+    def __init__(self):
+        self._items = []
+        self._positions = {}
+
+    def add(self, item):
+        self._positions[item.key] = len(self._items)
+        self._items.append(item)
+
+    def remove(self, item):
+        position = self._positions.pop(item.key)
+        last_item = self._items.pop()
+        if position < len(self._items):
+            self._items[position] = last_item
+            self._positions[last_item.key] = position
+
+    def touch(self, item):
+        pass
+
+    def victim(self):
+        return random.choice(self._items) if self._items else None
+
+
+class _PolicyEvictionIndex(_EvictionIndex):
+    """
+    Fallback index for user-defined replacement policies: the next item to be discarded is the one
+    with the minimum policy value, found by a linear scan.
+    """
+
+    def __init__(self, policy):
+        self._policy = policy
+        self._items = {}
+
+    def add(self, item):
+        self._items[item.key] = item
+
+    def remove(self, item):
+        del self._items[item.key]
+
+    def touch(self, item):
+        pass
+
+    def victim(self):
+        return min(self._items.values(), key=self._policy) if self._items else None
+
+
+def _new_eviction_index(policy) -> _EvictionIndex:
+    if policy is POLICY_LRU:
+        return _RecencyEvictionIndex(most_recent_first=False)
+    if policy is POLICY_MRU:
+        return _RecencyEvictionIndex(most_recent_first=True)
+    if policy is POLICY_LFU:
+        return _FrequencyEvictionIndex()
+    if policy is POLICY_RR:
+        return _RandomEvictionIndex()
+    return _PolicyEvictionIndex(policy)
+
+
 class Cache:
     """
     An implementation of a cache.
     See https://en.wikipedia.org/wiki/Cache_algorithms
+
+    For the predefined replacement policies, finding, adding, accessing and discarding items is O(1).
+    User-defined policies require a linear scan over all items for every discarded item.
+
+    All operations are serialized by a single, non-reentrant lock. Use a :py:class:`StripedCache`
+    if many threads access the cache concurrently.
     """
 
     class Item:
@@ -281,7 +533,8 @@ class Cache:
             self.access_time = time.clock() - _T0
             self.access_count += 1
 
-    def __init__(self, store=MemoryCacheStore(), capacity=1000, threshold=0.75, policy=POLICY_LRU, parent_cache=None):
+    def __init__(self, store=MemoryCacheStore(), capacity=1000, threshold=0.75, policy=POLICY_LRU, parent_cache=None,
+                 index_stored_values=True):
         """
         Constructor.
 
@@ -291,6 +544,8 @@ class Cache:
         :param policy: cache replacement policy. This is a function that maps a :py:class:`Cache.Item`
                        to a numerical value. See :py:data:`POLICY_LRU`,
                        :py:data:`POLICY_MRU`, :py:data:`POLICY_LFU`, :py:data:`POLICY_RR`
+        :param index_stored_values: whether to index values already present in the store,
+                                    see :py:meth:`CacheStore.get_stored_keys`
         """
         self._store = store
         self._capacity = capacity
@@ -300,8 +555,10 @@ class Cache:
         self._size = 0
         self._max_size = self._capacity * self._threshold
         self._item_dict = {}
-        self._item_list = []
-        self._lock = RLock()
+        self._item_index = _new_eviction_index(policy)
+        self._lock = Lock()
+        if index_stored_values:
+            self._index_stored_values(store.get_stored_keys())
 
     @property
     def policy(self):
@@ -328,107 +585,136 @@ class Cache:
         return self._max_size
 
     def get_value(self, key):
-        self._lock.acquire()
-        item = self._item_dict.get(key)
-        value = None
-        restored = False
-        if item:
-            value = item.restore(self._store, key)
-            restored = True
-            if _DEBUG_CACHE:
-                _debug_print('restored value for key "%s" from cache' % key)
-        elif self._parent_cache:
-            item = self._parent_cache.get_value(key)
+        with self._lock:
+            item = self._item_dict.get(key)
+            value = None
+            restored = False
             if item:
-                value = item.restore(self._parent_cache.store, key)
-                restored = True
-                if _DEBUG_CACHE:
-                    _debug_print('restored value for key "%s" from parent cache' % key)
-        if not restored:
-            item = Cache.Item.load_from_key(self._store, key)
+                try:
+                    value = item.restore(self._store, key)
+                    self._item_index.touch(item)
+                    restored = True
+                    if _DEBUG_CACHE:
+                        _debug_print('restored value for key "%s" from cache' % key)
+                except OSError:
+                    # The stored value has vanished, e.g. a file removed by another process sharing the store
+                    self._remove_item(item)
+                    item = None
+            if not item and self._parent_cache:
+                value = self._parent_cache.get_value(key)
+                if value is not None:
+                    restored = True
+                    if _DEBUG_CACHE:
+                        _debug_print('restored value for key "%s" from parent cache' % key)
+            if not restored:
+                item = Cache.Item.load_from_key(self._store, key)
+                if item:
+                    self._add_item(item)
+                    value = item.restore(self._store, key)
+                    if _DEBUG_CACHE:
+                        _debug_print('restored value for key "%s" from cache' % key)
+            return value
+
+    def put_value(self, key, value):
+        with self._lock:
+            if self._parent_cache:
+                # remove value from parent cache, because this cache will now take over
+                self._parent_cache.remove_value(key)
+            item = self._item_dict.get(key)
             if item:
-                self._add_item(item)
-                value = item.restore(self._store, key)
+                self._remove_item(item)
+                item.discard(self._store, key)
                 if _DEBUG_CACHE:
-                    _debug_print('restored value for key "%s" from cache' % key)
-        self._lock.release()
-        return value
+                    _debug_print('discarded value for key "%s" from cache' % key)
+            else:
+                item = Cache.Item()
+            item.store(self._store, key, value)
+            if _DEBUG_CACHE:
+                _debug_print('stored value for key "%s" in cache' % key)
+            self._add_item(item)
 
-    def put_value(self, key, value):
-        self._lock.acquire()
-        if self._parent_cache:
-            # remove value from parent cache, because this cache will now take over
-            self._parent_cache.remove_value(key)
-        item = self._item_dict.get(key)
-        if item:
-            self._remove_item(item)
-            item.discard(self._store, key)
+    def add_stored_value(self, key) -> bool:
+        """
+        Add the value that has already been written for *key* into this cache's store, so that callers
+        may store large values without holding this cache's lock. A value already in this cache is kept.
+
+        :param key: The key.
+        :return: ``True``, if a value for *key* is in this cache.
+        """
+        with self._lock:
+            item = self._item_dict.get(key)
+            if item:
+                item._access()
+                self._item_index.touch(item)
+                return True
+            item = Cache.Item.load_from_key(self._store, key)
+            if not item:
+                return False
+            self._add_item(item)
             if _DEBUG_CACHE:
-                _debug_print('discarded value for key "%s" from cache' % key)
-        else:
-            item = Cache.Item()
-        item.store(self._store, key, value)
-        if _DEBUG_CACHE:
-            _debug_print('stored value for key "%s" in cache' % key)
-        self._add_item(item)
-        self._lock.release()
+                _debug_print('added stored value for key "%s" to cache' % key)
+            return True
 
     def remove_value(self, key):
-        self._lock.acquire()
-        if self._parent_cache:
-            self._parent_cache.remove_value(key)
-        item = self._item_dict.get(key)
-        if item:
-            self._remove_item(item)
-            item.discard(self._store, key)
-            if _DEBUG_CACHE:
-                _debug_print('cate.util.im.cache.Cache: discarded value for key "%s" from parent cache' % key)
-        self._lock.release()
+        with self._lock:
+            if self._parent_cache:
+                self._parent_cache.remove_value(key)
+            item = self._item_dict.get(key)
+            if item:
+                self._remove_item(item)
+                item.discard(self._store, key)
+                if _DEBUG_CACHE:
+                    _debug_print('cate.util.im.cache.Cache: discarded value for key "%s" from parent cache' % key)
+
+    def _index_stored_values(self, keys):
+        with self._lock:
+            for key in keys:
+                try:
+                    item = Cache.Item.load_from_key(self._store, key)
+                except OSError:
+                    # The stored value has vanished in the meantime
+                    continue
+                if item:
+                    self._add_item(item)
 
     def _add_item(self, item):
-        self._item_dict[item.key] = item
-        self._item_list.append(item)
+        # Trim before the new item is indexed, so that it cannot become its own victim
         if self._size + item.stored_size > self._max_size:
-            self.trim(item.stored_size)
+            self._trim(item.stored_size)
+        self._item_dict[item.key] = item
+        self._item_index.add(item)
         self._size += item.stored_size
 
     def _remove_item(self, item):
         self._item_dict.pop(item.key)
-        self._item_list.remove(item)
+        self._item_index.remove(item)
         self._size -= item.stored_size
 
     def trim(self, extra_size=0):
+        with self._lock:
+            self._trim(extra_size)
+
+    def _trim(self, extra_size):
+        # Must be called while holding self._lock, which is not reentrant
         if _DEBUG_CACHE:
             _debug_print('trimming...')
-        self._lock.acquire()
-        self._item_list.sort(key=self._policy)
-        keys = []
-        size = self._size
-        max_size = self._max_size
-        for item in self._item_list:
-            if size + extra_size > max_size:
-                keys.append(item.key)
-                size -= item.stored_size
-        self._lock.release()
-        # release lock to give another thread a chance then require lock again
-        self._lock.acquire()
-        for key in keys:
-            if self._parent_cache:
-                # Before discarding item fully, put its value into the parent cache
-                value = self.get_value(key)
-                self.remove_value(key)
-                if value:
-                    self._parent_cache.put_value(key, value)
-            else:
-                self.remove_value(key)
-        self._lock.release()
+        while self._size + extra_size > self._max_size:
+            item = self._item_index.victim()
+            if item is None:
+                break
+            key = item.key
+            # Before discarding item fully, save its value so we can put it into the parent cache
+            value = item.restore(self._store, key) if self._parent_cache else None
+            self._remove_item(item)
+            item.discard(self._store, key)
+            if value is not None:
+                self._parent_cache.put_value(key, value)
 
     def clear(self, clear_parent=True):
-        self._lock.acquire()
-        if self._parent_cache and clear_parent:
-            self._parent_cache.clear(clear_parent)
-        keys = list(self._item_dict.keys())
-        self._lock.release()
+        with self._lock:
+            if self._parent_cache and clear_parent:
+                self._parent_cache.clear(clear_parent)
+            keys = list(self._item_dict.keys())
         for key in keys:
             if self._parent_cache and not clear_parent:
                 value = self.get_value(key)
@@ -437,6 +723,94 @@ class Cache:
             self.remove_value(key)
 
 
+class StripedCache:
+    """
+    A cache that distributes its items over *num_stripes* independent :py:class:`Cache` instances, the stripes.
+    The stripe for a given key is selected by the key's hash value, so that concurrent threads accessing
+    different keys rarely contend for the same lock.
+
+    The total *capacity* is split evenly across the stripes, so every stripe trims itself independently
+    and the size of all stripes together never exceeds ``capacity * threshold``.
+    A striped cache can be used wherever a :py:class:`Cache` is expected.
+
+    :param store: the cache store, see CacheStore interface. It is shared by all stripes.
+    :param capacity: the total size capacity in units used by the store's store() method
+    :param threshold: a number greater than zero and less than one
+    :param policy: cache replacement policy applied within each stripe, see :py:class:`Cache`
+    :param num_stripes: the number of stripes
+    :param parent_cache: optional parent cache shared by all stripes
+    """
+
+    def __init__(self, store=MemoryCacheStore(), capacity=1000, threshold=0.75, policy=POLICY_LRU,
+                 num_stripes=16, parent_cache=None):
+        if num_stripes < 1:
+            raise ValueError('num_stripes must be a positive integer')
+        self._store = store
+        self._capacity = capacity
+        self._threshold = threshold
+        self._policy = policy
+        self._stripes = [Cache(store=store,
+                               capacity=capacity / num_stripes,
+                               threshold=threshold,
+                               policy=policy,
+                               parent_cache=parent_cache,
+                               index_stored_values=False) for _ in range(num_stripes)]
+        stripe_keys = [[] for _ in range(num_stripes)]
+        for key in store.get_stored_keys():
+            stripe_keys[hash(key) % num_stripes].append(key)
+        for stripe, keys in zip(self._stripes, stripe_keys):
+            stripe._index_stored_values(keys)
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def store(self):
+        return self._store
+
+    @property
+    def capacity(self):
+        return self._capacity
+
+    @property
+    def threshold(self):
+        return self._threshold
+
+    @property
+    def num_stripes(self):
+        return len(self._stripes)
+
+    @property
+    def size(self):
+        return sum(stripe.size for stripe in self._stripes)
+
+    @property
+    def max_size(self):
+        return self._capacity * self._threshold
+
+    def get_value(self, key):
+        return self._get_stripe(key).get_value(key)
+
+    def put_value(self, key, value):
+        self._get_stripe(key).put_value(key, value)
+
+    def remove_value(self, key):
+        self._get_stripe(key).remove_value(key)
+
+    def trim(self, extra_size=0):
+        extra_size_per_stripe = extra_size / len(self._stripes)
+        for stripe in self._stripes:
+            stripe.trim(extra_size_per_stripe)
+
+    def clear(self, clear_parent=True):
+        for stripe in self._stripes:
+            stripe.clear(clear_parent=clear_parent)
+
+    def _get_stripe(self, key) -> Cache:
+        return self._stripes[hash(key) % len(self._stripes)]
+
+
 def _debug_print(msg):
     print("cate.util.cache.Cache:", msg)
 
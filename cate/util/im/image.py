@@ -20,6 +20,7 @@
 # SOFTWARE.
 
 import io
+import threading
 import time
 import uuid
 from abc import ABCMeta, abstractmethod
@@ -32,7 +33,7 @@ from PIL import Image
 from .geoextent import GeoExtent
 from .tilingscheme import TilingScheme
 from .utils import downsample_ndarray, aggregate_ndarray_first
-from ..cache import Cache, MemoryCacheStore
+from ..cache import Cache, StripedCache, MemoryCacheStore
 
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)"
 
@@ -55,10 +56,13 @@ TileAggregator = Callable[[Tile, Tile, Tile, Tile], Tile]
 LevelImageIdFactory = Callable[[int], str]
 
 
-def set_default_tile_cache(cache=None, no_cache=False, capacity=64 * 1024 * 1024, threshold=0.75):
+def set_default_tile_cache(cache=None, no_cache=False, capacity=64 * 1024 * 1024, threshold=0.75, num_stripes=1):
     global _DEFAULT_TILE_CACHE
     if no_cache:
         _DEFAULT_TILE_CACHE = None
+    elif cache is None and num_stripes > 1:
+        _DEFAULT_TILE_CACHE = StripedCache(MemoryCacheStore(), capacity=capacity, threshold=threshold,
+                                           num_stripes=num_stripes)
     elif cache is None:
         _DEFAULT_TILE_CACHE = Cache(MemoryCacheStore(), capacity=capacity, threshold=threshold)
     else:
@@ -70,6 +74,100 @@ def get_default_tile_cache() -> Cache:
     return _DEFAULT_TILE_CACHE
 
 
+_CMAP_LUTS = dict()
+_CMAP_LUTS_LOCK = threading.Lock()
+
+_TILE_BUFFERS = threading.local()
+
+# Palette index of no-data pixels in palette images
+_NO_DATA_INDEX = 255
+
+
+def _get_cmap_lut(cmap_name: str, num_colors: int) -> np.ndarray:
+    """
+    Get the read-only RGBA lookup table of shape (num_colors, 4) and type uint8 for the given Matplotlib color map.
+    Lookup tables are computed once and then shared.
+    """
+    key = cmap_name, num_colors
+    with _CMAP_LUTS_LOCK:
+        lut = _CMAP_LUTS.get(key)
+        if lut is None:
+            cmap = cm.get_cmap(cmap_name, num_colors)
+            lut = np.ascontiguousarray(cmap(np.arange(cmap.N), bytes=True), dtype=np.uint8)
+            lut.setflags(write=False)
+            _CMAP_LUTS[key] = lut
+        return lut
+
+
+def _get_tile_buffer(name: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+    """
+    Get a tile-sized work buffer. Buffers are reused by all images computing tiles in the current thread,
+    so their contents are only valid until the next call to a tile computation.
+    """
+    buffers = getattr(_TILE_BUFFERS, 'buffers', None)
+    if buffers is None:
+        buffers = _TILE_BUFFERS.buffers = dict()
+    key = name, shape, np.dtype(dtype)
+    buffer = buffers.get(key)
+    if buffer is None:
+        buffer = buffers[key] = np.empty(shape, dtype=dtype)
+    return buffer
+
+
+class _TileFlight:
+    """
+    A tile computation in progress. The first thread requesting a tile becomes the flight's leader and computes it,
+    other threads requesting the same tile in the meantime wait for the leader's result.
+    """
+
+    _flights = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, tile_id: str):
+        self._tile_id = tile_id
+        self._leader_ident = threading.get_ident()
+        self._done = threading.Event()
+        self._tile = None
+        self._error = None
+
+    @classmethod
+    def join(cls, tile_id: str) -> Tuple['_TileFlight', bool]:
+        """
+        Join the flight for the given tile identifier, or start a new one.
+
+        :return: a pair (flight, is_leader)
+        """
+        with cls._lock:
+            flight = cls._flights.get(tile_id)
+            if flight is not None and flight._leader_ident != threading.get_ident():
+                return flight, False
+            # If the current thread already leads a flight for tile_id, there is a cycle in the image chain,
+            # so we must not wait for ourselves.
+            flight = _TileFlight(tile_id)
+            cls._flights[tile_id] = flight
+            return flight, True
+
+    def wait(self) -> Tile:
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._tile
+
+    def complete(self, tile: Tile) -> None:
+        self._tile = tile
+        self._land()
+
+    def fail(self, error: BaseException) -> None:
+        self._error = error
+        self._land()
+
+    def _land(self):
+        with _TileFlight._lock:
+            if _TileFlight._flights.get(self._tile_id) is self:
+                del _TileFlight._flights[self._tile_id]
+        self._done.set()
+
+
 class TiledImage(metaclass=ABCMeta):
     """
     The interface for tiled images.
@@ -208,6 +306,7 @@ class OpImage(AbstractTiledImage, metaclass=ABCMeta):
     """
     An abstract base class for images that compute their tiles.
     Derived classes must implement the compute_tile(tile_x, tile_y, rect) method only.
+    If multiple threads request the same tile concurrently, it is computed only once.
 
     :param size: the image size as (width, height)
     :param tile_size: optional tile size as (tile_width, tile_height)
@@ -229,10 +328,9 @@ class OpImage(AbstractTiledImage, metaclass=ABCMeta):
 
     def get_tile(self, tile_x: int, tile_y: int) -> Tile:
         t0 = 0
-        tile_id = None
+        tile_id = self.get_tile_id(tile_x, tile_y)
         cache = self._tile_cache
         if cache:
-            tile_id = self.get_tile_id(tile_x, tile_y)
             if _DEBUG_OP_IMAGE:
                 t0 = time.clock()
             tile = cache.get_value(tile_id)
@@ -240,12 +338,31 @@ class OpImage(AbstractTiledImage, metaclass=ABCMeta):
                 if _DEBUG_OP_IMAGE:
                     print('tile "%s": restored from cache, took %.4f sec' % (tile_id, time.clock() - t0))
                 return tile
+
+        # Concurrent requests for the same tile wait for a single computation
+        flight, is_leader = _TileFlight.join(tile_id)
+        if not is_leader:
+            return flight.wait()
+
+        try:
+            tile = cache.get_value(tile_id) if cache else None
+            if tile is None:
+                tile = self._compute_and_cache_tile(tile_id, tile_x, tile_y)
+            flight.complete(tile)
+        except BaseException as error:
+            flight.fail(error)
+            raise
+        return tile
+
+    def _compute_and_cache_tile(self, tile_id: str, tile_x: int, tile_y: int) -> Tile:
+        t0 = 0
+        cache = self._tile_cache
         tw, th = self.tile_size
         if _DEBUG_OP_IMAGE:
             t0 = time.clock()
         tile = self.compute_tile(tile_x, tile_y, (tw * tile_x, th * tile_y, tw, th))
         if _DEBUG_OP_IMAGE:
-            print('tile "%s": computed, took %.4f sec' % (self.get_tile_id(tile_x, tile_y), time.clock() - t0))
+            print('tile "%s": computed, took %.4f sec' % (tile_id, time.clock() - t0))
         if cache:
             if _DEBUG_OP_IMAGE:
                 t0 = time.clock()
@@ -391,7 +508,11 @@ class ColorMappedRgbaImage(DecoratorImage):
     :param num_colors: Number of colors
     :param no_data_value: No-data value
     :param encode: Whether to create tiles that are encoded image bytes according to *format*.
-    :param format: Image format, e.g. "JPEG", "PNG"
+    :param format: Image format, e.g. "JPEG", "PNG", "WEBP". JPEG tiles have no alpha channel.
+    :param palette: Whether to encode palette ("P" mode) images rather than RGBA images. Requires a format
+           that supports palettes, e.g. "PNG". At most 255 colors are used, the last palette entry is transparent.
+    :param save_options: Optional keyword arguments passed to ``PIL.Image.save()`` when tiles are encoded,
+           e.g. ``compress_level`` for PNG or ``quality`` for JPEG and WEBP.
     :param tile_cache: optional tile cache
     """
 
@@ -404,57 +525,113 @@ class ColorMappedRgbaImage(DecoratorImage):
                  no_data_value: Union[int, float] = None,
                  encode: bool = False,
                  format: str = None,
+                 palette: bool = False,
+                 save_options: dict = None,
                  tile_cache=None):
         super().__init__(source_image, image_id=image_id, format=format, mode='RGBA', tile_cache=tile_cache)
         self._value_range = value_range
         self._cmap_name = cmap_name if cmap_name else 'jet'
-        self._cmap = cm.get_cmap(self._cmap_name, num_colors)
-        self._cmap.set_bad('k', 0)
         self._no_data_value = no_data_value
         self._encode = encode
+        self._palette = None
+        self._save_options = dict(save_options or {})
+        if palette and encode and format:
+            # Reserve the last palette entry for transparent no-data pixels
+            self._cmap_lut = _get_cmap_lut(self._cmap_name, min(num_colors, _NO_DATA_INDEX))
+            palette_lut = np.zeros((256, 4), dtype=np.uint8)
+            palette_lut[:len(self._cmap_lut)] = self._cmap_lut
+            self._palette = palette_lut[:, :3].tobytes()
+            self._save_options['transparency'] = palette_lut[:, 3].tobytes()
+        else:
+            self._cmap_lut = _get_cmap_lut(self._cmap_name, num_colors)
 
     def compute_tile_from_source_tile(self,
                                       tile_x: int, tile_y: int,
                                       rectangle: Rectangle2D, source_tile: Tile) -> Tile:
-        value_min, value_max = self._value_range
-        if not np.ma.is_masked(source_tile):
-            if self._no_data_value is not None:
-                array = np.ma.masked_equal(source_tile, self._no_data_value)
-                array = array.clip(value_min, value_max, out=array)
-            elif np.issubdtype(source_tile.dtype, float) or np.issubdtype(source_tile.dtype, complex):
-                array = np.ma.masked_invalid(source_tile)
-                array = array.clip(value_min, value_max, out=array)
-            else:
-                array = source_tile.clip(value_min, value_max)
-        else:
-            array = source_tile.clip(value_min, value_max)
+        array = np.ma.getdata(source_tile)
+        mask = np.ma.getmask(source_tile)
 
         old_shape = array.shape
         height = old_shape[-2]
         width = old_shape[-1]
         if width * height == array.size:
             array = np.reshape(array, (height, width))
+            if mask is not np.ma.nomask:
+                mask = np.reshape(mask, (height, width))
         else:
-            # noinspection PyTypeChecker
-            index = [0] * (array.ndim - 2) + [slice(None), slice(None)]
+            index = (0,) * (array.ndim - 2) + (slice(None), slice(None))
             array = array[index]
-
-        # check if we can optimize the following calls by using Numexpr
-        # see https://github.com/pydata/numexpr/wiki/Numexpr-Users-Guide
-        array -= value_min
-        array *= 1.0 / (value_max - value_min)
-        array = self._cmap(array, bytes=True)
-        image = Image.fromarray(array, mode=self.mode)
+            if mask is not np.ma.nomask:
+                mask = mask[index]
+        shape = array.shape
+
+        # Masked values, no-data values and NaNs are all combined into a single mask
+        no_data = _get_tile_buffer('no_data', shape, np.bool_)
+        if mask is np.ma.nomask:
+            no_data.fill(False)
+        else:
+            np.copyto(no_data, mask)
+        if self._no_data_value is not None or array.dtype.kind == 'f':
+            tmp_mask = _get_tile_buffer('tmp_mask', shape, np.bool_)
+            if self._no_data_value is not None:
+                np.equal(array, self._no_data_value, out=tmp_mask)
+                np.logical_or(no_data, tmp_mask, out=no_data)
+            if array.dtype.kind == 'f':
+                np.isnan(array, out=tmp_mask)
+                np.logical_or(no_data, tmp_mask, out=no_data)
+        has_no_data = no_data.any()
+
+        # Quantize values into color indices, computed as in matplotlib.colors.Colormap.__call__()
+        lut = self._cmap_lut
+        num_colors = len(lut)
+        value_min, value_max = self._value_range
+        scale = num_colors / (value_max - value_min) if value_max > value_min else 0.0
+        values = _get_tile_buffer('values', shape, np.float32 if array.dtype == np.float32 else np.float64)
+        np.subtract(array, value_min, out=values)
+        np.multiply(values, scale, out=values)
+        # Other than clip(), fmax() also replaces NaNs
+        np.fmax(values, 0, out=values)
+        np.fmin(values, num_colors - 1, out=values)
+        indices = _get_tile_buffer('indices', shape, np.uint8 if num_colors <= 256 else np.uint16)
+        np.copyto(indices, values, casting='unsafe')
+
+        if self._palette is not None:
+            if has_no_data:
+                # Fast way to set no-data pixels to _NO_DATA_INDEX, as it is the greatest index
+                no_data_indices = no_data.view(np.uint8)
+                np.multiply(no_data_indices, _NO_DATA_INDEX, out=no_data_indices)
+                np.maximum(indices, no_data_indices, out=indices)
+            image = Image.fromarray(indices, mode='P')
+            image.putpalette(self._palette)
+            return self._encode_image(image)
+
+        # Gather RGBA colors as 32-bit words, so that a single lookup is made per pixel
+        if self._encode and self.format:
+            # The encoded image is a copy, so we can reuse the buffer
+            rgba = _get_tile_buffer('rgba', shape, np.uint32)
+        else:
+            rgba = np.empty(shape, dtype=np.uint32)
+        np.take(lut.view(np.uint32).reshape(num_colors), indices, out=rgba)
+        if has_no_data:
+            # Make no-data pixels fully transparent black, multiplication is much faster than masked assignment
+            np.logical_not(no_data, out=no_data)
+            np.multiply(rgba, no_data, out=rgba)
+        image = Image.fromarray(rgba.view(np.uint8).reshape(shape + (4,)), mode=self.mode)
 
         if self._encode and self.format:
-            ostream = io.BytesIO()
-            image.save(ostream, format=self.format)
-            encoded_image = ostream.getvalue()
-            ostream.close()
-            return encoded_image
+            return self._encode_image(image)
         else:
             return image
 
+    def _encode_image(self, image: Image.Image) -> bytes:
+        if self.format.upper() in ('JPEG', 'JPG'):
+            image = image.convert('RGB')
+        ostream = io.BytesIO()
+        image.save(ostream, format=self.format, **self._save_options)
+        encoded_image = ostream.getvalue()
+        ostream.close()
+        return encoded_image
+
     def create_pyramid(self, **kwargs) -> 'ImagePyramid':
         if self._encode:
             raise TypeError("can't create pyramid from encoded hi-res tiles")
@@ -590,6 +767,50 @@ class NdarrayDownsamplingImage(DownsamplingImage):
         return target_tile
 
 
+def _has_multiple_chunks(array) -> bool:
+    """Test whether the last two dimensions of *array* are split into more than one dask chunk."""
+    chunks = getattr(array, 'chunks', None)
+    return bool(chunks) and (len(chunks[-1]) > 1 or len(chunks[-2]) > 1)
+
+
+def _stride_chunks(array, step: int):
+    """
+    Select every *step*-th element of the last two dimensions of the dask-backed *array*.
+
+    Dask would apply strided indexing to the reads of the underlying file, which is slow for compressed data.
+    Instead, chunk boundaries are moved to multiples of *step*, so that every chunk is read as a whole and
+    then strided in memory.
+    """
+    is_data_array = hasattr(array, 'dims')
+    data = array.data if is_data_array else array
+    aligned_chunks = tuple(_align_chunks(dim_chunks, step) for dim_chunks in data.chunks[-2:])
+    data = data.rechunk(tuple(data.chunks[:-2]) + aligned_chunks)
+    strided_chunks = tuple(tuple((chunk + step - 1) // step for chunk in dim_chunks) for dim_chunks in aligned_chunks)
+    # Unlike a strided getitem, map_blocks() is not fused with the reads
+    data = data.map_blocks(lambda block: block[..., ::step, ::step],
+                           chunks=tuple(data.chunks[:-2]) + strided_chunks,
+                           dtype=data.dtype)
+    if not is_data_array:
+        return data
+    strided_array = array[..., ::step, ::step]
+    return type(array)(data, coords=strided_array.coords, dims=strided_array.dims,
+                       name=strided_array.name, attrs=strided_array.attrs)
+
+
+def _align_chunks(chunks: Tuple[int, ...], step: int) -> Tuple[int, ...]:
+    """Move the boundaries between *chunks* to the nearest multiples of *step*."""
+    size = sum(chunks)
+    boundaries = []
+    offset = 0
+    for chunk in chunks[:-1]:
+        offset += chunk
+        boundary = int(round(offset / step)) * step
+        if 0 < boundary < size and (not boundaries or boundary > boundaries[-1]):
+            boundaries.append(boundary)
+    boundaries.append(size)
+    return tuple(end - start for start, end in zip([0] + boundaries[:-1], boundaries))
+
+
 class FastNdarrayDownsamplingImage(OpImage):
     """
     A tiled image created from down-sampling a numpy ndarray-like array.
@@ -629,20 +850,32 @@ class FastNdarrayDownsamplingImage(OpImage):
         w *= s
         h *= s
 
-        # For performance, we first read the non-resampled tile data.
-        # We could use slices with 'zoom' as step size, but this is incredibly slow when using xarray with dask!
-        # 0.4 vs. 0.025 secs for 220x220 pixel tiles for chunked, compressed SST data.
-        # tile = self._array[..., y:y + h:s, x:x + w:s]
-        tile = self._array[..., y:y + h, x:x + w]
+        if s == 1 or isinstance(self._array, np.ndarray):
+            # For numpy arrays, the strided tile is a view
+            tile = self._array[..., y:y + h:s, x:x + w:s]
+        else:
+            tile = self._array[..., y:y + h, x:x + w]
+            if _has_multiple_chunks(tile):
+                # If the window spans several dask chunks, we stride every chunk after it has been read, so that
+                # the memory required is O(chunk size) rather than O(window size), which at low zoom levels is
+                # O(dataset size): 21.8 vs. 32.2 MB for tiles of zoom level 0 of 7200x3600 SST data in 900x900
+                # chunks, at equal latency, see benchmarks/bench_downsampling.py.
+                tile = _stride_chunks(tile, s)
+            else:
+                # For performance, we first read the non-resampled tile data.
+                # We could use slices with 'zoom' as step size, but this is incredibly slow for lazily indexed
+                # NetCDF variables: 12 vs. 0.14 secs for 256x256 pixel tiles of zoom level 0 of chunked,
+                # compressed 7200x3600 SST data, see benchmarks/bench_downsampling.py.
+                # For in-memory data arrays, the window and the strided tile are views.
+                if hasattr(tile, 'load'):
+                    tile.load()
+                tile = tile[..., ::s, ::s]
 
         # Let's see if it has the xarray.DataArray.load() method.
         # Pre-loading of tile data makes it easier to find bottlenecks in the image processing chain.
         if hasattr(tile, 'load'):
             tile.load()
 
-        # We do the resampling to lower resolution after loading the data, which is MUCH faster, see note above.
-        tile = tile[..., ::s, ::s]
-
         # ensure that our tile size is w x h: resize and fill in background value.
         return self.pad_tile(tile, self.tile_size)
 
@@ -36,6 +36,7 @@ Components
 """
 import signal
 import sys
+import threading
 from abc import ABCMeta, abstractmethod
 from contextlib import contextmanager
 from shutil import get_terminal_size
@@ -252,6 +253,39 @@ class ChildMonitor(Monitor):
         return self._parent_monitor.is_cancelled()
 
 
+class SynchronizedMonitor(Monitor):
+    """
+    A monitor that serializes all calls to a *monitor* which is not thread-safe.
+    Use it to observe tasks that run concurrently, e.g. by creating a child monitor for each task.
+
+    :param monitor: the monitor to be synchronized
+    """
+
+    def __init__(self, monitor: Monitor):
+        self._monitor = monitor
+        self._lock = threading.RLock()
+
+    def start(self, label: str, total_work: float = None):
+        with self._lock:
+            self._monitor.start(label, total_work=total_work)
+
+    def progress(self, work: float = None, msg: str = None):
+        with self._lock:
+            self._monitor.progress(work=work, msg=msg)
+
+    def done(self):
+        with self._lock:
+            self._monitor.done()
+
+    def cancel(self):
+        with self._lock:
+            self._monitor.cancel()
+
+    def is_cancelled(self) -> bool:
+        with self._lock:
+            return self._monitor.is_cancelled()
+
+
 # noinspection PyAbstractClass
 class ConsoleMonitor(Monitor):
     """
@@ -20,15 +20,29 @@
 # SOFTWARE.
 
 import concurrent.futures
+import math
+import os
 import platform
 import re
 import subprocess
 import shlex
+import threading
 import time
-from typing import Callable, Optional, Tuple, Union, Dict, Sequence
+from typing import Callable, Optional, Tuple, Union, Dict, Sequence, List
+
+import psutil
 
 from . import Monitor
 
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# resource.prlimit() is only available on Linux, elsewhere limits are enforced by polling the process
+_HAS_PRLIMIT = resource is not None and hasattr(resource, 'prlimit')
+
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)"
 
 
@@ -42,7 +56,9 @@ def run_subprocess(command: Union[str, Sequence[str]],
                    done_handler: Optional[Callable[[str], None]] = None,
                    is_cancelled: Optional[Callable[[], bool]] = None,
                    cancelled_check_period: float = 0.1,
-                   kill_on_cancel=False):
+                   kill_on_cancel=False,
+                   cpu_time_limit: Optional[float] = None,
+                   memory_limit: Optional[int] = None):
     """
     Execute a child program in a new process.
 
@@ -61,6 +77,11 @@ def run_subprocess(command: Union[str, Sequence[str]],
            Defaults to 0.1 seconds.
     :param kill_on_cancel: Whether to send a SIGKILL rather than a SIGTERM signal when cancellation
            is requested (Unix only)
+    :param cpu_time_limit: An optional limit of the CPU time of the process in seconds.
+    :param memory_limit: An optional limit of the memory of the process in bytes.
+           On Linux, the limits are set as resource limits of the process right after it has been started and
+           are inherited by the processes it creates from then on. On other platforms, the process is killed
+           once its CPU time or resident set size exceeds the limits.
     :return: the program's return code (an `int`) or `None` if it could not be determined.
     """
 
@@ -79,6 +100,10 @@ def run_subprocess(command: Union[str, Sequence[str]],
                                stderr=subprocess.PIPE,
                                bufsize=0)
 
+    # Limits are not set by a preexec_fn, which may deadlock the child if the parent runs other threads
+    if _HAS_PRLIMIT and (cpu_time_limit or memory_limit):
+        _set_limits(process, cpu_time_limit, memory_limit)
+
     if started_handler:
         started_handler(process)
 
@@ -104,12 +129,16 @@ def run_subprocess(command: Union[str, Sequence[str]],
     def _read_line_stderr():
         _read_line(process.stderr, stderr_handler)
 
+    watch_limits = not _HAS_PRLIMIT and (cpu_time_limit or memory_limit)
+
     def _check_cancelled():
-        if is_cancelled is None:
+        if is_cancelled is None and not watch_limits:
             return
         while process.returncode is None:
-            if is_cancelled():
+            if is_cancelled is not None and is_cancelled():
                 _cancel(process, kill_on_cancel)
+            if watch_limits and _exceeds_limits(process, cpu_time_limit, memory_limit):
+                _cancel(process, True)
             time.sleep(cancelled_check_period or 0.1)
 
     def _wait():
@@ -137,6 +166,137 @@ def _cancel(process: subprocess.Popen, kill_on_cancel: bool):
     return True
 
 
+def _set_limits(process: subprocess.Popen, cpu_time_limit: Optional[float], memory_limit: Optional[int]):
+    """Set the resource limits of the child *process*, or kill it, if they cannot be set."""
+    try:
+        if cpu_time_limit:
+            cpu_time = int(math.ceil(cpu_time_limit))
+            resource.prlimit(process.pid, resource.RLIMIT_CPU, (cpu_time, cpu_time))
+        if memory_limit:
+            resource.prlimit(process.pid, resource.RLIMIT_AS, (memory_limit, memory_limit))
+    except ProcessLookupError:
+        # Process has already terminated
+        pass
+    except (OSError, ValueError):
+        # Never let a process run unlimited
+        process.kill()
+        raise
+
+
+def _exceeds_limits(process: subprocess.Popen, cpu_time_limit: Optional[float], memory_limit: Optional[int]) -> bool:
+    try:
+        ps_process = psutil.Process(process.pid)
+        if cpu_time_limit:
+            cpu_times = ps_process.cpu_times()
+            if cpu_times.user + cpu_times.system > cpu_time_limit:
+                return True
+        if memory_limit and ps_process.memory_info().rss > memory_limit:
+            return True
+    except psutil.Error:
+        # Process has already terminated
+        pass
+    return False
+
+
+class ProcessPool:
+    """
+    Runs child programs by :py:func:`run_subprocess`, but at most *max_processes* of them at the same time.
+    Callers wait for a free slot, so a ``ProcessPool`` may be shared by all threads of a program, e.g. by
+    concurrently executed workflow steps.
+
+    :param max_processes: The maximum number of processes running at the same time.
+           Defaults to the number of CPUs.
+    :param cpu_time_limit: Default limit of the CPU time of every process in seconds, see :py:func:`run_subprocess`.
+    :param memory_limit: Default limit of the memory of every process in bytes, see :py:func:`run_subprocess`.
+    """
+
+    def __init__(self,
+                 max_processes: Optional[int] = None,
+                 cpu_time_limit: Optional[float] = None,
+                 memory_limit: Optional[int] = None):
+        self._max_processes = max_processes or os.cpu_count() or 1
+        self._cpu_time_limit = cpu_time_limit
+        self._memory_limit = memory_limit
+        self._semaphore = threading.BoundedSemaphore(self._max_processes)
+        self._lock = threading.Lock()
+        self._num_running = 0
+        self._num_waiting = 0
+
+    @property
+    def max_processes(self) -> int:
+        """The maximum number of processes running at the same time."""
+        return self._max_processes
+
+    @property
+    def num_running(self) -> int:
+        """The number of processes currently running."""
+        return self._num_running
+
+    @property
+    def num_waiting(self) -> int:
+        """The number of callers currently waiting for a free slot."""
+        return self._num_waiting
+
+    def run(self,
+            command: Union[str, Sequence[str]],
+            is_cancelled: Optional[Callable[[], bool]] = None,
+            cancelled_check_period: float = 0.1,
+            cpu_time_limit: Optional[float] = None,
+            memory_limit: Optional[int] = None,
+            **kwargs) -> Optional[int]:
+        """
+        Execute a child program in a new process as soon as fewer than :py:attr:`max_processes` processes
+        of this pool are running.
+
+        :param command: The command to be executed, may be a string or sequence of string arguments.
+        :param is_cancelled: An optional callable that is called to determine whether waiting for a free slot
+               should be given up or the program's process should be killed.
+        :param cancelled_check_period: The time to wait between subsequent *is_cancelled()* calls.
+        :param cpu_time_limit: Limit of the CPU time in seconds, defaults to the limit of this pool.
+        :param memory_limit: Limit of the memory in bytes, defaults to the limit of this pool.
+        :param kwargs: Further keyword arguments passed to :py:func:`run_subprocess`.
+        :return: the program's return code (an `int`) or `None` if it could not be determined
+                 or if the program has been cancelled before it started.
+        """
+        with self._lock:
+            self._num_waiting += 1
+        try:
+            while not self._semaphore.acquire(timeout=cancelled_check_period or 0.1):
+                if is_cancelled is not None and is_cancelled():
+                    return None
+        finally:
+            with self._lock:
+                self._num_waiting -= 1
+        with self._lock:
+            self._num_running += 1
+        try:
+            return run_subprocess(command,
+                                  is_cancelled=is_cancelled,
+                                  cancelled_check_period=cancelled_check_period,
+                                  cpu_time_limit=cpu_time_limit or self._cpu_time_limit,
+                                  memory_limit=memory_limit or self._memory_limit,
+                                  **kwargs)
+        finally:
+            with self._lock:
+                self._num_running -= 1
+            self._semaphore.release()
+
+    def run_all(self, commands: Sequence[Union[str, Sequence[str]]], **kwargs) -> List[Optional[int]]:
+        """
+        Execute many child programs in parallel, but at most :py:attr:`max_processes` at the same time.
+        Handlers passed in *kwargs* are called from several threads.
+
+        :param commands: The commands to be executed.
+        :param kwargs: Further keyword arguments passed to :py:meth:`run`.
+        :return: The programs' return codes in the order of *commands*.
+        """
+        if not commands:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(commands), self._max_processes)) as executor:
+            futures = [executor.submit(self.run, command, **kwargs) for command in commands]
+            return [future.result() for future in futures]
+
+
 class ProcessOutputMonitor:
     """
     A stdout handler for :py:func:`execute` the delegates extracted progress information to a monitor.
@@ -189,7 +349,7 @@ class ProcessOutputMonitor:
         if is_done:
             if self.has_started:
                 monitor.done()
-            self.done = True
+            self.is_done = True
             return
 
         work, msg = self._do_parse_progress(line)
@@ -44,3 +44,4 @@ Components
 
 from .jsonrpchandler import JsonRpcWebSocketHandler
 from .jsonrpcmonitor import JsonRpcWebSocketMonitor
+from .jsonrpcsched import JsonRpcScheduler
@@ -25,14 +25,22 @@ import sys
 import time
 import traceback
 
+import numpy as np
 from tornado.ioloop import IOLoop
 from tornado.web import Application
 from tornado.websocket import WebSocketHandler
 
 from .jsonrpcmonitor import JsonRpcWebSocketMonitor
+from .jsonrpcsched import JsonRpcScheduler, get_default_scheduler
 from ..monitor import Cancellation
 from ..opmetainf import OpMetaInfo
 
+try:
+    import msgpack
+except ImportError:
+    # Optional dependency, responses are always encoded as JSON text without it
+    msgpack = None
+
 __author__ = "Norman Fomferra (Brockmann Consult GmbH)"
 
 _DEBUG_WEB_SOCKET_RPC = False
@@ -46,6 +54,15 @@ ERROR_CODE_METHOD_NOT_SUPPORTED = 40
 ERROR_CODE_CANCEL_IS_INVALID = 50
 ERROR_CODE_METHOD_EXECUTION_CANCELLED = 999
 
+#: WebSocket subprotocol of JSON-RPC messages encoded as JSON text, the default
+JSON_SUBPROTOCOL = 'cate-jsonrpc'
+#: WebSocket subprotocol of JSON-RPC responses encoded as MessagePack binary messages, available only
+#: if the "msgpack" package is installed
+MSGPACK_SUBPROTOCOL = 'cate-jsonrpc-msgpack'
+#: MessagePack extension type of numpy arrays, its data is the MessagePack array [dtype, shape, buffer]
+#: where dtype is a numpy type string such as "<f4" and buffer comprises the array's raw little-endian values
+MSGPACK_EXT_TYPE_NDARRAY = 1
+
 
 # noinspection PyAbstractClass
 class JsonRpcWebSocketHandler(WebSocketHandler):
@@ -57,7 +74,16 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
     :param service_factory: A function that returns the object providing the this service's callable methods.
     :param report_defer_period: The time in seconds between two subsequent progress reports reported to
            a monitor passed to a service method
+    :param compression_level: The zlib compression level (0-9) of messages, if the client supports the
+           "permessage-deflate" WebSocket extension. If ``None``, messages are not compressed.
+    :param scheduler: The scheduler running the service method calls, usually shared by all connections.
+           If not given, the scheduler returned by :py:func:`get_default_scheduler` is used.
     :param kwargs: Keyword-arguments passed to the request handler.
+
+    Clients may request the WebSocket subprotocol :py:data:`MSGPACK_SUBPROTOCOL` to receive responses encoded
+    as MessagePack binary messages rather than JSON text, so that numbers and numpy arrays are sent without
+    converting them to text. Such clients may send requests in either encoding. Progress messages are always
+    JSON text.
     """
 
     def __init__(self,
@@ -65,6 +91,8 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
                  request,
                  service_factory=None,
                  report_defer_period: float = None,
+                 compression_level: int = None,
+                 scheduler: JsonRpcScheduler = None,
                  **kwargs):
         super(JsonRpcWebSocketHandler, self).__init__(application, request, **kwargs)
         if not service_factory:
@@ -73,11 +101,26 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
         self._service_factory = service_factory
         self._service = None
         self._service_method_meta_infos = None
-        self._thread_pool = concurrent.futures.ThreadPoolExecutor()
+        self._scheduler = scheduler or get_default_scheduler()
         self._active_monitors = {}
         self._active_futures = {}
         self._job_start = {}
         self._report_defer_period = report_defer_period
+        self._compression_level = compression_level
+        self._use_msgpack = False
+
+    def get_compression_options(self):
+        if self._compression_level is None:
+            return None
+        return dict(compression_level=self._compression_level)
+
+    def select_subprotocol(self, subprotocols):
+        if msgpack is not None and MSGPACK_SUBPROTOCOL in subprotocols:
+            self._use_msgpack = True
+            return MSGPACK_SUBPROTOCOL
+        if JSON_SUBPROTOCOL in subprotocols:
+            return JSON_SUBPROTOCOL
+        return None
 
     def open(self):
         if _DEBUG_WEB_SOCKET_RPC:
@@ -96,6 +139,11 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
     def on_close(self):
         if _DEBUG_WEB_SOCKET_RPC:
             print("DEBUG: JsonRpcWebSocketHandler.on_close")
+        # Drop the calls still waiting in the scheduler's lanes, which are shared by all connections,
+        # so that they don't occupy workers. Running calls cannot be cancelled this way and run to completion.
+        for future in self._active_futures.values():
+            future.cancel()
+        self._active_futures.clear()
         self._service = None
         self._service_method_meta_infos = None
 
@@ -108,13 +156,16 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
             print("DEBUG: JsonRpcWebSocketHandler.check_origin(%s)" % repr(origin))
         return True
 
-    def on_message(self, message: str):
+    def on_message(self, message):
         # Note, the following error cases 1-4 cannot be communicated to client as we
         # haven't got a valid method "id" which is required for a JSON-RPC response
 
         # noinspection PyBroadException
         try:
-            message_obj = json.loads(message)
+            if isinstance(message, bytes) and self._use_msgpack:
+                message_obj = msgpack.unpackb(message, raw=False)
+            else:
+                message_obj = json.loads(message)
         except:
             print("ERROR: Failed to parse incoming JSON-RPC message: {}".format(message))
             traceback.print_exc(file=sys.stdout)
@@ -147,8 +198,13 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
 
         if hasattr(self._service, method_name):
             self._job_start[method_id] = time.time()
-            future = self._thread_pool.submit(self.call_service_method,
-                                              method_id, method_name, method_params)
+            op_meta_info = self._get_service_method_meta_info(method_name)
+            future = self._scheduler.submit(self.call_service_method,
+                                            method_id, method_name, method_params,
+                                            connection=self,
+                                            method_name=method_name,
+                                            slow=self._scheduler.is_slow_method(method_name,
+                                                                                op_meta_info.has_monitor))
             self._active_futures[method_id] = future
 
             def _send_service_method_result(f: concurrent.futures.Future) -> None:
@@ -188,6 +244,9 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
             return 6  # for testing only
 
     def send_service_method_result(self, method_id: int, method_name: str, future: concurrent.futures.Future):
+        if self.ws_connection is None:
+            # Connection has been closed, nobody is waiting for the result
+            return
         try:
             result = future.result()
         except (concurrent.futures.CancelledError, Cancellation):
@@ -232,17 +291,23 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
     def _write_json_rpc_response(self, json_rpc_response: dict) -> bool:
         # noinspection PyBroadException
         try:
-            json_text = json.dumps(json_rpc_response)
+            if self._use_msgpack:
+                message = msgpack.packb(json_rpc_response, default=_to_msgpack_ext, use_bin_type=True)
+            else:
+                message = json.dumps(json_rpc_response)
         except Exception:
             stack_trace = traceback.format_exc()
             print(stack_trace, file=sys.stderr, flush=True)
             return False
 
-        self.write_message(json_text)
+        self.write_message(message, binary=self._use_msgpack)
 
         if _DEBUG_WEB_SOCKET_RPC:
             method_id = json_rpc_response.get('id')
-            print("DEBUG: RPC [%s] <== %s" % (method_id, json_text))
+            if self._use_msgpack:
+                print("DEBUG: RPC [%s] <== %s bytes of MessagePack" % (method_id, len(message)))
+            else:
+                print("DEBUG: RPC [%s] <== %s" % (method_id, message))
 
         return True
 
@@ -254,11 +319,7 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
         assert self._service is not None
         method = getattr(self._service, method_name)
 
-        assert self._service_method_meta_infos is not None
-        op_meta_info = self._service_method_meta_infos.get(method_name)
-        if op_meta_info is None:
-            op_meta_info = OpMetaInfo.introspect_operation(method)
-            self._service_method_meta_infos[method_name] = op_meta_info
+        op_meta_info = self._get_service_method_meta_info(method_name)
 
         # Check if we need a ProgressMonitor impl. here.
         if op_meta_info.has_monitor:
@@ -281,6 +342,25 @@ class JsonRpcWebSocketHandler(WebSocketHandler):
 
         return result
 
+    def _get_service_method_meta_info(self, method_name: str) -> OpMetaInfo:
+        assert self._service_method_meta_infos is not None
+        op_meta_info = self._service_method_meta_infos.get(method_name)
+        if op_meta_info is None:
+            op_meta_info = OpMetaInfo.introspect_operation(getattr(self._service, method_name))
+            self._service_method_meta_infos[method_name] = op_meta_info
+        return op_meta_info
+
+
+def _to_msgpack_ext(obj):
+    if isinstance(obj, np.ndarray) and obj.dtype.kind in 'biufc':
+        array = np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder('<'))
+        return msgpack.ExtType(MSGPACK_EXT_TYPE_NDARRAY,
+                               msgpack.packb([array.dtype.str, list(array.shape), array.tobytes()],
+                                             use_bin_type=True))
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError('object of type %s cannot be encoded as MessagePack' % type(obj).__name__)
+
 
 def set_debug_web_socket_rpc(value: bool):
     """ For testing only """
@@ -0,0 +1,247 @@
+# The MIT License (MIT)
+# Copyright (c) 2016, 2017 by the ESA CCI Toolbox development team and contributors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of
+# this software and associated documentation files (the "Software"), to deal in
+# the Software without restriction, including without limitation the rights to
+# use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+# of the Software, and to permit persons to whom the Software is furnished to do
+# so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import concurrent.futures
+import threading
+import time
+from typing import Dict, Iterable, Optional
+
+__author__ = "Norman Fomferra (Brockmann Consult GmbH)"
+
+#: Lane of JSON-RPC calls that complete quickly, e.g. calls returning metadata
+FAST_LANE = 'fast'
+#: Lane of long-running JSON-RPC calls, e.g. calls opening or computing workspace resources
+SLOW_LANE = 'slow'
+
+
+class JsonRpcScheduler:
+    """
+    A bounded scheduler for the JSON-RPC method calls of all WebSocket connections of a process.
+
+    Calls run in one of two lanes, each of which has its own, bounded number of worker threads, so that
+    long-running calls never keep quick calls waiting. Within a lane, calls run in the order they have been
+    submitted, unless a call would exceed the number of calls of its connection that may run in the lane
+    at a time, or the number of calls of its method that may run at a time. Such calls wait while later
+    calls run. Calls whose futures have been cancelled while waiting are dropped.
+
+    :param fast_max_workers: maximum number of calls running in parallel in the fast lane
+    :param slow_max_workers: maximum number of calls running in parallel in the slow lane
+    :param max_calls_per_connection: optional maximum number of calls of a single connection running in parallel
+           in the same lane
+    :param method_limits: optional mapping of method names to the maximum number of calls of the method running
+           in parallel
+    :param slow_methods: optional names of the methods whose calls run in the slow lane, in addition to
+           calls of methods that report progress, see :py:meth:`is_slow_method`.
+    """
+
+    class _Task:
+        __slots__ = ('future', 'fn', 'args', 'kwargs', 'connection', 'method_name', 'submit_time')
+
+        def __init__(self, future, fn, args, kwargs, connection, method_name, submit_time):
+            self.future = future
+            self.fn = fn
+            self.args = args
+            self.kwargs = kwargs
+            self.connection = connection
+            self.method_name = method_name
+            self.submit_time = submit_time
+
+    class _Lane:
+        def __init__(self, name: str, max_workers: int, lock: threading.Lock):
+            self.name = name
+            self.max_workers = max_workers
+            self.condition = threading.Condition(lock)
+            self.tasks = []
+            self.workers = []
+            self.num_running = 0
+            self.num_completed = 0
+            self.total_wait_time = 0.
+            self.max_wait_time = 0.
+            # Maps connections to the number of their calls running in this lane
+            self.connection_num_running = dict()
+
+    def __init__(self,
+                 fast_max_workers: int = 4,
+                 slow_max_workers: int = 2,
+                 max_calls_per_connection: int = None,
+                 method_limits: Dict[str, int] = None,
+                 slow_methods: Iterable[str] = None):
+        if fast_max_workers < 1 or slow_max_workers < 1:
+            raise ValueError('fast_max_workers and slow_max_workers must be positive')
+        if max_calls_per_connection is not None and max_calls_per_connection < 1:
+            raise ValueError('max_calls_per_connection must be positive')
+        self._lock = threading.Lock()
+        self._lanes = {FAST_LANE: JsonRpcScheduler._Lane(FAST_LANE, fast_max_workers, self._lock),
+                       SLOW_LANE: JsonRpcScheduler._Lane(SLOW_LANE, slow_max_workers, self._lock)}
+        self._max_calls_per_connection = max_calls_per_connection
+        self._method_limits = dict(method_limits or {})
+        self._slow_methods = set(slow_methods or ())
+        # Maps method names to the number of their calls running and completed
+        self._method_num_running = dict()
+        self._method_num_completed = dict()
+
+    def is_slow_method(self, method_name: str, has_monitor: bool = False) -> bool:
+        """
+        Test whether calls of the method named *method_name* run in the slow lane.
+
+        :param method_name: The method name.
+        :param has_monitor: Whether the method reports progress to a monitor.
+        :return: ``True``, if the method has a monitor or is one of the *slow_methods* passed to the constructor.
+        """
+        return has_monitor or method_name in self._slow_methods
+
+    def submit(self, fn, *args, connection=None, method_name: str = None, slow: bool = False,
+               **kwargs) -> concurrent.futures.Future:
+        """
+        Submit a call.
+
+        :param fn: the callable performing the call
+        :param args: positional arguments passed to *fn*
+        :param connection: optional connection the call has been received from
+        :param method_name: optional name of the called method
+        :param slow: whether the call runs in the slow lane
+        :param kwargs: keyword arguments passed to *fn*
+        :return: a future
+        """
+        lane = self._lanes[SLOW_LANE if slow else FAST_LANE]
+        future = concurrent.futures.Future()
+        with self._lock:
+            lane.tasks.append(JsonRpcScheduler._Task(future, fn, args, kwargs, connection, method_name,
+                                                     time.perf_counter()))
+            if len(lane.workers) < lane.max_workers and len(lane.workers) < lane.num_running + len(lane.tasks):
+                worker = threading.Thread(target=self._run_worker, args=(lane,),
+                                          name='JsonRpcScheduler-%s-%d' % (lane.name, len(lane.workers)))
+                worker.daemon = True
+                worker.start()
+                lane.workers.append(worker)
+            lane.condition.notify()
+        return future
+
+    def get_metrics(self) -> dict:
+        """
+        Get the queue metrics of this scheduler.
+
+        :return: A JSON-serializable dictionary
+        """
+        with self._lock:
+            lanes = {}
+            connections = set()
+            method_num_waiting = {}
+            for lane in self._lanes.values():
+                self._discard_cancelled_tasks(lane)
+                for task in lane.tasks:
+                    connections.add(task.connection)
+                    method_num_waiting[task.method_name] = method_num_waiting.get(task.method_name, 0) + 1
+                connections.update(lane.connection_num_running.keys())
+                lanes[lane.name] = dict(max_workers=lane.max_workers,
+                                        num_workers=len(lane.workers),
+                                        num_running=lane.num_running,
+                                        num_waiting=len(lane.tasks),
+                                        num_completed=lane.num_completed,
+                                        mean_wait_time=lane.total_wait_time / lane.num_completed
+                                        if lane.num_completed else 0.,
+                                        max_wait_time=lane.max_wait_time)
+            method_names = set(self._method_num_running) | set(self._method_num_completed) | set(method_num_waiting)
+            methods = {method_name: dict(num_running=self._method_num_running.get(method_name, 0),
+                                         num_waiting=method_num_waiting.get(method_name, 0),
+                                         num_completed=self._method_num_completed.get(method_name, 0))
+                       for method_name in method_names if method_name is not None}
+            connections.discard(None)
+            return dict(lanes=lanes, methods=methods, num_connections=len(connections))
+
+    @classmethod
+    def _discard_cancelled_tasks(cls, lane: 'JsonRpcScheduler._Lane'):
+        # Must be called while holding self._lock
+        if any(task.future.cancelled() for task in lane.tasks):
+            lane.tasks = [task for task in lane.tasks if not task.future.cancelled()]
+
+    def _pop_next_task(self, lane: 'JsonRpcScheduler._Lane') -> Optional['JsonRpcScheduler._Task']:
+        # Must be called while holding self._lock
+        for index, task in enumerate(lane.tasks):
+            if self._max_calls_per_connection is not None and task.connection is not None \
+                    and lane.connection_num_running.get(task.connection, 0) >= self._max_calls_per_connection:
+                continue
+            method_limit = self._method_limits.get(task.method_name)
+            if method_limit is not None and self._method_num_running.get(task.method_name, 0) >= method_limit:
+                continue
+            del lane.tasks[index]
+            return task
+        return None
+
+    def _run_worker(self, lane: 'JsonRpcScheduler._Lane'):
+        while True:
+            with self._lock:
+                while True:
+                    self._discard_cancelled_tasks(lane)
+                    task = self._pop_next_task(lane)
+                    if task is not None:
+                        break
+                    lane.condition.wait()
+                wait_time = time.perf_counter() - task.submit_time
+                lane.total_wait_time += wait_time
+                lane.max_wait_time = max(lane.max_wait_time, wait_time)
+                lane.num_running += 1
+                lane.connection_num_running[task.connection] = lane.connection_num_running.get(task.connection, 0) + 1
+                self._method_num_running[task.method_name] = self._method_num_running.get(task.method_name, 0) + 1
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        result = task.fn(*task.args, **task.kwargs)
+                    except BaseException as error:
+                        task.future.set_exception(error)
+                    else:
+                        task.future.set_result(result)
+            finally:
+                with self._lock:
+                    lane.num_running -= 1
+                    lane.num_completed += 1
+                    _decrement(lane.connection_num_running, task.connection)
+                    _decrement(self._method_num_running, task.method_name)
+                    self._method_num_completed[task.method_name] = \
+                        self._method_num_completed.get(task.method_name, 0) + 1
+                    # Waiting calls of any lane may now be within their limits
+                    for other_lane in self._lanes.values():
+                        other_lane.condition.notify_all()
+
+
+def _decrement(counts: dict, key) -> None:
+    count = counts[key] - 1
+    if count > 0:
+        counts[key] = count
+    else:
+        del counts[key]
+
+
+_DEFAULT_SCHEDULER = None
+_DEFAULT_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_default_scheduler() -> JsonRpcScheduler:
+    """
+    Get the scheduler used by JSON-RPC WebSocket handlers that have not been given a scheduler.
+    It is created on first use with default settings.
+    """
+    global _DEFAULT_SCHEDULER
+    with _DEFAULT_SCHEDULER_LOCK:
+        if _DEFAULT_SCHEDULER is None:
+            _DEFAULT_SCHEDULER = JsonRpcScheduler()
+        return _DEFAULT_SCHEDULER
@@ -53,14 +53,17 @@ from datetime import date
 from tornado.web import Application, StaticFileHandler
 from matplotlib.backends.backend_webagg_core import FigureManagerWebAgg
 
+from cate.conf import get_config_value
 from cate.conf.defaults import WEBAPI_LOG_FILE_PREFIX,  \
-    WEBAPI_PROGRESS_DEFER_PERIOD
+    WEBAPI_PROGRESS_DEFER_PERIOD, WEBAPI_WEBSOCKET_COMPRESSION_LEVEL, WEBAPI_RPC_FAST_MAX_WORKERS, \
+    WEBAPI_RPC_SLOW_MAX_WORKERS, WEBAPI_RPC_MAX_CALLS_PER_CONNECTION, WEBAPI_RPC_METHOD_LIMITS, \
+    WEBAPI_RPC_SLOW_METHODS
 from cate.core.wsmanag import FSWorkspaceManager
-from cate.util.web import JsonRpcWebSocketHandler
+from cate.util.web import JsonRpcWebSocketHandler, JsonRpcScheduler
 from cate.util.web.webapi import run_main, url_pattern, WebAPIRequestHandler, WebAPIExitHandler
 from cate.version import __version__
 from cate.webapi.rest import ResourcePlotHandler, CountriesGeoJSONHandler, ResVarTileHandler, ResVarGeoJSONHandler, \
-    ResVarCsvHandler, NE2Handler
+    ResVarCsvHandler, ResVarCoordsHandler, NE2Handler, _on_workspace_closed
 from cate.webapi.mpl import MplJavaScriptHandler, MplDownloadHandler, MplWebSocketHandler
 from cate.webapi.websocket import WebSocketService
 
@@ -80,8 +83,15 @@ class WebAPIVersionHandler(WebAPIRequestHandler):
                                       'timestamp': date.today().isoformat()})
 
 
+# noinspection PyAbstractClass
+class JsonRpcMetricsHandler(WebAPIRequestHandler):
+    def get(self):
+        self.write_status_ok(content=self.application.json_rpc_scheduler.get_metrics())
+
+
 def service_factory(application):
-    return WebSocketService(application.workspace_manager)
+    return WebSocketService(application.workspace_manager,
+                            on_workspace_closed=lambda base_dir: _on_workspace_closed(application, base_dir))
 
 
 # All JSON REST responses should have same structure, namely a dictionary as follows:
@@ -93,6 +103,14 @@ def service_factory(application):
 # }
 
 def create_application():
+    json_rpc_scheduler = JsonRpcScheduler(
+        fast_max_workers=get_config_value('rpc_fast_max_workers', WEBAPI_RPC_FAST_MAX_WORKERS),
+        slow_max_workers=get_config_value('rpc_slow_max_workers', WEBAPI_RPC_SLOW_MAX_WORKERS),
+        max_calls_per_connection=get_config_value('rpc_max_calls_per_connection',
+                                                  WEBAPI_RPC_MAX_CALLS_PER_CONNECTION),
+        method_limits=get_config_value('rpc_method_limits', WEBAPI_RPC_METHOD_LIMITS),
+        slow_methods=get_config_value('rpc_slow_methods', WEBAPI_RPC_SLOW_METHODS))
+
     application = Application([
         ('/_static/(.*)', StaticFileHandler, {'path': FigureManagerWebAgg.get_static_file_path()}),
         ('/mpl.js', MplJavaScriptHandler),
@@ -102,17 +120,24 @@ def create_application():
 
         (url_pattern('/'), WebAPIVersionHandler),
         (url_pattern('/exit'), WebAPIExitHandler),
-        (url_pattern('/api'), JsonRpcWebSocketHandler, dict(service_factory=service_factory,
-                                                            report_defer_period=WEBAPI_PROGRESS_DEFER_PERIOD)),
+        (url_pattern('/api'), JsonRpcWebSocketHandler,
+         dict(service_factory=service_factory,
+              report_defer_period=WEBAPI_PROGRESS_DEFER_PERIOD,
+              compression_level=get_config_value('websocket_compression_level',
+                                                 WEBAPI_WEBSOCKET_COMPRESSION_LEVEL),
+              scheduler=json_rpc_scheduler)),
+        (url_pattern('/api/metrics'), JsonRpcMetricsHandler),
         (url_pattern('/ws/res/plot/{{base_dir}}/{{res_name}}'), ResourcePlotHandler),
         (url_pattern('/ws/countries/{{zoom}}'), CountriesGeoJSONHandler),
         (url_pattern('/ws/res/geojson/{{base_dir}}/{{res_name}}/{{zoom}}'), ResVarGeoJSONHandler),
         (url_pattern('/ws/res/csv/{{base_dir}}/{{res_name}}'), ResVarCsvHandler),
+        (url_pattern('/ws/res/coords/{{base_dir}}/{{res_name}}'), ResVarCoordsHandler),
         (url_pattern('/ws/res/tile/{{base_dir}}/{{res_name}}/{{z}}/{{y}}/{{x}}.png'), ResVarTileHandler),
         (url_pattern('/ws/ne2/tile/{{z}}/{{y}}/{{x}}.jpg'), NE2Handler),
 
     ])
     application.workspace_manager = FSWorkspaceManager()
+    application.json_rpc_scheduler = json_rpc_scheduler
     return application
 
 
@@ -24,9 +24,15 @@ __author__ = "Norman Fomferra (Brockmann Consult GmbH), " \
 
 import concurrent.futures
 import datetime
+import functools
+import hashlib
+import json
 import os.path
+import threading
 import time
 import traceback
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
 
 import fiona
 import numpy as np
@@ -35,30 +41,38 @@ import tornado.web
 import xarray as xr
 
 from .geojson import write_feature_collection
-from ..conf import get_config
+from ..conf import get_config, get_config_path, get_config_value
 from ..conf.defaults import \
-    WORKSPACE_CACHE_DIR_NAME, \
-    WEBAPI_WORKSPACE_FILE_TILE_CACHE_CAPACITY, \
+    WEBAPI_FILE_TILE_CACHE_DIR, \
+    WEBAPI_FILE_TILE_CACHE_CAPACITY, \
+    WEBAPI_MAX_NUM_IMAGE_PYRAMIDS, \
     WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY, \
+    WEBAPI_WORKSPACE_MEM_TILE_CACHE_NUM_STRIPES, \
     WEBAPI_ON_ALL_CLOSED_AUTO_STOP_AFTER, \
+    WEBAPI_TILE_COMPUTE_MAX_WORKERS, \
+    WEBAPI_TILE_COMPUTE_MAX_QUEUE_SIZE, \
+    WEBAPI_TILE_FORMAT, \
+    WEBAPI_TILE_COMPRESS_LEVEL, \
+    WEBAPI_TILE_QUALITY, \
     WEBAPI_USE_WORKSPACE_IMAGERY_CACHE
 from ..core.cdm import get_tiling_scheme
 from ..util import ConsoleMonitor
 from ..util import Monitor
-from ..util.cache import Cache, MemoryCacheStore, FileCacheStore
+from ..util import object_to_qualified_name, to_json
+from ..util.cache import Cache, StripedCache, MemoryCacheStore, FileCacheStore, POLICY_LRU
 from ..util.im import ImagePyramid, TransformArrayImage, ColorMappedRgbaImage
 from ..util.im.ds import NaturalEarth2Image
 from ..util.misc import cwd
 from ..util.web.webapi import WebAPIRequestHandler, check_for_auto_stop
-from ..version import __version__
 
 # TODO (forman): We must keep a MemoryCacheStore Cache for each workspace.
 #                We can use the Workspace.user_data dict for this purpose.
 #                However, a global cache is fine as long as we have just one workspace open at a time.
 #
-MEM_TILE_CACHE = Cache(MemoryCacheStore(),
-                       capacity=WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY,
-                       threshold=0.75)
+MEM_TILE_CACHE = StripedCache(MemoryCacheStore(),
+                              capacity=WEBAPI_WORKSPACE_MEM_TILE_CACHE_CAPACITY,
+                              threshold=0.75,
+                              num_stripes=WEBAPI_WORKSPACE_MEM_TILE_CACHE_NUM_STRIPES)
 
 USE_WORKSPACE_IMAGERY_CACHE = get_config().get('use_workspace_imagery_cache', WEBAPI_USE_WORKSPACE_IMAGERY_CACHE)
 
@@ -71,6 +85,45 @@ __import__('cate.ds')
 __import__('cate.ops')
 
 
+_FILE_TILE_CACHE = None
+_FILE_TILE_CACHE_LOCK = threading.Lock()
+
+
+def get_file_tile_cache() -> Cache:
+    """
+    Get the file cache for encoded image tiles which is shared by all workspaces.
+    It is created on first use and then indexes all tile files written by previous or concurrent sessions.
+    """
+    global _FILE_TILE_CACHE
+    with _FILE_TILE_CACHE_LOCK:
+        if _FILE_TILE_CACHE is None:
+            cache_dir = get_config_path('file_tile_cache_dir', WEBAPI_FILE_TILE_CACHE_DIR)
+            capacity = get_config_value('file_tile_cache_capacity', WEBAPI_FILE_TILE_CACHE_CAPACITY)
+            _FILE_TILE_CACHE = Cache(FileCacheStore(cache_dir, '.png'),
+                                     capacity=capacity,
+                                     threshold=0.75,
+                                     policy=POLICY_LRU)
+        return _FILE_TILE_CACHE
+
+
+def _get_resource_content_version(workspace, res_name: str) -> Optional[str]:
+    """
+    Compute a version string for the content of the resource *res_name*. It is a hash value computed from
+    the workflow steps required to compute the resource, hence it stays the same across server sessions.
+    """
+    try:
+        steps = workspace.workflow.find_steps_to_compute(res_name)
+    except ValueError:
+        return None
+    # base_dir is included, because steps may refer to files relative to it
+    return _hash_json([workspace.base_dir] + [step.to_json_dict() for step in steps])
+
+
+def _hash_json(obj) -> str:
+    json_text = json.dumps(obj, sort_keys=True, default=str)
+    return hashlib.sha1(json_text.encode('utf-8')).hexdigest()
+
+
 # noinspection PyAbstractClass
 class NE2Handler(WebAPIRequestHandler):
     PYRAMID = NaturalEarth2Image.get_pyramid()
@@ -81,16 +134,258 @@ class NE2Handler(WebAPIRequestHandler):
         self.write(NE2Handler.PYRAMID.get_tile(int(x), int(y), int(z)))
 
 
+class _TileRequestError(ValueError):
+    """
+    Raised if a tile request cannot be served because of invalid request parameters.
+    """
+
+
+class TileExecutor:
+    """
+    A bounded, prioritizing executor for tile computations, so that they never block Tornado's IOLoop thread.
+
+    Tile computations are submitted for a *group*, e.g. a workspace, and a pyramid *level*. Queued computations
+    for the level most recently requested within their group are run first, and among those the most recently
+    submitted ones, because they most likely are the ones the user currently looks at.
+    Computations whose futures have been cancelled while queued, e.g. because the client closed the connection,
+    are dropped.
+
+    :param max_workers: maximum number of tiles computed in parallel
+    :param max_queue_size: maximum number of tile computations either running or waiting to be run
+    """
+
+    class _Task:
+        __slots__ = ('future', 'fn', 'group', 'level', 'sequence')
+
+        def __init__(self, future, fn, group, level, sequence):
+            self.future = future
+            self.fn = fn
+            self.group = group
+            self.level = level
+            self.sequence = sequence
+
+    def __init__(self, max_workers: int, max_queue_size: int):
+        self._max_workers = max_workers
+        self._max_queue_size = max_queue_size
+        self._tasks = []
+        self._latest_levels = dict()
+        self._sequence = 0
+        self._num_running = 0
+        self._workers = []
+        self._condition = threading.Condition()
+
+    @property
+    def max_workers(self) -> int:
+        return self._max_workers
+
+    @property
+    def max_queue_size(self) -> int:
+        return self._max_queue_size
+
+    @property
+    def num_pending(self) -> int:
+        with self._condition:
+            self._discard_cancelled_tasks()
+            return len(self._tasks) + self._num_running
+
+    def submit(self, fn: Callable[[], Any], group=None, level: int = None) -> Optional[concurrent.futures.Future]:
+        """
+        Submit a tile computation.
+
+        :param fn: the tile computation, called without arguments, use :py:func:`functools.partial` to bind them
+        :param group: optional group, e.g. a workspace, in which *level* is the most recently requested one
+        :param level: optional pyramid level of the tile
+        :return: a future, or None if *max_queue_size* pending computations are already reached.
+        """
+        with self._condition:
+            self._discard_cancelled_tasks()
+            if len(self._tasks) + self._num_running >= self._max_queue_size:
+                return None
+            future = concurrent.futures.Future()
+            self._sequence += 1
+            self._tasks.append(TileExecutor._Task(future, fn, group, level, self._sequence))
+            if level is not None:
+                self._latest_levels[group] = level
+            if len(self._workers) < self._max_workers:
+                worker = threading.Thread(target=self._run_worker, name='TileExecutor-%d' % len(self._workers))
+                worker.daemon = True
+                worker.start()
+                self._workers.append(worker)
+            self._condition.notify()
+            return future
+
+    def forget_group(self, group=None) -> None:
+        """
+        Forget the most recently requested level of *group*, e.g. a closed workspace, or of all groups
+        if *group* is None.
+        """
+        with self._condition:
+            if group is None:
+                self._latest_levels.clear()
+            else:
+                self._latest_levels.pop(group, None)
+
+    def _discard_cancelled_tasks(self):
+        # Must be called while holding self._condition
+        if any(task.future.cancelled() for task in self._tasks):
+            self._tasks = [task for task in self._tasks if not task.future.cancelled()]
+
+    def _pop_next_task(self) -> 'TileExecutor._Task':
+        # Must be called while holding self._condition and with self._tasks being non-empty
+        latest_levels = self._latest_levels
+        next_task = min(self._tasks,
+                        key=lambda task: (task.level != latest_levels.get(task.group), -task.sequence))
+        self._tasks.remove(next_task)
+        return next_task
+
+    def _run_worker(self):
+        while True:
+            with self._condition:
+                self._discard_cancelled_tasks()
+                while not self._tasks:
+                    self._condition.wait()
+                    self._discard_cancelled_tasks()
+                task = self._pop_next_task()
+                self._num_running += 1
+            try:
+                if task.future.set_running_or_notify_cancel():
+                    try:
+                        result = task.fn()
+                    except BaseException as error:
+                        task.future.set_exception(error)
+                    else:
+                        task.future.set_result(result)
+            finally:
+                with self._condition:
+                    self._num_running -= 1
+
+
+TILE_EXECUTOR = TileExecutor(max_workers=get_config().get('tile_compute_max_workers',
+                                                          WEBAPI_TILE_COMPUTE_MAX_WORKERS),
+                             max_queue_size=get_config().get('tile_compute_max_queue_size',
+                                                             WEBAPI_TILE_COMPUTE_MAX_QUEUE_SIZE))
+
+
+class ImagePyramidRegistry:
+    """
+    An LRU-bounded registry of the image pyramids created for workspace resources.
+
+    A pyramid is registered together with the update count of its resource in the workspace's resource cache.
+    Once the resource has been updated, its pyramid is considered stale and is disposed on next access.
+    Pyramids are also disposed if they are evicted or if their workspace is closed. Disposing a pyramid
+    releases its tiles from the tile caches.
+
+    :param capacity: the maximum number of pyramids kept
+    """
+
+    def __init__(self, capacity: int):
+        self._capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Tuple, update_count: int) -> Optional[ImagePyramid]:
+        """
+        Get the pyramid registered for *key* and *update_count*.
+
+        :param key: the pyramid key, its first element must be the workspace's base directory
+        :param update_count: the resource's current update count
+        :return: the pyramid or ``None``
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] == update_count:
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+        self._dispose_entries([entry])
+        return None
+
+    def put(self, key: Tuple, update_count: int, pyramid: ImagePyramid,
+            disposables: List[ImagePyramid] = None) -> ImagePyramid:
+        """
+        Register *pyramid* for *key* and *update_count*, unless another thread has registered one in the meantime.
+
+        :param key: the pyramid key, its first element must be the workspace's base directory
+        :param update_count: the resource's current update count
+        :param pyramid: the pyramid
+        :param disposables: the pyramids to be disposed once *pyramid* is no longer used, defaults to *pyramid*
+        :return: the registered pyramid
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == update_count:
+                self._entries.move_to_end(key)
+                return entry[1]
+            obsolete_entries = []
+            if entry is not None:
+                # The resource has been updated in the meantime
+                obsolete_entries.append(self._entries.pop(key))
+            self._entries[key] = update_count, pyramid, disposables or [pyramid]
+            while len(self._entries) > self._capacity:
+                obsolete_entries.append(self._entries.popitem(last=False)[1])
+        self._dispose_entries(obsolete_entries)
+        return pyramid
+
+    def dispose_workspace(self, base_dir: str = None) -> None:
+        """
+        Dispose all pyramids of the workspace given by *base_dir*, or all pyramids if *base_dir* is ``None``.
+        """
+        with self._lock:
+            keys = [key for key in self._entries.keys() if base_dir is None or key[0] == base_dir]
+            obsolete_entries = [self._entries.pop(key) for key in keys]
+        self._dispose_entries(obsolete_entries)
+
+    @classmethod
+    def _dispose_entries(cls, entries) -> None:
+        for _, _, disposables in entries:
+            for pyramid in disposables:
+                pyramid.dispose()
+
+
+IMAGE_PYRAMIDS = ImagePyramidRegistry(get_config().get('max_num_image_pyramids', WEBAPI_MAX_NUM_IMAGE_PYRAMIDS))
+
+
+#: Supported tile formats, maps a format name to (PIL format name, palette mode?, content type)
+TILE_FORMATS = {
+    'png': ('PNG', False, 'image/png'),
+    'png8': ('PNG', True, 'image/png'),
+    'webp': ('WEBP', False, 'image/webp'),
+    'jpeg': ('JPEG', False, 'image/jpeg'),
+}
+
+TILE_FORMAT = get_config().get('tile_format', WEBAPI_TILE_FORMAT)
+TILE_COMPRESS_LEVEL = get_config().get('tile_compress_level', WEBAPI_TILE_COMPRESS_LEVEL)
+TILE_QUALITY = get_config().get('tile_quality', WEBAPI_TILE_QUALITY)
+
+
+def _get_tile_save_options(tile_format: str, compress_level: int, quality: int) -> dict:
+    """Get the keyword arguments passed to PIL.Image.save() for the given tile format."""
+    if TILE_FORMATS[tile_format][0] == 'PNG':
+        return dict(compress_level=compress_level)
+    return dict(quality=quality)
+
+
 # noinspection PyAbstractClass
 class ResVarTileHandler(WebAPIRequestHandler):
-    PYRAMIDS = None
 
-    def get(self, base_dir, res_name, z, y, x):
+    def __init__(self, application, request, **kwargs):
+        super(ResVarTileHandler, self).__init__(application, request, **kwargs)
+        self._tile_future = None
+
+    def on_connection_close(self):
+        # The client is no longer interested in the tile, e.g. because the user panned or zoomed away
+        if self._tile_future is not None:
+            self._tile_future.cancel()
 
-        if not ResVarTileHandler.PYRAMIDS:
-            ResVarTileHandler.PYRAMIDS = dict()
+    @tornado.gen.coroutine
+    def get(self, base_dir, res_name, z, y, x):
 
-        # GLOBAL_LOCK.acquire()
         workspace_manager = self.application.workspace_manager
         workspace = workspace_manager.get_workspace(base_dir)
 
@@ -109,105 +404,177 @@ class ResVarTileHandler(WebAPIRequestHandler):
         cmap_name = self.get_query_argument('cmap', default='jet')
         cmap_min = float(self.get_query_argument('min', default='nan'))
         cmap_max = float(self.get_query_argument('max', default='nan'))
+        tile_format = self.get_query_argument('format', default=TILE_FORMAT).lower()
+        if tile_format not in TILE_FORMATS:
+            self.write_status_error(message='Unknown tile format "%s", must be one of %s'
+                                            % (tile_format, ', '.join(sorted(TILE_FORMATS.keys()))))
+            return
+        try:
+            compress_level = int(self.get_query_argument('compress_level', default=TILE_COMPRESS_LEVEL))
+            quality = int(self.get_query_argument('quality', default=TILE_QUALITY))
+        except ValueError:
+            self.write_status_error(message='compress_level and quality must be integers')
+            return
+        if not 0 <= compress_level <= 9 or not 0 <= quality <= 100:
+            self.write_status_error(message='compress_level must be in the range 0 to 9, quality in the range 0 to 100')
+            return
+        save_options = _get_tile_save_options(tile_format, compress_level, quality)
+
+        # Both pyramid construction and tile computation may take long, e.g. because dask loads data,
+        # so we let them run in TILE_EXECUTOR rather than on the IOLoop thread.
+        future = TILE_EXECUTOR.submit(functools.partial(self._compute_tile,
+                                                        workspace, res_name,
+                                                        workspace.resource_cache.get_id(res_name),
+                                                        workspace.resource_cache.get_update_count(res_name),
+                                                        dataset, var_name, var_index,
+                                                        cmap_name, cmap_min, cmap_max,
+                                                        tile_format, save_options,
+                                                        int(x), int(y), int(z)),
+                                      group=workspace.base_dir, level=int(z))
+        if future is None:
+            self.set_status(503)
+            self.write_status_error(message='Too many pending tile requests, try again later')
+            return
 
-        array_id = '%s-%s-%s' % (res_name,
-                                 var_name,
-                                 ','.join(map(str, var_index)))
-        image_id = '%s-%s-%s-%s' % (array_id,
-                                    cmap_name,
-                                    cmap_min,
-                                    cmap_max)
-
-        pyramid_id = '%s-%s' % (base_dir, image_id)
-
-        if pyramid_id in ResVarTileHandler.PYRAMIDS:
-            pyramid = ResVarTileHandler.PYRAMIDS[pyramid_id]
-        else:
-            variable = dataset[var_name]
-            no_data_value = variable.attrs.get('_FillValue')
-
-            # Make sure we work with 2D image arrays only
-            if variable.ndim == 2:
-                array = variable
-            elif variable.ndim > 2:
-                if not var_index or len(var_index) != variable.ndim - 2:
-                    var_index = (0,) * (variable.ndim - 2)
-
-                # noinspection PyTypeChecker
-                var_index += (slice(None), slice(None),)
-
-                print('var_index =', var_index)
-                array = variable[var_index]
-            else:
-                self.write_status_error(message='Variable must be an N-D Dataset with N >= 2, '
-                                                'but "%s" is only %d-D' % (var_name, variable.ndim))
-                return
-
-            cmap_min = np.nanmin(array.values) if np.isnan(cmap_min) else cmap_min
-            cmap_max = np.nanmax(array.values) if np.isnan(cmap_max) else cmap_max
-            print('cmap_min =', cmap_min)
-            print('cmap_max =', cmap_max)
-
-            if USE_WORKSPACE_IMAGERY_CACHE:
-                mem_tile_cache = MEM_TILE_CACHE
-                rgb_tile_cache_dir = os.path.join(base_dir, WORKSPACE_CACHE_DIR_NAME, 'v%s' % __version__, 'tiles')
-                rgb_tile_cache = Cache(FileCacheStore(rgb_tile_cache_dir, ".png"),
-                                       capacity=WEBAPI_WORKSPACE_FILE_TILE_CACHE_CAPACITY,
-                                       threshold=0.75)
-            else:
-                mem_tile_cache = MEM_TILE_CACHE
-                rgb_tile_cache = None
-
-            def array_image_id_factory(level):
-                return 'arr-%s/%s' % (array_id, level)
-
-            tiling_scheme = get_tiling_scheme(variable)
-            if tiling_scheme is None:
-                self.write_status_error(
-                    message='Internal error: failed to compute tiling scheme for array_id="%s"' % array_id)
-                return
+        self._tile_future = future
+        try:
+            tile = yield future
+        except concurrent.futures.CancelledError:
+            # Connection has been closed, nobody is waiting for a response
+            return
+        except _TileRequestError as e:
+            self.write_status_error(message=str(e))
+            return
+        except Exception as e:
+            traceback.print_exc()
+            self.write_status_error(message='Internal error: %s' % e)
+            return
 
-            print('tiling_scheme =', repr(tiling_scheme))
-            pyramid = ImagePyramid.create_from_array(array, tiling_scheme,
-                                                     level_image_id_factory=array_image_id_factory)
-            pyramid = pyramid.apply(lambda image, level:
-                                    TransformArrayImage(image,
-                                                        image_id='tra-%s/%d' % (array_id, level),
-                                                        no_data_value=no_data_value,
-                                                        force_masked=True,
-                                                        flip_y=tiling_scheme.geo_extent.inv_y,
-                                                        tile_cache=mem_tile_cache))
-            pyramid = pyramid.apply(lambda image, level:
-                                    ColorMappedRgbaImage(image,
-                                                         image_id='rgb-%s/%d' % (image_id, level),
-                                                         value_range=(cmap_min, cmap_max),
-                                                         cmap_name=cmap_name,
-                                                         encode=True,
-                                                         format='PNG',
-                                                         tile_cache=rgb_tile_cache))
-            ResVarTileHandler.PYRAMIDS[pyramid_id] = pyramid
+        self.set_header('Content-Type', TILE_FORMATS[tile_format][2])
+        self.write(tile)
+
+    @classmethod
+    def _compute_tile(cls, workspace, res_name, res_id, res_update_count, dataset, var_name, var_index,
+                      cmap_name, cmap_min, cmap_max, tile_format, save_options, x, y, z):
+        base_dir = workspace.base_dir
+        # The resource's ID and update count make sure we never serve tiles of a replaced resource value
+        array_id = '%s-%s.%s-%s-%s' % (base_dir,
+                                       res_id,
+                                       res_update_count,
+                                       var_name,
+                                       ','.join(map(str, var_index)))
+        encoding_id = ','.join([tile_format] + ['%s=%s' % item for item in sorted(save_options.items())])
+        image_id = '%s-%s-%s-%s-%s' % (array_id,
+                                       cmap_name,
+                                       cmap_min,
+                                       cmap_max,
+                                       encoding_id)
+
+        # NaN means "not given" and never equals itself, so it must not be part of the key
+        pyramid_key = (base_dir, res_id, var_name, tuple(var_index), cmap_name,
+                       None if np.isnan(cmap_min) else cmap_min,
+                       None if np.isnan(cmap_max) else cmap_max,
+                       encoding_id)
+
+        pyramid = IMAGE_PYRAMIDS.get(pyramid_key, res_update_count)
+        if pyramid is None:
+            pyramid, disposables = cls._create_pyramid(workspace, res_name, dataset, var_name, var_index,
+                                                       cmap_name, cmap_min, cmap_max,
+                                                       tile_format, save_options,
+                                                       array_id, image_id)
+            # Another thread may have created the same pyramid in the meantime
+            pyramid = IMAGE_PYRAMIDS.put(pyramid_key, res_update_count, pyramid, disposables)
             if TRACE_TILE_PERF:
-                print('Created pyramid "%s":' % pyramid_id)
+                print('Created pyramid "%s":' % image_id)
                 print('  tile_size:', pyramid.tile_size)
                 print('  num_level_zero_tiles:', pyramid.num_level_zero_tiles)
                 print('  num_levels:', pyramid.num_levels)
 
-        try:
-            if TRACE_TILE_PERF:
-                print('PERF: >>> Tile:', image_id, z, y, x)
-            t1 = time.clock()
-            tile = pyramid.get_tile(int(x), int(y), int(z))
-            t2 = time.clock()
-
-            self.set_header('Content-Type', 'image/png')
-            self.write(tile)
-
-            if TRACE_TILE_PERF:
-                print('PERF: <<< Tile:', image_id, z, y, x, 'took', t2 - t1, 'seconds')
-                # GLOBAL_LOCK.release()
-        except Exception as e:
-            traceback.print_exc()
-            self.write_status_error(message='Internal error: %s' % e)
+        if TRACE_TILE_PERF:
+            print('PERF: >>> Tile:', image_id, z, y, x)
+        t1 = time.clock()
+        tile = pyramid.get_tile(x, y, z)
+        t2 = time.clock()
+        if TRACE_TILE_PERF:
+            print('PERF: <<< Tile:', image_id, z, y, x, 'took', t2 - t1, 'seconds')
+        return tile
+
+    @classmethod
+    def _create_pyramid(cls, workspace, res_name, dataset, var_name, var_index, cmap_name, cmap_min, cmap_max,
+                        tile_format, save_options, array_id, image_id) -> Tuple[ImagePyramid, List[ImagePyramid]]:
+        variable = dataset[var_name]
+        no_data_value = variable.attrs.get('_FillValue')
+
+        # Make sure we work with 2D image arrays only
+        if variable.ndim == 2:
+            array = variable
+        elif variable.ndim > 2:
+            if not var_index or len(var_index) != variable.ndim - 2:
+                var_index = (0,) * (variable.ndim - 2)
+
+            # noinspection PyTypeChecker
+            var_index += (slice(None), slice(None),)
+
+            print('var_index =', var_index)
+            array = variable[var_index]
+        else:
+            raise _TileRequestError('Variable must be an N-D Dataset with N >= 2, '
+                                    'but "%s" is only %d-D' % (var_name, variable.ndim))
+
+        cmap_min = np.nanmin(array.values) if np.isnan(cmap_min) else cmap_min
+        cmap_max = np.nanmax(array.values) if np.isnan(cmap_max) else cmap_max
+        print('cmap_min =', cmap_min)
+        print('cmap_max =', cmap_max)
+
+        mem_tile_cache = MEM_TILE_CACHE
+        rgb_tile_cache = None
+        content_version = None
+        if USE_WORKSPACE_IMAGERY_CACHE:
+            content_version = _get_resource_content_version(workspace, res_name)
+            if content_version is not None:
+                rgb_tile_cache = get_file_tile_cache()
+
+        def rgb_image_id_factory(level):
+            if content_version is None:
+                return 'rgb-%s/%d' % (image_id, level)
+            # Content-addressed, so that tiles can be shared across workspaces and server sessions.
+            # The first two digits are used to limit the number of entries per cache directory.
+            digest = _hash_json([content_version, var_name, var_index, cmap_name, cmap_min, cmap_max,
+                                 tile_format, save_options, level])
+            return '%s/%s' % (digest[:2], digest)
+
+        def array_image_id_factory(level):
+            return 'arr-%s/%s' % (array_id, level)
+
+        tiling_scheme = get_tiling_scheme(variable)
+        if tiling_scheme is None:
+            raise _TileRequestError('Internal error: failed to compute tiling scheme for array_id="%s"' % array_id)
+
+        print('tiling_scheme =', repr(tiling_scheme))
+        array_pyramid = ImagePyramid.create_from_array(array, tiling_scheme,
+                                                       level_image_id_factory=array_image_id_factory)
+        tra_pyramid = array_pyramid.apply(lambda image, level:
+                                          TransformArrayImage(image,
+                                                              image_id='tra-%s/%d' % (array_id, level),
+                                                              no_data_value=no_data_value,
+                                                              force_masked=True,
+                                                              flip_y=tiling_scheme.geo_extent.inv_y,
+                                                              tile_cache=mem_tile_cache))
+        rgb_pyramid = tra_pyramid.apply(lambda image, level:
+                                        ColorMappedRgbaImage(image,
+                                                             image_id=rgb_image_id_factory(level),
+                                                             value_range=(cmap_min, cmap_max),
+                                                             cmap_name=cmap_name,
+                                                             encode=True,
+                                                             format=TILE_FORMATS[tile_format][0],
+                                                             palette=TILE_FORMATS[tile_format][1],
+                                                             save_options=save_options,
+                                                             tile_cache=rgb_tile_cache))
+        disposables = [array_pyramid, tra_pyramid]
+        if content_version is None:
+            disposables.append(rgb_pyramid)
+        # else: content-addressed tiles in the file cache stay valid and may be reused by later sessions
+        return rgb_pyramid, disposables
 
 
 # noinspection PyAbstractClass
@@ -361,12 +728,85 @@ class ResVarCsvHandler(WebAPIRequestHandler):
         self.finish()
 
 
+# noinspection PyAbstractClass
+class ResVarCoordsHandler(WebAPIRequestHandler):
+    """
+    Provides the values of a 1D coordinate variable of a dataset resource, which are not part of the
+    resource descriptors. The query parameter "var" names the coordinate variable, "offset" and "count" select
+    a page of its values. If "format" is "binary" rather than "json", the values are sent as raw little-endian
+    array whose type is given by the "X-Cate-Data-Type" header, otherwise as JSON list.
+    """
+
+    def get(self, base_dir, res_name):
+        workspace_manager = self.application.workspace_manager
+        workspace = workspace_manager.get_workspace(base_dir)
+
+        if res_name not in workspace.resource_cache:
+            self.write_status_error(message='Unknown resource "%s"' % res_name)
+            return
+
+        dataset = workspace.resource_cache[res_name]
+        if not isinstance(dataset, xr.Dataset):
+            self.write_status_error(message='Resource "%s" must be a Dataset' % res_name)
+            return
+
+        var_name = self.get_query_argument('var')
+        if var_name not in dataset.coords or dataset.coords[var_name].ndim != 1:
+            self.write_status_error(message='Resource "%s" has no 1D coordinate variable "%s"' % (res_name, var_name))
+            return
+        variable = dataset.coords[var_name]
+
+        size = variable.size
+        try:
+            offset = int(self.get_query_argument('offset', default='0'))
+            count = self.get_query_argument('count', default=None)
+            count = size - offset if count is None else int(count)
+        except ValueError:
+            self.write_status_error(message='offset and count must be integers')
+            return
+        if offset > size:
+            self.write_status_error(message='offset must not exceed the number of values %d' % size)
+            return
+        if offset < 0 or count < 0:
+            self.write_status_error(message='offset and count must not be negative')
+            return
+        data_format = self.get_query_argument('format', default='json').lower()
+        if data_format not in ('json', 'binary'):
+            self.write_status_error(message='Unknown format "%s", must be one of binary, json' % data_format)
+            return
+
+        # Load the requested page only
+        values = variable[offset:offset + count].values
+
+        if data_format == 'binary':
+            if values.dtype.kind not in 'biufcmM':
+                self.write_status_error(message='Values of type %s cannot be sent as binary' % values.dtype)
+                return
+            values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+            self.set_header('Content-Type', 'application/octet-stream')
+            self.set_header('X-Cate-Data-Type', values.dtype.str)
+            self.set_header('X-Cate-Offset', str(offset))
+            self.set_header('X-Cate-Size', str(size))
+            self.write(values.tobytes())
+        else:
+            self.write_status_ok(content=dict(name=var_name,
+                                              dataType=object_to_qualified_name(values.dtype),
+                                              offset=offset,
+                                              count=len(values),
+                                              size=size,
+                                              values=to_json(values)))
+
+
 def _new_monitor() -> Monitor:
     return ConsoleMonitor(stay_in_line=True, progress_bar_size=30)
 
 
-def _on_workspace_closed(application: tornado.web.Application):
+def _on_workspace_closed(application: tornado.web.Application, base_dir: str = None):
     # noinspection PyUnresolvedReferences
     workspace_manager = application.workspace_manager
+    # Release the imagery of the closed workspace, or of all workspaces if base_dir is None
+    resolved_base_dir = workspace_manager.resolve_path(base_dir) if base_dir else None
+    IMAGE_PYRAMIDS.dispose_workspace(resolved_base_dir)
+    TILE_EXECUTOR.forget_group(resolved_base_dir)
     num_open_workspaces = workspace_manager.num_open_workspaces()
     check_for_auto_stop(application, num_open_workspaces == 0, interval=WEBAPI_ON_ALL_CLOSED_AUTO_STOP_AFTER)
@@ -19,8 +19,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import threading
 from collections import OrderedDict
-from typing import List, Sequence, Optional
+from typing import Callable, List, Sequence, Optional
 
 import xarray as xr
 
@@ -28,7 +29,7 @@ from cate.conf import conf
 from cate.conf.defaults import VERSION_CONF_FILE
 from cate.core.ds import DATA_STORE_REGISTRY
 from cate.core.op import OP_REGISTRY
-from cate.core.workspace import OpKwArgs
+from cate.core.workspace import OpKwArgs, Workspace
 from cate.core.wsmanag import WorkspaceManager
 from cate.util import Monitor, cwd, filter_fileset
 
@@ -44,11 +45,26 @@ class WebSocketService:
     All methods receive inputs deserialized from JSON-RPC requests and must
     return JSON-serializable outputs.
 
+    A service object serves a single client connection. Methods that open or get workspaces return their
+    full state. Methods that change a workspace return the changes only, that is, the descriptors of resources
+    whose name or update count changed since the client received them and the IDs of all resources,
+    see :py:meth:`cate.core.workspace.Workspace.to_json_dict`. Workspace states and changes are numbered by
+    a "version", changes also carry the "base_version" they apply to. A client that missed a version must
+    request the full state using :py:meth:`get_workspace`.
+
     :param: workspace_manager The current workspace manager.
+    :param: on_workspace_closed Optional function called with the base directory of a closed workspace,
+            or with ``None`` if all workspaces have been closed.
     """
 
-    def __init__(self, workspace_manager: WorkspaceManager):
+    def __init__(self, workspace_manager: WorkspaceManager,
+                 on_workspace_closed: Callable[[Optional[str]], None] = None):
         self.workspace_manager = workspace_manager
+        self.on_workspace_closed = on_workspace_closed
+        # Maps workspace base directories to the version last sent and the names and
+        # update counts of the resource descriptors known by the client, by resource ID
+        self._workspace_states = dict()
+        self._workspace_states_lock = threading.Lock()
 
     def get_config(self) -> dict:
         return dict(data_stores_path=conf.get_data_stores_path(),
@@ -216,56 +232,63 @@ class WebSocketService:
 
     def get_open_workspaces(self) -> Sequence[dict]:
         workspace_list = self.workspace_manager.get_open_workspaces()
-        return [workspace.to_json_dict() for workspace in workspace_list]
+        return [self._get_workspace_state(workspace) for workspace in workspace_list]
 
     def get_workspace(self, base_dir: str) -> dict:
         workspace = self.workspace_manager.get_workspace(base_dir)
-        return workspace.to_json_dict()
+        return self._get_workspace_state(workspace)
 
     # see cate-desktop: src/renderer.states.WorkspaceState
     def new_workspace(self, base_dir: str, description: str = None) -> dict:
         workspace = self.workspace_manager.new_workspace(base_dir, description)
-        return workspace.to_json_dict()
+        return self._get_workspace_state(workspace)
 
     # see cate-desktop: src/renderer.states.WorkspaceState
     def open_workspace(self, base_dir: str, monitor: Monitor) -> dict:
         workspace = self.workspace_manager.open_workspace(base_dir, monitor=monitor)
-        return workspace.to_json_dict()
+        return self._get_workspace_state(workspace)
 
     # see cate-desktop: src/renderer.states.WorkspaceState
     def close_workspace(self, base_dir: str) -> None:
         self.workspace_manager.close_workspace(base_dir)
+        self._forget_workspace_state(base_dir)
+        if self.on_workspace_closed:
+            self.on_workspace_closed(base_dir)
 
     def close_all_workspaces(self) -> None:
         self.workspace_manager.close_all_workspaces()
+        self._forget_workspace_state(None)
+        if self.on_workspace_closed:
+            self.on_workspace_closed(None)
 
     # see cate-desktop: src/renderer.states.WorkspaceState
     def save_workspace(self, base_dir: str, monitor: Monitor) -> dict:
         workspace = self.workspace_manager.save_workspace(base_dir, monitor=monitor)
-        return workspace.to_json_dict()
+        return self._get_workspace_delta(workspace)
 
     # see cate-desktop: src/renderer.states.WorkspaceState
     def save_workspace_as(self, base_dir: str, to_dir: str, monitor: Monitor) -> dict:
         workspace = self.workspace_manager.save_workspace_as(base_dir, to_dir, monitor=monitor)
-        return workspace.to_json_dict()
+        return self._get_workspace_state(workspace)
 
     def save_all_workspaces(self, monitor: Monitor = Monitor.NONE) -> None:
         self.workspace_manager.save_all_workspaces(monitor=monitor)
 
     def clean_workspace(self, base_dir: str) -> dict:
         workspace = self.workspace_manager.clean_workspace(base_dir)
-        return workspace.to_json_dict()
+        return self._get_workspace_delta(workspace)
 
     def delete_workspace(self, base_dir: str) -> None:
         self.workspace_manager.delete_workspace(base_dir)
+        self._forget_workspace_state(base_dir)
 
     def rename_workspace_resource(self, base_dir: str, res_name: str, new_res_name) -> dict:
         workspace = self.workspace_manager.rename_workspace_resource(base_dir, res_name, new_res_name)
-        return workspace.to_json_dict()
+        return self._get_workspace_delta(workspace)
 
     def delete_workspace_resource(self, base_dir: str, res_name: str) -> dict:
         workspace = self.workspace_manager.delete_workspace_resource(base_dir, res_name)
-        return workspace.to_json_dict()
+        return self._get_workspace_delta(workspace)
 
     def set_workspace_resource(self,
                                base_dir: str,
@@ -281,12 +304,17 @@ class WebSocketService:
                                                                                 res_name=res_name,
                                                                                 overwrite=overwrite,
                                                                                 monitor=monitor)
-            return [workspace.to_json_dict(), res_name]
+            return [self._get_workspace_delta(workspace), res_name]
 
     def set_workspace_resource_persistence(self, base_dir: str, res_name: str, persistent: bool) -> dict:
         with cwd(base_dir):
             workspace = self.workspace_manager.set_workspace_resource_persistence(base_dir, res_name, persistent)
-            return workspace.to_json_dict()
+            return self._get_workspace_delta(workspace)
+
+    def set_workspace_resource_checkpoint(self, base_dir: str, res_name: str, checkpoint: bool) -> dict:
+        with cwd(base_dir):
+            workspace = self.workspace_manager.set_workspace_resource_checkpoint(base_dir, res_name, checkpoint)
+            return self._get_workspace_delta(workspace)
 
     def write_workspace_resource(self, base_dir: str, res_name: str,
                                  file_path: str, format_name: str = None,
@@ -296,10 +324,14 @@ class WebSocketService:
                                                             format_name=format_name, monitor=monitor)
 
     def run_op_in_workspace(self, base_dir: str, op_name: str, op_args: OpKwArgs,
-                            monitor: Monitor = Monitor.NONE) -> dict:
+                            monitor: Monitor = Monitor.NONE, profile: bool = False) -> dict:
         with cwd(base_dir):
-            workspace = self.workspace_manager.run_op_in_workspace(base_dir, op_name, op_args, monitor=monitor)
-            return workspace.to_json_dict()
+            workspace = self.workspace_manager.run_op_in_workspace(base_dir, op_name, op_args, monitor=monitor,
+                                                                   profile=profile)
+            return self._get_workspace_delta(workspace)
+
+    def get_workspace_profile(self, base_dir: str) -> Optional[dict]:
+        return self.workspace_manager.get_workspace_profile(base_dir)
 
     def print_workspace_resource(self, base_dir: str, res_name_or_expr: str = None,
                                  monitor: Monitor = Monitor.NONE) -> None:
@@ -337,3 +369,36 @@ class WebSocketService:
                 actual_max = variable.max(skipna=True)
 
         return dict(min=float(actual_min), max=float(actual_max))
+
+    def _get_workspace_state(self, workspace: Workspace) -> dict:
+        with self._workspace_states_lock:
+            json_dict = workspace.to_json_dict()
+            res_versions = {resource['id']: (resource['name'], resource['updateCount'])
+                            for resource in json_dict['resources'] if resource['id'] is not None}
+            return self._set_workspace_state(workspace, json_dict, res_versions)
+
+    def _get_workspace_delta(self, workspace: Workspace) -> dict:
+        with self._workspace_states_lock:
+            base_version, known_res_versions = self._workspace_states.get(workspace.base_dir, (0, {}))
+            json_dict = workspace.to_json_dict(known_res_versions=known_res_versions)
+            res_versions = {res_id: known_res_versions[res_id]
+                            for res_id in json_dict['resource_ids'] if res_id in known_res_versions}
+            for resource in json_dict['resources']:
+                if resource['id'] is not None:
+                    res_versions[resource['id']] = resource['name'], resource['updateCount']
+            json_dict['base_version'] = base_version
+            return self._set_workspace_state(workspace, json_dict, res_versions)
+
+    def _set_workspace_state(self, workspace: Workspace, json_dict: dict, res_versions: dict) -> dict:
+        old_version, _ = self._workspace_states.get(workspace.base_dir, (0, None))
+        version = old_version + 1
+        self._workspace_states[workspace.base_dir] = version, res_versions
+        json_dict['version'] = version
+        return json_dict
+
+    def _forget_workspace_state(self, base_dir: Optional[str]) -> None:
+        with self._workspace_states_lock:
+            if base_dir is None:
+                self._workspace_states.clear()
+            else:
+                self._workspace_states.pop(base_dir, None)
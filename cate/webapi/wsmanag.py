@@ -157,13 +157,17 @@ class WebAPIWorkspaceManager(WorkspaceManager):
         return Workspace.from_json_dict(json_dict)
 
     def run_op_in_workspace(self, base_dir: str, op_name: str, op_args: OpKwArgs,
-                            monitor: Monitor = Monitor.NONE) -> Workspace:
+                            monitor: Monitor = Monitor.NONE,
+                            profile: bool = False) -> Workspace:
         json_dict = self._ws_json_rpc("run_op_in_workspace",
-                                      dict(base_dir=base_dir, op_name=op_name, op_args=op_args),
+                                      dict(base_dir=base_dir, op_name=op_name, op_args=op_args, profile=profile),
                                       timeout=WEBAPI_WORKSPACE_TIMEOUT,
                                       monitor=monitor)
         return Workspace.from_json_dict(json_dict)
 
+    def get_workspace_profile(self, base_dir: str) -> Optional[dict]:
+        return self._ws_json_rpc("get_workspace_profile", dict(base_dir=base_dir), timeout=WEBAPI_WORKSPACE_TIMEOUT)
+
     def delete_workspace_resource(self, base_dir: str, res_name: str) -> Workspace:
         json_dict = self._ws_json_rpc("delete_workspace_resource",
                                       dict(base_dir=base_dir, res_name=res_name),
@@ -176,6 +180,12 @@ class WebAPIWorkspaceManager(WorkspaceManager):
                                       timeout=WEBAPI_RESOURCE_TIMEOUT)
         return Workspace.from_json_dict(json_dict)
 
+    def set_workspace_resource_checkpoint(self, base_dir: str, res_name: str, checkpoint: bool) -> Workspace:
+        json_dict = self._ws_json_rpc("set_workspace_resource_checkpoint",
+                                      dict(base_dir=base_dir, res_name=res_name, checkpoint=checkpoint),
+                                      timeout=WEBAPI_RESOURCE_TIMEOUT)
+        return Workspace.from_json_dict(json_dict)
+
     def set_workspace_resource(self,
                                base_dir: str,
                                op_name: str,
@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import patch
+
+import dask.array as da
+
+from cate.core.op import op_input, op_output
+from cate.core.profiler import WorkflowProfile, to_chrome_trace, format_profile
+from cate.core.workflow import OpStep, Workflow
+from cate.util import OpMetaInfo
+
+
+@op_input('x')
+@op_output('y')
+def compute_sum(x):
+    array = da.ones((100, 100), chunks=(50, 50)) * x
+    return {'y': float(array.sum().compute(scheduler='threads'))}
+
+
+@op_input('x')
+@op_output('y')
+def fail(x):
+    raise ValueError('failed: %s' % x)
+
+
+class WorkflowProfileTest(TestCase):
+    @staticmethod
+    def _new_workflow(op=compute_sum):
+        step1 = OpStep(compute_sum, node_id='s1')
+        step2 = OpStep(op, node_id='s2')
+        workflow = Workflow(OpMetaInfo('myWorkflow', inputs=OrderedDict(p={}), outputs=OrderedDict(q={})))
+        workflow.add_steps(step1, step2)
+        step1.inputs.x.source = workflow.inputs.p
+        step2.inputs.x.source = step1.outputs.y
+        workflow.outputs.q.source = step2.outputs.y
+        workflow.inputs.p.value = 2
+        return workflow
+
+    def test_steps_are_measured(self):
+        workflow = self._new_workflow()
+        workflow_profile = WorkflowProfile()
+        workflow.invoke(context=dict(workflow_profile=workflow_profile))
+        self.assertEqual(workflow.outputs.q.value, 100 * 100 * 100 * 100 * 2.)
+
+        step_profiles = workflow_profile.step_profiles
+        self.assertEqual([p.step_id for p in step_profiles], ['s1', 's2'])
+        for step_profile in step_profiles:
+            self.assertGreater(step_profile.wall_time, 0.)
+            self.assertGreaterEqual(step_profile.cpu_time, 0.)
+            self.assertGreater(step_profile.num_dask_tasks, 4)
+            self.assertGreater(step_profile.bytes_loaded, 0)
+            self.assertGreaterEqual(step_profile.peak_rss_delta, 0)
+            self.assertEqual(step_profile.depth, 0)
+            self.assertFalse(step_profile.failed)
+        self.assertGreaterEqual(step_profiles[1].start_time, step_profiles[0].start_time + step_profiles[0].wall_time)
+
+        json_dict = workflow_profile.to_json_dict()
+        self.assertEqual(json_dict['num_dask_tasks'], sum(p.num_dask_tasks for p in step_profiles))
+        self.assertEqual([step['step_id'] for step in json_dict['steps']], ['s1', 's2'])
+        # Must be JSON-serializable
+        json.dumps(json_dict)
+
+    def test_steps_are_measured_without_thread_time(self):
+        # The time module of Python 3.6 has no thread_time()
+        time_36 = SimpleNamespace(time=time.time, perf_counter=time.perf_counter, process_time=time.process_time)
+        with patch('cate.core.profiler.time', time_36):
+            workflow = self._new_workflow()
+            workflow_profile = WorkflowProfile()
+            workflow.invoke(context=dict(workflow_profile=workflow_profile))
+        self.assertEqual([p.step_id for p in workflow_profile.step_profiles], ['s1', 's2'])
+        for step_profile in workflow_profile.step_profiles:
+            self.assertGreater(step_profile.wall_time, 0.)
+            self.assertGreaterEqual(step_profile.cpu_time, 0.)
+
+    def test_dask_tasks_are_not_counted_outside_of_steps(self):
+        workflow_profile = WorkflowProfile()
+        with workflow_profile.measuring('s1'):
+            pass
+        da.ones((10,), chunks=5).sum().compute(scheduler='threads')
+        self.assertEqual(workflow_profile.step_profiles[0].num_dask_tasks, 0)
+
+    def test_concurrent_steps_are_measured_separately(self):
+        workflow_profile = WorkflowProfile()
+        errors = []
+
+        def compute(num_chunks):
+            da.ones((num_chunks,), chunks=1).sum().compute(scheduler='sync')
+
+        def run(step_id, num_chunks):
+            try:
+                with workflow_profile.measuring(step_id):
+                    compute(num_chunks)
+            except BaseException as error:
+                errors.append(error)
+
+        expected_num_dask_tasks = {}
+        for i in range(1, 4):
+            with workflow_profile.measuring('alone'):
+                compute(10 * i)
+            expected_num_dask_tasks['s%d' % i] = workflow_profile.step_profiles[-1].num_dask_tasks
+            self.assertGreater(expected_num_dask_tasks['s%d' % i], 10 * i)
+
+        threads = [threading.Thread(target=run, args=('s%d' % i, 10 * i)) for i in range(1, 4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        # Dask passes its callbacks only to the outermost of concurrent computations, but tasks must never be
+        # attributed to a step of another thread
+        for step_profile in workflow_profile.step_profiles[3:]:
+            self.assertIn(step_profile.num_dask_tasks, (0, expected_num_dask_tasks[step_profile.step_id]))
+
+    def test_failed_step(self):
+        workflow = self._new_workflow(op=fail)
+        workflow_profile = WorkflowProfile()
+        with self.assertRaises(ValueError):
+            workflow.invoke(context=dict(workflow_profile=workflow_profile))
+        self.assertEqual([p.failed for p in workflow_profile.step_profiles], [False, True])
+
+    def test_to_chrome_trace_and_format_profile(self):
+        workflow = self._new_workflow()
+        workflow_profile = WorkflowProfile()
+        workflow.invoke(context=dict(workflow_profile=workflow_profile))
+
+        trace = to_chrome_trace(workflow_profile.to_json_dict())
+        trace_events = trace['traceEvents']
+        self.assertEqual([event['name'] for event in trace_events], ['s1', 's2'])
+        self.assertEqual(trace_events[0]['ph'], 'X')
+        self.assertEqual(trace_events[0]['tid'], threading.get_ident())
+        self.assertIn('num_dask_tasks', trace_events[0]['args'])
+
+        lines = format_profile(workflow_profile.to_json_dict()).split('\n')
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[0].startswith('Step'))
+        self.assertTrue(lines[1].startswith('s1'))
+        self.assertTrue(lines[3].startswith('Total'))
@@ -0,0 +1,93 @@
+import os.path
+import shutil
+import tempfile
+from unittest import TestCase
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely.geometry
+import xarray as xr
+
+from cate.core.respersist import RESOURCE_FORMAT_REGISTRY, NetCDFResourceFormat
+
+
+class NetCDFResourceFormatTest(TestCase):
+    def setUp(self):
+        self.dir_path = tempfile.mkdtemp()
+        self.format = NetCDFResourceFormat()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_path, ignore_errors=True)
+
+    def _write_and_read(self, value, res_name='res_1'):
+        file = os.path.join(self.dir_path, res_name + self.format.filename_ext)
+        self.format.write(value, file)
+        return self.format.read(file)
+
+    def test_write_fitness(self):
+        self.assertEqual(self.format.write_fitness(xr.Dataset()), 1)
+        self.assertEqual(self.format.write_fitness(xr.DataArray([1, 2])), 1)
+        self.assertEqual(self.format.write_fitness(pd.DataFrame({'a': [1, 2]})), 1)
+        self.assertEqual(self.format.write_fitness(pd.DataFrame({1: [1, 2]})), -1)
+        self.assertEqual(self.format.write_fitness(42), -1)
+        self.assertEqual(self.format.write_fitness(pd.DataFrame({'a': ['x', 'y']})), 1)
+        self.assertEqual(self.format.write_fitness(pd.DataFrame({'a': ['x', 1]})), -1)
+        self.assertEqual(self.format.write_fitness(pd.DataFrame({'a': ['x', None]})), -1)
+        self.assertEqual(self.format.write_fitness(pd.DataFrame({'a': [{'x': 1}, {'y': 2}]})), -1)
+        self.assertEqual(self.format.write_fitness(pd.DataFrame({'a': [1, 2]}, index=[1, 'x'])), -1)
+        self.assertEqual(self.format.write_fitness(pd.DataFrame({'a': pd.Categorical(['x', 'y'])})), -1)
+        self.assertIsNone(RESOURCE_FORMAT_REGISTRY.find_writer('abc'))
+        self.assertIs(type(RESOURCE_FORMAT_REGISTRY.find_writer(xr.Dataset())), NetCDFResourceFormat)
+
+    def test_dataset_is_compressed_chunked_and_read_lazily(self):
+        dataset = xr.Dataset({'a': (('time', 'lat', 'lon'), np.random.random((2, 180, 720))),
+                              'b': (('lat',), np.arange(180.))},
+                             coords={'lat': np.linspace(-89.5, 89.5, 180)})
+        value = self._write_and_read(dataset)
+        self.assertEqual(value.a.encoding['chunksizes'], (1, 180, 512))
+        self.assertTrue(value.a.encoding['zlib'])
+        self.assertEqual(value.a.chunks, ((1, 1), (180,), (512, 208)))
+        xr.testing.assert_allclose(value.compute(), dataset)
+        value.close()
+
+    def test_dask_chunks_are_kept(self):
+        dataset = xr.Dataset({'a': (('lat', 'lon'), np.zeros((90, 180)))}).chunk({'lat': 30, 'lon': 60})
+        value = self._write_and_read(dataset)
+        self.assertEqual(value.a.chunks, ((30, 30, 30), (60, 60, 60)))
+        value.close()
+
+    def test_data_array(self):
+        data_array = xr.DataArray(np.arange(6.).reshape((2, 3)), dims=('lat', 'lon'), name='x')
+        value = self._write_and_read(data_array)
+        self.assertIsInstance(value, xr.DataArray)
+        self.assertEqual(value.name, 'x')
+        xr.testing.assert_equal(value.compute(), data_array)
+
+    def test_data_frame(self):
+        data_frame = pd.DataFrame({'b': [1, 2, 3], 'a': [0.5, 1.5, 2.5], 'c': ['x', 'y', 'z']})
+        value = self._write_and_read(data_frame)
+        pd.testing.assert_frame_equal(value, data_frame)
+
+    def test_geo_data_frame(self):
+        data_frame = gpd.GeoDataFrame({'name': ['p', 'q'],
+                                       'geometry': [shapely.geometry.Point(1, 2), shapely.geometry.Point(3, 4)]})
+        self.assertEqual(self.format.write_fitness(data_frame), 1)
+        value = self._write_and_read(data_frame)
+        self.assertIsInstance(value, gpd.GeoDataFrame)
+        self.assertEqual(value.geometry.name, 'geometry')
+        self.assertEqual(list(value.columns), list(data_frame.columns))
+        self.assertEqual(list(value['name']), ['p', 'q'])
+        self.assertTrue(value.geometry.geom_equals(data_frame.geometry).all())
+        # The written frame must not be changed
+        self.assertIsInstance(data_frame.geometry.iloc[0], shapely.geometry.Point)
+
+    def test_find_resource_files(self):
+        self.format.write(xr.Dataset(), os.path.join(self.dir_path, 'res_1.nc'))
+        resource_files = RESOURCE_FORMAT_REGISTRY.find_resource_files(self.dir_path, 'res_1')
+        self.assertEqual(len(resource_files), 1)
+        self.assertEqual(resource_files[0][1], os.path.join(self.dir_path, 'res_1.nc'))
+        self.assertEqual(RESOURCE_FORMAT_REGISTRY.find_resource_files(self.dir_path, 'res_2'), [])
+        self.assertEqual(RESOURCE_FORMAT_REGISTRY.get_res_name('res_1.nc'), 'res_1')
+        self.assertIsNone(RESOURCE_FORMAT_REGISTRY.get_res_name('res_1.nc.1234.tmp'))
+        self.assertIsNone(RESOURCE_FORMAT_REGISTRY.get_res_name('workflow.json'))
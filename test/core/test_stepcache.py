@@ -0,0 +1,198 @@
+import os.path
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from unittest import TestCase, skipIf
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from cate.core.op import OP_REGISTRY, op_input, op_output
+from cate.core.stepcache import StepResultCache, StepResultStore
+from cate.core.workflow import OpStep, Workflow, ValueCache, MemoReport
+from cate.util import OpMetaInfo
+
+_INVOCATIONS = []
+
+
+@op_input('x')
+@op_output('y')
+def make_dataset(x):
+    _INVOCATIONS.append(x)
+    return {'y': xr.Dataset({'a': (('lat', 'lon'), np.full((2, 3), float(x)))})}
+
+
+# Registered as operations tagged 'input' by the tests using them
+
+def read_number(file):
+    _INVOCATIONS.append(file)
+    with open(file) as fp:
+        return float(fp.read())
+
+
+def open_number(name):
+    _INVOCATIONS.append(name)
+    return 1.
+
+
+class _BlockingValue:
+    """A value whose pickling waits for an event."""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __getstate__(self):
+        self.event.wait(5)
+        return {}
+
+
+class StepResultCacheTest(TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_put_and_get_result(self):
+        cache = StepResultCache(self.cache_dir, 1024 * 1024)
+        dataset = xr.Dataset({'a': (('lat', 'lon'), np.arange(6.).reshape((2, 3)))})
+        data_frame = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})
+        self.assertIsNone(cache.get_result('fp1'))
+        self.assertTrue(cache.put_result('fp1', OrderedDict([('ds', dataset), ('df', data_frame), ('n', 42)])))
+
+        result = cache.get_result('fp1')
+        self.assertEqual(list(result.keys()), ['ds', 'df', 'n'])
+        xr.testing.assert_equal(result['ds'], dataset)
+        pd.testing.assert_frame_equal(result['df'], data_frame)
+        self.assertEqual(result['n'], 42)
+        result['ds'].close()
+
+    def test_unpicklable_results_are_not_cached(self):
+        cache = StepResultCache(self.cache_dir, 1024 * 1024)
+        self.assertFalse(cache.put_result('fp1', {'lock': threading.Lock()}))
+        self.assertIsNone(cache.get_result('fp1'))
+        self.assertEqual(cache.cache.size, 0)
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, 'fp')), [])
+
+    def test_results_survive_restart(self):
+        cache = StepResultCache(self.cache_dir, 1024 * 1024)
+        cache.put_result('fp1', {'n': 1})
+        cache.put_result('fp2', {'n': 2})
+        os.utime(os.path.join(self.cache_dir, 'fp', 'fp1', 'result.json'), (1000, 1000))
+        os.utime(os.path.join(self.cache_dir, 'fp', 'fp2', 'result.json'), (2000, 2000))
+        cache.get_result('fp1')
+
+        cache = StepResultCache(self.cache_dir, 1024 * 1024)
+        self.assertGreater(cache.cache.size, 0)
+        # Least recently used first
+        self.assertEqual(StepResultStore(self.cache_dir).get_stored_keys(), ['fp2', 'fp1'])
+        self.assertEqual(cache.get_result('fp2'), {'n': 2})
+
+    def test_least_recently_used_results_are_removed(self):
+        value = np.zeros(1000)
+        cache = StepResultCache(self.cache_dir, 4000)
+        cache.put_result('fp1', {'v': value})
+        cache.put_result('fp2', {'v': value})
+        self.assertIsNone(cache.get_result('fp1'))
+        self.assertIsNotNone(cache.get_result('fp2'))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'fp', 'fp1')))
+
+    def test_invoke_workflow_with_step_result_cache(self):
+        step = OpStep(make_dataset, node_id='s1')
+        workflow = Workflow(OpMetaInfo('myWorkflow', inputs=OrderedDict(p={}), outputs=OrderedDict(q={})))
+        workflow.add_steps(step)
+        step.inputs.x.source = workflow.inputs.p
+        workflow.outputs.q.source = step.outputs.y
+        workflow.inputs.p.value = 3
+        del _INVOCATIONS[:]
+
+        step_result_cache = StepResultCache(self.cache_dir, 1024 * 1024)
+        memo_report = MemoReport()
+        workflow.invoke(context=dict(value_cache=ValueCache(), step_result_cache=step_result_cache,
+                                     memo_report=memo_report))
+        self.assertEqual(_INVOCATIONS, [3])
+        self.assertEqual(memo_report.outcomes, {'s1': 'miss'})
+
+        # As if the workspace has been reopened
+        value_cache = ValueCache()
+        memo_report = MemoReport()
+        workflow.invoke(context=dict(value_cache=value_cache, step_result_cache=step_result_cache,
+                                     memo_report=memo_report))
+        self.assertEqual(_INVOCATIONS, [3])
+        self.assertEqual(memo_report.outcomes, {'s1': 'restored'})
+        self.assertEqual(float(workflow.outputs.q.value.a[0, 0]), 3.)
+        value_cache.close()
+
+    def _invoke_step(self, step, step_result_cache):
+        memo_report = MemoReport()
+        value_cache = ValueCache()
+        step.invoke(context=dict(value_cache=value_cache, step_result_cache=step_result_cache,
+                                 memo_report=memo_report))
+        value_cache.close()
+        return memo_report.outcomes[step.id]
+
+    def test_results_of_changed_files_are_recomputed(self):
+        file = os.path.join(self.cache_dir, 'number.txt')
+        with open(file, 'w') as fp:
+            fp.write('1')
+        try:
+            op_reg = OP_REGISTRY.add_op(read_number)
+            op_reg.op_meta_info.header['tags'] = ['input']
+            step = OpStep(op_reg, node_id='s1')
+            step.inputs.file.value = file
+            step_result_cache = StepResultCache(os.path.join(self.cache_dir, 'cache'), 1024 * 1024)
+            del _INVOCATIONS[:]
+
+            self.assertEqual(self._invoke_step(step, step_result_cache), 'miss')
+            self.assertEqual(self._invoke_step(step, step_result_cache), 'restored')
+            self.assertEqual(_INVOCATIONS, [file])
+
+            with open(file, 'w') as fp:
+                fp.write('22')
+            self.assertEqual(self._invoke_step(step, step_result_cache), 'miss')
+            self.assertEqual(step.outputs['return'].value, 22.)
+            self.assertEqual(_INVOCATIONS, [file, file])
+        finally:
+            OP_REGISTRY.remove_op(read_number)
+
+    def test_results_of_input_ops_without_files_are_not_cached(self):
+        try:
+            op_reg = OP_REGISTRY.add_op(open_number)
+            op_reg.op_meta_info.header['tags'] = ['input']
+            step = OpStep(op_reg, node_id='s1')
+            step.inputs.name.value = 'local.my_data'
+            step_result_cache = StepResultCache(self.cache_dir, 1024 * 1024)
+            del _INVOCATIONS[:]
+            self.assertEqual(self._invoke_step(step, step_result_cache), 'miss')
+            self.assertEqual(self._invoke_step(step, step_result_cache), 'miss')
+            self.assertEqual(_INVOCATIONS, ['local.my_data', 'local.my_data'])
+            self.assertEqual(step_result_cache.cache.size, 0)
+        finally:
+            OP_REGISTRY.remove_op(open_number)
+
+    @skipIf(not hasattr(os, 'getuid'), 'directory permissions are not checked on Windows')
+    def test_values_are_not_pickled_in_shared_directories(self):
+        cache = StepResultCache(self.cache_dir, 1024 * 1024)
+        self.assertTrue(cache.put_result('fp1', {'n': 1}))
+        os.chmod(self.cache_dir, 0o777)
+        self.assertFalse(cache.put_result('fp2', {'n': 2}))
+        self.assertIsNone(cache.get_result('fp1'))
+        dataset = xr.Dataset({'a': (('lat', 'lon'), np.zeros((2, 3)))})
+        self.assertTrue(cache.put_result('fp3', {'ds': dataset}))
+        cache.get_result('fp3')['ds'].close()
+
+    def test_results_are_written_without_locking_the_cache(self):
+        cache = StepResultCache(self.cache_dir, 1024 * 1024)
+        event = threading.Event()
+        thread = threading.Thread(target=cache.put_result, args=('fp1', {'v': _BlockingValue(event)}))
+        thread.start()
+        try:
+            self.assertTrue(cache.put_result('fp2', {'n': 2}))
+            self.assertEqual(cache.get_result('fp2'), {'n': 2})
+            self.assertIsNone(cache.get_result('fp1'))
+        finally:
+            event.set()
+            thread.join()
+        self.assertIsNotNone(cache.get_result('fp1'))
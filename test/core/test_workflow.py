@@ -1,12 +1,18 @@
 import json
 import os.path
+import sys
+import threading
+import time
 from collections import OrderedDict
 from unittest import TestCase
 
+import numpy as np
+import xarray as xr
+
 from cate.core.op import op_input, op_output, Operation
 from cate.core.workflow import OpStep, Workflow, WorkflowStep, NodePort, ExpressionStep, NoOpStep, SubProcessStep, ValueCache, \
-    SourceRef, new_workflow_op
-from cate.util import UNDEFINED
+    SourceRef, MemoReport, LazyValue, new_workflow_op
+from cate.util import UNDEFINED, Monitor, Cancellation
 from cate.util.misc import object_to_qualified_name
 from cate.util.opmetainf import OpMetaInfo
 
@@ -30,6 +36,66 @@ def op3(u, v, c=0):
     return {'w': 2 * u + 3 * v + c}
 
 
+_RUNNING_LOCK = threading.Lock()
+_RUNNING = dict(count=0, max_count=0)
+
+
+@op_input('x')
+@op_output('y')
+def slow_op(x, monitor=Monitor.NONE):
+    with _RUNNING_LOCK:
+        _RUNNING['count'] += 1
+        _RUNNING['max_count'] = max(_RUNNING['max_count'], _RUNNING['count'])
+    try:
+        with monitor.starting('slow_op', 1):
+            time.sleep(0.1)
+            if x < 0:
+                raise ValueError('x must not be negative')
+            monitor.progress(1)
+    finally:
+        with _RUNNING_LOCK:
+            _RUNNING['count'] -= 1
+    return {'y': x + 1}
+
+
+_INVOCATIONS = []
+
+
+@op_input('x')
+@op_input('offset')
+@op_output('y')
+def counting_op(x, offset=1):
+    _INVOCATIONS.append(x)
+    return {'y': x + offset}
+
+
+@op_input('x')
+@op_output('y')
+def lazy_op(x):
+    return {'y': xr.Dataset({'a': (('lat', 'lon'), np.full((4, 6), float(x)))}).chunk({'lat': 2}) + 1}
+
+
+class RecordingMonitor(Monitor):
+    def __init__(self, cancel_after_work: float = None):
+        self.worked = 0.
+        self.cancel_after_work = cancel_after_work
+        self.cancelled = False
+
+    def start(self, label: str, total_work: float = None):
+        pass
+
+    def progress(self, work: float = None, msg: str = None):
+        self.worked += work or 0.
+        if self.cancel_after_work is not None and self.worked >= self.cancel_after_work:
+            self.cancelled = True
+
+    def done(self):
+        pass
+
+    def is_cancelled(self):
+        return self.cancelled
+
+
 def get_resource(rel_path):
     return os.path.join(os.path.dirname(__file__), rel_path).replace('\\', '/')
 
@@ -69,12 +135,73 @@ class WorkflowTest(TestCase):
         self.assertEqual(Workflow.sort_steps([step3, step2, step1]), [step1, step2, step3])
         self.assertEqual(Workflow.sort_steps([step1, step3, step2]), [step1, step2, step3])
 
+    def test_sort_steps_long_chain(self):
+        steps = [OpStep(op1, node_id='op1_%d' % i) for i in range(2000)]
+        for i in range(1, len(steps)):
+            steps[i].inputs.x.source = steps[i - 1].outputs.y
+        self.assertEqual(Workflow.sort_steps(list(reversed(steps))), steps)
+        self.assertEqual(Workflow.sort_steps(steps[1000:] + steps[:10]), steps[:10] + steps[1000:])
+
+    def test_sort_steps_keeps_order_of_independent_steps(self):
+        step1, step2, step3, _ = self.create_example_3_steps_workflow()
+        step4 = OpStep(op1, node_id='op4')
+        step5 = OpStep(op2, node_id='op5')
+        step5.inputs.a.source = step4.outputs.y
+        self.assertEqual(Workflow.sort_steps([step5, step3, step4, step2, step1]),
+                         [step4, step1, step5, step2, step3])
+
+    def test_sort_steps_with_unresolved_source_refs(self):
+        step1 = OpStep(op1, node_id='op1')
+        step2 = OpStep.from_json_dict({'id': 'op2', 'op': 'test.core.test_workflow.op2',
+                                       'inputs': {'a': 'op1.y'}})
+        self.assertIsNone(step2.inputs.a.source)
+        self.assertEqual(Workflow.sort_steps([step2, step1]), [step1, step2])
+
+    def test_sort_steps_with_cycle(self):
+        step1, step2, step3, _ = self.create_example_3_steps_workflow()
+        step1.inputs.x.source = step3.outputs.w
+        with self.assertRaises(ValueError):
+            Workflow.sort_steps([step1, step2, step3])
+
     def test_find_steps_to_compute(self):
         step1, step2, step3, workflow = self.create_example_3_steps_workflow()
         self.assertEqual(workflow.find_steps_to_compute('op1'), [step1])
         self.assertEqual(workflow.find_steps_to_compute('op2'), [step1, step2])
         self.assertEqual(workflow.find_steps_to_compute('op3'), [step1, step2, step3])
 
+    def test_find_dependent_steps(self):
+        step1, step2, step3, workflow = self.create_example_3_steps_workflow()
+        self.assertEqual(workflow.find_dependent_steps('op1'), [step2, step3])
+        self.assertEqual(workflow.find_dependent_steps('op2'), [step3])
+        self.assertEqual(workflow.find_dependent_steps('op3'), [])
+
+        # The index must follow changes of the step inputs
+        step3.inputs.v.value = 1
+        self.assertEqual(workflow.find_dependent_steps('op2'), [])
+        step3.inputs.v.source = step2.outputs.b
+        self.assertEqual(workflow.find_dependent_steps('op2'), [step3])
+
+        step2.set_id('op2_new')
+        self.assertEqual(workflow.find_dependent_steps('op2_new'), [step3])
+        self.assertEqual(workflow.find_dependent_steps('op2'), [])
+
+        workflow.remove_step(step3)
+        self.assertEqual(workflow.find_dependent_steps('op1'), [step2])
+
+        step4 = OpStep(op3, node_id='op4')
+        step4.inputs.u.source = step2.outputs.b
+        workflow.add_step(step4)
+        self.assertEqual(workflow.find_dependent_steps('op1'), [step2, step4])
+
+    def test_find_dependent_steps_long_chain(self):
+        workflow = Workflow(OpMetaInfo('myWorkflow'))
+        steps = [OpStep(op1, node_id='op1_%d' % i) for i in range(2000)]
+        for i in range(1, len(steps)):
+            steps[i].inputs.x.source = steps[i - 1].outputs.y
+        workflow.add_steps(*steps)
+        self.assertEqual(workflow.find_dependent_steps('op1_0'), steps[1:])
+        self.assertEqual(workflow.find_dependent_steps('op1_1990'), steps[1991:])
+
     def test_requires(self):
         step1, step2, step3, workflow = self.create_example_3_steps_workflow()
         self.assertFalse(step1.requires(step2))
@@ -153,6 +280,138 @@ class WorkflowTest(TestCase):
         self.assertEqual(output_value, 2 * (3 + 1) + 3 * (2 * (3 + 1)))
         self.assertEqual(value_cache, dict(op1={'y': 4}, op2={'b': 8}, op3={'w': 32}))
 
+    def test_invoke_with_memoization(self):
+        step1 = OpStep(counting_op, node_id='s1')
+        step2 = OpStep(counting_op, node_id='s2')
+        step3 = OpStep(op2, node_id='s3')
+        workflow = Workflow(OpMetaInfo('myWorkflow', inputs=OrderedDict(p={}), outputs=OrderedDict(q={})))
+        workflow.add_steps(step1, step2, step3)
+        step1.inputs.x.source = workflow.inputs.p
+        step2.inputs.x.source = workflow.inputs.p
+        step3.inputs.a.source = step1.outputs.y
+        workflow.outputs.q.source = step3.outputs.b
+
+        value_cache = ValueCache()
+        workflow.inputs.p.value = 3
+        del _INVOCATIONS[:]
+
+        memo_report = MemoReport()
+        workflow.invoke(context=dict(value_cache=value_cache, memo_report=memo_report))
+        self.assertEqual(workflow.outputs.q.value, 8)
+        # step2 computes the same as step1
+        self.assertEqual(_INVOCATIONS, [3])
+        self.assertIs(value_cache['s2'], value_cache['s1'])
+        self.assertEqual(memo_report.outcomes, OrderedDict([('s1', 'miss'), ('s2', 'shared'), ('s3', 'miss')]))
+        self.assertEqual(memo_report.num_hits, 1)
+        self.assertEqual(memo_report.num_misses, 2)
+
+        memo_report = MemoReport()
+        workflow.invoke(context=dict(value_cache=value_cache, memo_report=memo_report))
+        self.assertEqual(_INVOCATIONS, [3])
+        self.assertEqual(memo_report.outcomes, OrderedDict([('s1', 'hit'), ('s2', 'hit'), ('s3', 'hit')]))
+
+        # Changed inputs invalidate the results of a step and its dependents
+        step1.inputs.offset.value = 2
+        memo_report = MemoReport()
+        workflow.invoke(context=dict(value_cache=value_cache, memo_report=memo_report))
+        self.assertEqual(workflow.outputs.q.value, 10)
+        self.assertEqual(_INVOCATIONS, [3, 3])
+        self.assertEqual(value_cache['s2'], {'y': 4})
+        self.assertEqual(memo_report.outcomes,
+                         OrderedDict([('s1', 'invalidated'), ('s2', 'hit'), ('s3', 'invalidated')]))
+        self.assertEqual(str(memo_report), '1 hit(s), 0 shared, 0 restored, 0 miss(es), 2 invalidated')
+
+        workflow.inputs.p.value = 4
+        workflow.invoke(context=dict(value_cache=value_cache))
+        self.assertEqual(workflow.outputs.q.value, 12)
+        self.assertEqual(_INVOCATIONS, [3, 3, 4, 4])
+
+    def test_invoke_checkpoint_step(self):
+        step1 = OpStep(lazy_op, node_id='s1')
+        workflow = Workflow(OpMetaInfo('myWorkflow', inputs=OrderedDict(p={}), outputs=OrderedDict(q={})))
+        workflow.add_steps(step1)
+        step1.inputs.x.source = workflow.inputs.p
+        workflow.outputs.q.source = step1.outputs.y
+        workflow.inputs.p.value = 3
+
+        value_cache = ValueCache()
+        workflow.invoke(context=dict(value_cache=value_cache))
+        # Results are deferred computations
+        num_tasks = len(value_cache['s1']['y'].a.data.dask)
+        self.assertGreater(num_tasks, 2)
+
+        step1.checkpoint = True
+        value_cache = ValueCache()
+        workflow.invoke(context=dict(value_cache=value_cache))
+        # Results of checkpoints are computed, only one task per chunk is left
+        self.assertEqual(len(value_cache['s1']['y'].a.data.dask), 2)
+        self.assertEqual(float(workflow.outputs.q.value.a[0, 0]), 4.)
+
+        self.assertEqual(step1.to_json_dict()['checkpoint'], True)
+        self.assertTrue(OpStep.from_json_dict(step1.to_json_dict()).checkpoint)
+
+    @classmethod
+    def create_example_branches_workflow(cls, num_branches=3):
+        # num_branches independent chains of two slow steps each
+        workflow = Workflow(OpMetaInfo('myWorkflow', inputs=OrderedDict(p={}), outputs=OrderedDict(q={})))
+        steps = []
+        for i in range(num_branches):
+            step1 = OpStep(slow_op, node_id='s%d_1' % i)
+            step2 = OpStep(slow_op, node_id='s%d_2' % i)
+            step1.inputs.x.source = workflow.inputs.p
+            step2.inputs.x.source = step1.outputs.y
+            steps.extend([step1, step2])
+        workflow.add_steps(*steps)
+        return steps, workflow
+
+    def test_invoke_steps_concurrently(self):
+        steps, workflow = self.create_example_branches_workflow()
+        workflow.inputs.p.value = 3
+        _RUNNING['max_count'] = 0
+        monitor = RecordingMonitor()
+        t0 = time.perf_counter()
+        workflow.invoke_steps(steps, monitor=monitor, max_workers=4)
+        duration = time.perf_counter() - t0
+        self.assertEqual([step.outputs.y.value for step in steps], [4, 5, 4, 5, 4, 5])
+        self.assertEqual(_RUNNING['max_count'], 3)
+        # The critical path is two steps
+        self.assertLess(duration, 0.5)
+        self.assertAlmostEqual(monitor.worked, 6.)
+
+    def test_invoke_steps_concurrently_with_indirect_dependencies(self):
+        steps, workflow = self.create_example_branches_workflow(num_branches=1)
+        step3 = OpStep(slow_op, node_id='s0_3')
+        step3.inputs.x.source = steps[1].outputs.y
+        workflow.add_step(step3)
+        workflow.inputs.p.value = 3
+        workflow.invoke_steps(steps + [step3])
+        self.assertEqual(step3.outputs.y.value, 6)
+
+        # The first step and step3 depend on each other through the second step, which is not invoked
+        workflow.inputs.p.value = 10
+        _RUNNING['max_count'] = 0
+        workflow.invoke_steps([steps[0], step3], max_workers=4)
+        self.assertEqual(_RUNNING['max_count'], 1)
+        self.assertEqual(steps[0].outputs.y.value, 11)
+        self.assertEqual(steps[1].outputs.y.value, 5)
+        self.assertEqual(step3.outputs.y.value, 6)
+
+    def test_invoke_steps_concurrently_with_error(self):
+        steps, workflow = self.create_example_branches_workflow()
+        workflow.inputs.p.value = -1
+        with self.assertRaises(ValueError):
+            workflow.invoke_steps(steps, max_workers=4)
+        # Steps depending on failed steps are not invoked
+        self.assertEqual([step.outputs.y.value for step in steps], [None] * 6)
+
+    def test_invoke_steps_concurrently_cancelled(self):
+        steps, workflow = self.create_example_branches_workflow(num_branches=1)
+        workflow.inputs.p.value = 3
+        with self.assertRaises(Cancellation):
+            workflow.invoke_steps(steps, monitor=RecordingMonitor(cancel_after_work=1.), max_workers=4)
+        self.assertEqual(steps[0].outputs.y.value, 4)
+        self.assertEqual(steps[1].outputs.y.value, None)
+
     def test_invoke_with_context_inputs(self):
         def some_op(context, workflow, workflow_id, step, step_id, invalid):
             return dict(context=context,
@@ -1275,6 +1534,33 @@ class ValueCacheTest(TestCase):
         self.assertEqual(vc.get_update_count('bibo2'), None)
         self.assertEqual(vc.get_update_count('bibo3'), None)
 
+    def test_get_key(self):
+        bibo1 = object()
+        bibo2 = object()
+
+        vc = ValueCache()
+        vc['bibo1'] = bibo1
+        vc['bibo2'] = bibo2
+        self.assertEqual(vc.get_key(1), 'bibo1')
+        self.assertEqual(vc.get_key(2), 'bibo2')
+        self.assertIsNone(vc.get_key(3))
+        self.assertIs(vc.get_value_by_id(2), bibo2)
+        self.assertIs(vc.get_value_by_id(3), UNDEFINED)
+
+        vc.rename_key('bibo1', 'bert')
+        self.assertEqual(vc.get_key(1), 'bert')
+        self.assertIs(vc.get_value_by_id(1), bibo1)
+
+        del vc['bert']
+        self.assertIsNone(vc.get_key(1))
+        vc.pop('bibo2')
+        self.assertIsNone(vc.get_key(2))
+
+        vc['bibo3'] = object()
+        self.assertEqual(vc.get_key(3), 'bibo3')
+        vc.clear()
+        self.assertIsNone(vc.get_key(3))
+
     def test_rename_key(self):
         bibo = object()
 
@@ -1294,3 +1580,141 @@ class ValueCacheTest(TestCase):
         self.assertIn('bert._child', vc)
         self.assertIs(vc['bert._child'], bibo_child)
         self.assertEqual(vc.get_id('bert'), bibo_id)
+
+    def test_memoized_values(self):
+        bibo = ValueCacheTest.ClosableBibo()
+
+        vc = ValueCache()
+        self.assertEqual(vc.get_memoized_value('bibo', 'fp1'), (UNDEFINED, MemoReport.MISS))
+        vc.set_memoized_value('bibo', bibo, 'fp1')
+        self.assertEqual(vc.get_fingerprint('bibo'), 'fp1')
+        self.assertEqual(vc.get_memoized_value('bibo', 'fp1'), (bibo, MemoReport.HIT))
+        self.assertEqual(vc.get_memoized_value('bibo', None), (bibo, MemoReport.HIT))
+        self.assertEqual(vc.get_memoized_value('bibo', 'fp2'), (UNDEFINED, MemoReport.INVALIDATED))
+
+        # Values without fingerprints are reused, e.g. values restored from files
+        vc['bert'] = 'bert'
+        self.assertEqual(vc.get_memoized_value('bert', 'fp3'), ('bert', MemoReport.HIT))
+        self.assertEqual(vc.get_fingerprint('bert'), 'fp3')
+
+        # Setting a value resets its fingerprint
+        vc['bert'] = UNDEFINED
+        self.assertIsNone(vc.get_fingerprint('bert'))
+        self.assertEqual(vc.get_memoized_value('bert', 'fp3'), (UNDEFINED, MemoReport.MISS))
+
+        vc.rename_key('bibo', 'bibo2')
+        self.assertIsNone(vc.get_fingerprint('bibo'))
+        self.assertEqual(vc.get_fingerprint('bibo2'), 'fp1')
+
+    def test_shared_values_are_closed_once_unused(self):
+        bibo = ValueCacheTest.ClosableBibo()
+
+        vc = ValueCache()
+        vc.set_memoized_value('bibo1', bibo, 'fp')
+        self.assertEqual(vc.get_memoized_value('bibo2', 'fp'), (bibo, MemoReport.SHARED))
+        self.assertEqual(vc.get_memoized_value('bibo3', 'fp'), (bibo, MemoReport.SHARED))
+        self.assertIs(vc['bibo2'], bibo)
+        self.assertIs(vc['bibo3'], bibo)
+        self.assertEqual(vc.get_fingerprint('bibo3'), 'fp')
+
+        vc['bibo1'] = None
+        self.assertFalse(bibo.closed)
+        del vc['bibo2']
+        self.assertFalse(bibo.closed)
+        vc.pop('bibo3')
+        self.assertTrue(bibo.closed)
+
+    def test_shared_values_with_concurrent_steps(self):
+        bibo = ValueCacheTest.ClosableBibo()
+        vc = ValueCache()
+        vc.set_memoized_value('bibo', bibo, 'fp')
+        num_threads = 8
+        num_keys = 200
+        barrier = threading.Barrier(num_threads)
+        errors = []
+
+        def share_and_release(thread_index):
+            keys = ['bibo_%d_%d' % (thread_index, i) for i in range(num_keys)]
+            barrier.wait()
+            outcomes = [vc.get_memoized_value(key, 'fp') for key in keys]
+            barrier.wait()
+            try:
+                for key in keys[1::2]:
+                    del vc[key]
+            except Exception as e:
+                errors.append(e)
+            if any(outcome != (bibo, MemoReport.SHARED) for outcome in outcomes):
+                errors.append(outcomes)
+
+        # Switch threads often to provoke races
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=share_and_release, args=(i,)) for i in range(num_threads)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+
+        self.assertEqual(errors, [])
+        keys = [key for key in vc.keys()]
+        self.assertEqual(len(keys), 1 + num_threads * num_keys // 2)
+        self.assertEqual(len({vc.get_id(key) for key in keys}), len(keys))
+        for key in keys[:-1]:
+            del vc[key]
+            self.assertFalse(bibo.closed)
+        del vc[keys[-1]]
+        self.assertTrue(bibo.closed)
+
+    def test_lazy_values(self):
+        bibo = ValueCacheTest.ClosableBibo()
+        bert = ValueCacheTest.ClosableBibo()
+        lazy_bibo = LazyValue(lambda: bibo)
+        lazy_bert = LazyValue(lambda: bert)
+
+        vc = ValueCache()
+        vc['bibo'] = lazy_bibo
+        vc['bert'] = lazy_bert
+        self.assertTrue(vc.is_lazy('bibo'))
+        self.assertFalse(lazy_bibo.is_loaded)
+        self.assertEqual(vc.get_id('bibo'), 1)
+
+        self.assertEqual(vc.get_memoized_value('bibo', 'fp'), (lazy_bibo, MemoReport.HIT))
+        self.assertFalse(lazy_bibo.is_loaded)
+        self.assertIs(vc['bibo'], bibo)
+        self.assertTrue(lazy_bibo.is_loaded)
+        self.assertIs(vc.get('bibo'), bibo)
+        self.assertEqual(vc.get_update_count('bibo'), 0)
+
+        vc.close()
+        self.assertTrue(bibo.closed)
+        # Values never loaded are not loaded for closing them
+        self.assertFalse(lazy_bert.is_loaded)
+
+    def test_lazy_values_are_not_loaded_by_views_and_pop(self):
+        bibos = [ValueCacheTest.ClosableBibo() for _ in range(3)]
+        lazy_bibos = [LazyValue(lambda bibo=bibo: bibo) for bibo in bibos]
+        vc = ValueCache()
+        for index, lazy_bibo in enumerate(lazy_bibos):
+            vc['bibo%d' % index] = lazy_bibo
+
+        self.assertEqual(list(vc.values()), lazy_bibos)
+        self.assertEqual([value for _, value in vc.items()], lazy_bibos)
+        self.assertEqual(len(list(vc.values())), 3)
+        self.assertFalse(any(lazy_bibo.is_loaded for lazy_bibo in lazy_bibos))
+
+        self.assertIs(vc.pop('bibo0'), lazy_bibos[0])
+        self.assertFalse(lazy_bibos[0].is_loaded)
+        self.assertNotIn('bibo0', vc)
+
+        self.assertEqual(vc.loaded_values(), bibos[1:])
+        self.assertEqual(vc.loaded_items(), [('bibo1', bibos[1]), ('bibo2', bibos[2])])
+        self.assertTrue(lazy_bibos[1].is_loaded)
+        vc.pop('bibo1')
+        self.assertTrue(bibos[1].closed)
+
+        vc.clear()
+        self.assertTrue(bibos[2].closed)
+        self.assertFalse(bibos[0].closed)
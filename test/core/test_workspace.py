@@ -1,5 +1,7 @@
 import json
 import os
+import shutil
+import tempfile
 import unittest
 from collections import OrderedDict
 
@@ -193,6 +195,56 @@ class WorkspaceTest(unittest.TestCase):
             OP_REGISTRY.remove_op(int_op)
             OP_REGISTRY.remove_op(str_op)
 
+    def test_resource_descriptors_are_cached(self):
+
+        def cci_dataset_op() -> xr.Dataset:
+            # Many CCI datasets comprise about 100 variables, e.g. the uncertainties of every quantity
+            var_attrs = {'units': 'K', 'long_name': 'a variable', 'valid_range': np.array([0., 400.])}
+            data_vars = {'var_%d' % i: (('time', 'lat', 'lon'), np.zeros((2, 180, 360)), var_attrs)
+                         for i in range(100)}
+            return xr.Dataset(data_vars=data_vars,
+                              coords={'lon': np.linspace(-179.5, 179.5, 360),
+                                      'lat': np.linspace(89.5, -89.5, 180),
+                                      'time': pd.date_range('2010-01-01', periods=2),
+                                      'sample': np.arange(100000)})
+
+        from cate.core.op import OP_REGISTRY
+
+        try:
+            OP_REGISTRY.add_op(cci_dataset_op)
+            workflow = Workflow(OpMetaInfo('workspace_workflow', header=dict(description='Test!')))
+            workflow.add_step(OpStep(cci_dataset_op, node_id='ds'))
+            ws = Workspace('/path', workflow)
+            ws.execute_workflow()
+
+            res_1 = ws.to_json_dict()['resources'][0]
+            self.assertEqual(len(res_1['variables']), 100)
+            coord_vars = {coord_var['name']: coord_var for coord_var in res_1['coordVariables']}
+            self.assertEqual(set(coord_vars.keys()), {'lon', 'lat', 'time', 'sample'})
+            # Values of small coordinate variables are included, those of large ones are fetched separately
+            self.assertEqual(len(coord_vars['lon']['data']), 360)
+            self.assertEqual(coord_vars['lat']['data'][0], 89.5)
+            self.assertEqual(len(coord_vars['time']['data']), 2)
+            self.assertNotIn('isDataOmitted', coord_vars['lon'])
+            self.assertNotIn('data', coord_vars['sample'])
+            self.assertTrue(coord_vars['sample']['isDataOmitted'])
+            # Descriptors are built only once for every resource version
+            self.assertIs(ws.to_json_dict()['resources'][0], res_1)
+            # The payload doesn't grow with the size of the coordinates
+            self.assertLess(len(json.dumps(ws.to_json_dict())), 100 * 1024)
+
+            ws.rename_resource('ds', 'ds2')
+            res_2 = ws.to_json_dict()['resources'][0]
+            self.assertIsNot(res_2, res_1)
+            self.assertEqual(res_2['name'], 'ds2')
+
+            ws.resource_cache['ds2'] = cci_dataset_op()
+            res_3 = ws.to_json_dict()['resources'][0]
+            self.assertIsNot(res_3, res_2)
+            self.assertEqual(res_3['updateCount'], res_2['updateCount'] + 1)
+        finally:
+            OP_REGISTRY.remove_op(cci_dataset_op)
+
     def test_execute_empty_workflow(self):
         ws = Workspace('/path', Workflow(OpMetaInfo('workspace_workflow', header=dict(description='Test!'))))
         ws.execute_workflow()
@@ -228,6 +280,88 @@ class WorkspaceTest(unittest.TestCase):
         self.assertIn('X', ws.resource_cache)
         self.assertIn('Y', ws.resource_cache)
 
+    def test_open_reads_persistent_resources_lazily(self):
+        base_dir = tempfile.mkdtemp()
+        try:
+            ws = Workspace.create(base_dir)
+            ws.set_resource('cate.ops.io.read_netcdf', mk_op_kwargs(file=NETCDF_TEST_FILE_1), res_name='X')
+            ws.set_resource('cate.ops.timeseries.tseries_mean', mk_op_kwargs(ds="@X", var="precipitation"),
+                            res_name='Y')
+            ws.set_resource_persistence('X', True)
+            ws.set_resource_persistence('Y', True)
+            ws.execute_workflow()
+            ws.save()
+            ws.close()
+
+            ws = Workspace.open(base_dir)
+            self.assertTrue(ws.resource_cache.is_lazy('X'))
+            self.assertTrue(ws.resource_cache.is_lazy('Y'))
+            lazy_x = dict.get(ws.resource_cache, 'X')
+            lazy_y = dict.get(ws.resource_cache, 'Y')
+            self.assertFalse(lazy_x.is_loaded)
+            self.assertFalse(lazy_y.is_loaded)
+
+            # Y has been restored, so X is not required
+            ws.execute_workflow()
+            self.assertEqual(ws.memo_report.outcomes, OrderedDict([('X', 'hit'), ('Y', 'hit')]))
+            self.assertFalse(lazy_x.is_loaded)
+            self.assertFalse(lazy_y.is_loaded)
+
+            self.assertIsInstance(ws.resource_cache['Y'], xr.Dataset)
+            self.assertTrue(lazy_y.is_loaded)
+            self.assertFalse(lazy_x.is_loaded)
+
+            ws.set_resource('cate.ops.timeseries.tseries_mean', mk_op_kwargs(ds="@X", var="temperature"),
+                            res_name='Y', overwrite=True)
+            ws.execute_workflow('Y')
+            self.assertTrue(lazy_x.is_loaded)
+            self.assertIn('temperature', ws.resource_cache['Y'])
+            ws.close()
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
+    def test_save_writes_modified_resources_only(self):
+        base_dir = tempfile.mkdtemp()
+        try:
+            ws = Workspace.create(base_dir)
+            ws.set_resource('cate.ops.io.read_netcdf', mk_op_kwargs(file=NETCDF_TEST_FILE_1), res_name='X')
+            ws.set_resource('cate.ops.timeseries.tseries_mean', mk_op_kwargs(ds="@X", var="precipitation"),
+                            res_name='Y')
+            ws.set_resource_persistence('X', True)
+            ws.set_resource_persistence('Y', True)
+            ws.execute_workflow()
+            ws.save()
+
+            def get_inodes():
+                return [os.stat(os.path.join(ws.workspace_dir, file_name)).st_ino
+                        for file_name in ('workflow.json', 'X.nc', 'Y.nc')]
+
+            inodes_1 = get_inodes()
+            ws.save()
+            self.assertEqual(get_inodes(), inodes_1)
+
+            ws.set_resource('cate.ops.timeseries.tseries_mean', mk_op_kwargs(ds="@X", var="temperature"),
+                            res_name='Y', overwrite=True)
+            ws.set_resource_persistence('Y', True)
+            ws.execute_workflow('Y')
+            ws.save()
+            inodes_2 = get_inodes()
+            self.assertNotEqual(inodes_2[0], inodes_1[0])
+            self.assertEqual(inodes_2[1], inodes_1[1])
+            self.assertNotEqual(inodes_2[2], inodes_1[2])
+            self.assertEqual(sorted(os.listdir(ws.workspace_dir)), ['X.nc', 'Y.nc', 'workflow.json'])
+            ws.close()
+
+            # Unchanged resources read from their files are not written again
+            ws = Workspace.open(base_dir)
+            ws.execute_workflow()
+            ws.save()
+            self.assertEqual(get_inodes()[1:], inodes_2[1:])
+            self.assertFalse(ws.resource_cache.is_lazy('Y') and dict.get(ws.resource_cache, 'Y').is_loaded)
+            ws.close()
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
+
     def test_set_and_rename_and_execute_step(self):
         ws = Workspace('/path', Workflow(OpMetaInfo('workspace_workflow', header=dict(description='Test!'))))
         self.assertEqual(ws.user_data, {})
@@ -282,6 +416,37 @@ class WorkspaceTest(unittest.TestCase):
         self.assertEqual(ws.resource_cache.get('Z'), 5)
 
     # TODO (forman): #391
+    def test_set_resource_invalidates_dependent_resources_only(self):
+        ws = Workspace('/path', Workflow(OpMetaInfo('workspace_workflow', header=dict(description='Test!'))))
+
+        # Several hundred resources forming 10 independent chains
+        num_chains = 10
+        chain_length = 50
+        for i in range(num_chains):
+            ws.set_resource('cate.ops.utility.identity', mk_op_kwargs(value=i), res_name='r_%d_0' % i)
+            for j in range(1, chain_length):
+                ws.set_resource('cate.ops.utility.identity', mk_op_kwargs(value='@r_%d_%d' % (i, j - 1)),
+                                res_name='r_%d_%d' % (i, j))
+        ws.execute_workflow()
+        self.assertEqual(len(ws.resource_cache), num_chains * chain_length)
+
+        ws.set_resource('cate.ops.utility.identity', mk_op_kwargs(value=42), res_name='r_3_10', overwrite=True)
+        for i in range(num_chains):
+            for j in range(chain_length):
+                value = ws.resource_cache['r_%d_%d' % (i, j)]
+                if i == 3 and j >= 10:
+                    self.assertIs(value, UNDEFINED)
+                else:
+                    self.assertEqual(value, i)
+
+        ws.execute_workflow('r_3_%d' % (chain_length - 1))
+        self.assertEqual(ws.resource_cache['r_3_%d' % (chain_length - 1)], 42)
+
+        with self.assertRaises(WorkspaceError) as cm:
+            ws.delete_resource('r_5_%d' % (chain_length - 3))
+        self.assertEqual(str(cm.exception), 'Cannot delete resource "r_5_47" because the following resource(s) '
+                                            'depend on it: r_5_48, r_5_49')
+
     def test_set_resource_is_reentrant(self):
         from concurrent.futures import ThreadPoolExecutor
 
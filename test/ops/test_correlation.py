@@ -100,6 +100,9 @@ class TestPearson(TestCase):
         rm = RecordingMonitor()
         corr = pearson_correlation(ds1, ds2, 'first', 'first', monitor=rm)
         self.assertTrue(len(rm.records) > 0)
+        # Deferred (dask) computations stay deferred
+        self.assertIsNotNone(corr['corr_coef'].chunks)
+        self.assertIsNotNone(corr['p_value'].chunks)
 
         self.assertTrue(corr['corr_coef'].max() == corr['corr_coef'].min())
         self.assertTrue(corr['corr_coef'].max() == -0.5)
@@ -82,3 +82,19 @@ class TestOutliers(TestCase):
                          ret_first.attrs['ancillary_variables']))
         self.assertTrue(('second ' in
                          ret_first.attrs['ancillary_variables']))
+
+    def test_outliers_dask(self):
+        ds = xr.Dataset({
+            'first': xr.DataArray(np.arange(16, dtype=float).reshape(4, 4), dims=('x', 'y')),
+            'second': xr.DataArray(np.arange(16, dtype=float).reshape(4, 4) * 10, dims=('x', 'y'))
+        }).chunk({'x': 2})
+
+        ret_ds = outliers.detect_outliers(ds, '*')
+        # Outliers are replaced lazily
+        self.assertIsNotNone(ret_ds['first'].chunks)
+        # Quantiles are computed per variable
+        for var_name in ('first', 'second'):
+            test = ds[var_name].compute()
+            test[0][0] = np.nan
+            test[3][3] = np.nan
+            self.assertTrue(test.identical(ret_ds[var_name].compute()))
@@ -1,10 +1,17 @@
+import io
+import threading
+import time
 from unittest import TestCase
 
+import dask.array as da
+import matplotlib.cm as cm
 import numpy as np
+import xarray as xr
+from PIL import Image
 
 from cate.util.im import TilingScheme, GeoExtent
 from cate.util.im.image import ImagePyramid, OpImage, create_ndarray_downsampling_image, \
-    TransformArrayImage, FastNdarrayDownsamplingImage
+    TransformArrayImage, FastNdarrayDownsamplingImage, ColorMappedRgbaImage, _align_chunks, _has_multiple_chunks
 from cate.util.im.utils import aggregate_ndarray_mean
 
 
@@ -20,6 +27,137 @@ class MyTiledImage(OpImage):
         return np.full((th, tw), fill_value, np.float32)
 
 
+class SlowCountingImage(OpImage):
+    def __init__(self, tile_cache=None):
+        super().__init__((4, 4), (2, 2), (2, 2), mode='int32', format='ndarray', tile_cache=tile_cache)
+        self.num_computed = 0
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        self.num_computed += 1
+        time.sleep(0.05)
+        if tile_x < 0:
+            raise ValueError('invalid tile_x')
+        return np.full((2, 2), tile_x + tile_y, np.int32)
+
+
+class OpImageTest(TestCase):
+    def _get_tile_concurrently(self, image, tile_x, tile_y, num_threads=8):
+        results = []
+        errors = []
+
+        def get_tile():
+            try:
+                results.append(image.get_tile(tile_x, tile_y))
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=get_tile) for _ in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_get_tile_single_flight(self):
+        image = SlowCountingImage()
+        results, errors = self._get_tile_concurrently(image, 1, 0)
+        self.assertEqual(image.num_computed, 1)
+        self.assertEqual(errors, [])
+        self.assertEqual(len(results), 8)
+        for result in results:
+            self.assertEqual(result.tolist(), [[1, 1], [1, 1]])
+
+        # Without a cache, subsequent requests compute the tile again
+        image.get_tile(1, 0)
+        self.assertEqual(image.num_computed, 2)
+
+    def test_get_tile_single_flight_error(self):
+        image = SlowCountingImage()
+        results, errors = self._get_tile_concurrently(image, -1, 0)
+        self.assertEqual(image.num_computed, 1)
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 8)
+
+
+class ConstantTileImage(OpImage):
+    def __init__(self, tile):
+        height, width = tile.shape[-2:]
+        super().__init__((width, height), (width, height), (1, 1), mode=str(tile.dtype), format='ndarray',
+                         tile_cache=None)
+        self.tile = tile
+
+    def compute_tile(self, tile_x, tile_y, rectangle):
+        return self.tile
+
+
+class ColorMappedRgbaImageTest(TestCase):
+    @staticmethod
+    def _expected_rgba(array, value_range, cmap_name, num_colors, bad):
+        cmap = cm.get_cmap(cmap_name, num_colors)
+        value_min, value_max = value_range
+        normalized = (np.clip(array, value_min, value_max) - value_min) / (value_max - value_min)
+        rgba = cmap(np.ma.masked_array(normalized, mask=bad), bytes=True)
+        rgba[bad] = 0
+        return rgba
+
+    def test_float_tile_with_nan_and_no_data(self):
+        # Values at color bin centers, below and above the value range
+        array = (np.arange(64 * 64, dtype=np.float32).reshape((64, 64)) % 260 - 2 + 0.5) / 256 * 2.0 - 1.0
+        array[0, 0] = np.nan
+        array[1, 1] = -999.
+        image = ColorMappedRgbaImage(ConstantTileImage(array), value_range=(-1.0, 1.0), cmap_name='viridis',
+                                     no_data_value=-999.)
+        tile = image.get_tile(0, 0)
+        self.assertIsInstance(tile, Image.Image)
+        rgba = np.asarray(tile)
+        bad = np.isnan(array) | (array == -999.)
+        np.testing.assert_array_equal(rgba, self._expected_rgba(array, (-1.0, 1.0), 'viridis', 256, bad))
+        np.testing.assert_array_equal(rgba[0, 0], [0, 0, 0, 0])
+        np.testing.assert_array_equal(rgba[1, 1], [0, 0, 0, 0])
+
+    def test_masked_int_tile(self):
+        array = np.ma.masked_array(np.arange(32 * 32, dtype=np.int32).reshape((1, 32, 32)) % 16,
+                                   mask=np.zeros((1, 32, 32), dtype=np.bool_))
+        array[0, 3, 4] = np.ma.masked
+        image = ColorMappedRgbaImage(ConstantTileImage(array), value_range=(0, 16), cmap_name='jet', num_colors=16)
+        rgba = np.asarray(image.get_tile(0, 0))
+        self.assertEqual(rgba.shape, (32, 32, 4))
+        bad = np.ma.getmaskarray(array)[0]
+        np.testing.assert_array_equal(rgba, self._expected_rgba(array.data[0] + 0.5, (0, 16), 'jet', 16, bad))
+
+    def test_encode(self):
+        array = np.linspace(0.0, 1.0, 16 * 16).reshape((16, 16))
+        image = ColorMappedRgbaImage(ConstantTileImage(array), encode=True, format='PNG')
+        decoded_1 = np.asarray(Image.open(io.BytesIO(image.get_tile(0, 0))))
+        image_2 = ColorMappedRgbaImage(ConstantTileImage(1.0 - array), encode=True, format='PNG')
+        decoded_2 = np.asarray(Image.open(io.BytesIO(image_2.get_tile(0, 0))))
+        # Work buffers are reused, the results must not be affected
+        np.testing.assert_array_equal(decoded_1, np.asarray(ColorMappedRgbaImage(ConstantTileImage(array))
+                                                            .get_tile(0, 0)))
+        np.testing.assert_array_equal(decoded_2[::-1, ::-1], decoded_1)
+
+    def test_encode_palette(self):
+        array = np.linspace(0.0, 1.0, 16 * 16).reshape((16, 16))
+        array[0, 0] = np.nan
+        image = ColorMappedRgbaImage(ConstantTileImage(array), cmap_name='jet', encode=True, format='PNG',
+                                     palette=True, save_options=dict(compress_level=1))
+        decoded = Image.open(io.BytesIO(image.get_tile(0, 0)))
+        self.assertEqual(decoded.mode, 'P')
+        rgba = np.asarray(decoded.convert('RGBA'))
+        np.testing.assert_array_equal(rgba[0, 0], [0, 0, 0, 0])
+        bad = np.isnan(array)
+        expected = self._expected_rgba(np.floor(array * 255) / 255 + 0.5 / 255, (0.0, 1.0), 'jet', 255, bad)
+        np.testing.assert_array_equal(rgba, expected)
+
+    def test_encode_jpeg(self):
+        array = np.linspace(0.0, 1.0, 16 * 16).reshape((16, 16))
+        image = ColorMappedRgbaImage(ConstantTileImage(array), encode=True, format='JPEG',
+                                     save_options=dict(quality=90))
+        decoded = Image.open(io.BytesIO(image.get_tile(0, 0)))
+        self.assertEqual(decoded.format, 'JPEG')
+        self.assertEqual(decoded.mode, 'RGB')
+
+
 class NdarrayImageTest(TestCase):
     def test_default(self):
         a = np.arange(0, 24, dtype=np.int32)
@@ -93,6 +231,51 @@ class NdarrayImageTest(TestCase):
         self.assertEqual(target_image.get_tile(2, 1).tolist(), [[208, 212],
                                                                 [304, 308]])
 
+    def test_level_2_dask(self):
+        a = np.arange(0, 16 * 24, dtype=np.int32)
+        a.shape = 1, 16, 24
+        # Chunks are not aligned with tiles
+        array = xr.DataArray(a, dims=('time', 'lat', 'lon')).chunk(dict(lat=5, lon=7))[0]
+        source_image = FastNdarrayDownsamplingImage(array, (2, 2), 2)
+
+        tile = source_image.get_tile(1, 1)
+        self.assertIsInstance(tile, xr.DataArray)
+        self.assertEqual(tile.values.tolist(), [[200, 204],
+                                                [296, 300]])
+        self.assertEqual(source_image.get_tile(2, 0).values.tolist(), [[16, 20],
+                                                                       [112, 116]])
+
+    def test_level_2_dask_array(self):
+        a = np.arange(0, 16 * 24, dtype=np.int32).reshape((16, 24))
+        source_image = FastNdarrayDownsamplingImage(da.from_array(a, chunks=(3, 5)), (2, 2), 2)
+        self.assertEqual(np.asarray(source_image.get_tile(1, 1)).tolist(), [[200, 204],
+                                                                            [296, 300]])
+        self.assertEqual(np.asarray(source_image.get_tile(2, 0)).tolist(), [[16, 20],
+                                                                            [112, 116]])
+
+    def test_level_2_data_array(self):
+        a = np.arange(0, 16 * 24, dtype=np.int32).reshape((16, 24))
+        for array in (xr.DataArray(a, dims=('lat', 'lon')),
+                      xr.DataArray(a, dims=('lat', 'lon')).chunk(dict(lat=3, lon=5)),
+                      xr.DataArray(a, dims=('lat', 'lon')).chunk(dict(lat=16, lon=24))):
+            source_image = FastNdarrayDownsamplingImage(array, (2, 2), 2)
+            self.assertEqual(np.asarray(source_image.get_tile(1, 1)).tolist(), [[200, 204],
+                                                                                [296, 300]])
+
+    def test_has_multiple_chunks(self):
+        a = np.zeros((2, 16, 24))
+        self.assertFalse(_has_multiple_chunks(a))
+        self.assertFalse(_has_multiple_chunks(xr.DataArray(a)))
+        self.assertFalse(_has_multiple_chunks(da.from_array(a, chunks=(1, 16, 24))))
+        self.assertTrue(_has_multiple_chunks(da.from_array(a, chunks=(1, 16, 12))))
+        self.assertTrue(_has_multiple_chunks(xr.DataArray(a).chunk((2, 8, 24))))
+
+    def test_align_chunks(self):
+        self.assertEqual(_align_chunks((5, 5, 5, 1), 4), (4, 4, 8))
+        self.assertEqual(_align_chunks((900, 900), 16), (896, 904))
+        self.assertEqual(_align_chunks((1, 1, 1), 4), (3,))
+        self.assertEqual(_align_chunks((7,), 4), (7,))
+
     def test_force_masked(self):
         a = np.arange(0, 24, dtype=np.int32)
         a.shape = 4, 6
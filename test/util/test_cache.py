@@ -1,8 +1,10 @@
 import os
 import shutil
+import sys
 from unittest import TestCase
 
-from cate.util.cache import CacheStore, Cache, MemoryCacheStore, FileCacheStore
+from cate.util.cache import CacheStore, Cache, StripedCache, MemoryCacheStore, FileCacheStore, POLICY_MRU, \
+    POLICY_LFU, POLICY_RR
 
 
 class MemoryCacheStoreTest(TestCase):
@@ -92,6 +94,35 @@ class FileCacheStoreTest(TestCase):
         with self.assertRaises(FileNotFoundError):
             self.cache_store.restore_value('c', self.stored_value_c)
 
+    def test_get_stored_keys(self):
+        self.cache_store.store_value('x/y', bytes('jkl', 'utf8'))
+        os.utime(self.stored_value_a, (1, 1))
+        os.utime(self.stored_value_b, (2, 2))
+        os.utime(self.stored_value_c, (3, 3))
+        with open(os.path.join(FileCacheStoreTest.DIR, 'd.dat.0123.tmp'), 'wb') as fp:
+            fp.write(bytes('xyz', 'utf8'))
+        self.assertEqual(self.cache_store.get_stored_keys(), ['a', 'b', 'c', 'x/y'])
+
+    def test_cache_indexes_stored_values(self):
+        os.utime(self.stored_value_a, (1, 1))
+        os.utime(self.stored_value_b, (2, 2))
+        os.utime(self.stored_value_c, (3, 3))
+        cache = Cache(store=self.cache_store, capacity=8, threshold=1.0)
+        self.assertEqual(cache.size, 6)
+        self.assertEqual(cache.get_value('b'), bytes('def', 'utf8'))
+
+        cache.put_value('d', bytes('mno', 'utf8'))
+        self.assertEqual(cache.size, 6)
+        # 'a' has been least recently used, 'c' was the second least recently used
+        self.assertFalse(os.path.exists(self.stored_value_a))
+        self.assertFalse(os.path.exists(self.stored_value_c))
+        self.assertEqual(cache.get_value('a'), None)
+
+        # Value removed by another process
+        os.remove(self.stored_value_b)
+        self.assertEqual(cache.get_value('b'), None)
+        self.assertEqual(cache.size, 3)
+
 
 class TracingCacheStore(CacheStore):
     def __init__(self):
@@ -188,3 +219,119 @@ class CacheTest(TestCase):
         self.assertEqual(cache.get_value('k5'), 'yyyy')
         self.assertEqual(cache.size, 600)
         self.assertEqual(cache_store.trace, 'can_load_from_key(k5);load_from_key(k5);restore(k5, S/yyyy);')
+
+    def test_policy_mru(self):
+        cache_store = TracingCacheStore()
+        cache = Cache(store=cache_store, capacity=1000, policy=POLICY_MRU)
+
+        cache.put_value('k1', 'x')
+        cache.put_value('k2', 'xxx')
+        cache.put_value('k3', 'xx')
+        self.assertEqual(cache.get_value('k2'), 'xxx')
+
+        cache_store.trace = ''
+        cache.put_value('k4', 'xx')
+        self.assertEqual(cache.size, 500)
+        self.assertEqual(cache_store.trace, 'store(k4, xx);discard(k2, S/xxx);')
+
+    def test_policy_lfu(self):
+        cache_store = TracingCacheStore()
+        cache = Cache(store=cache_store, capacity=1000, policy=POLICY_LFU)
+
+        cache.put_value('k1', 'x')
+        cache.put_value('k2', 'xxx')
+        cache.put_value('k3', 'xx')
+        self.assertEqual(cache.get_value('k1'), 'x')
+        self.assertEqual(cache.get_value('k1'), 'x')
+        self.assertEqual(cache.get_value('k3'), 'xx')
+
+        cache_store.trace = ''
+        cache.put_value('k4', 'xx')
+        self.assertEqual(cache.size, 500)
+        self.assertEqual(cache_store.trace, 'store(k4, xx);discard(k2, S/xxx);')
+
+        cache_store.trace = ''
+        cache.put_value('k5', 'xxx')
+        self.assertEqual(cache.size, 600)
+        self.assertEqual(cache_store.trace, 'store(k5, xxx);discard(k4, S/xx);')
+
+    def test_policy_rr(self):
+        cache = Cache(store=MemoryCacheStore(), capacity=1000, policy=POLICY_RR)
+        for i in range(100):
+            cache.put_value('k%s' % i, 'x')
+        self.assertTrue(0 < cache.size <= cache.max_size)
+        num_items = sum(1 for i in range(100) if cache.get_value('k%s' % i) is not None)
+        self.assertEqual(num_items * sys.getsizeof('x'), cache.size)
+        self.assertEqual(cache.get_value('k99'), 'x')
+
+    def test_custom_policy(self):
+        cache_store = TracingCacheStore()
+        cache = Cache(store=cache_store, capacity=1000, policy=lambda item: -item.stored_size)
+
+        cache.put_value('k1', 'x')
+        cache.put_value('k2', 'xxx')
+        cache.put_value('k3', 'xx')
+
+        cache_store.trace = ''
+        cache.put_value('k4', 'xx')
+        self.assertEqual(cache.size, 500)
+        self.assertEqual(cache_store.trace, 'store(k4, xx);discard(k2, S/xxx);')
+
+    def test_parent_cache(self):
+        parent_cache_store = TracingCacheStore()
+        parent_cache = Cache(store=parent_cache_store, capacity=1000)
+        cache_store = TracingCacheStore()
+        cache = Cache(store=cache_store, capacity=500, parent_cache=parent_cache)
+
+        cache.put_value('k1', 'x')
+        cache.put_value('k2', 'xx')
+        cache.put_value('k3', 'x')
+        self.assertEqual(cache.size, 300)
+        self.assertEqual(parent_cache.size, 100)
+        self.assertEqual(cache.get_value('k1'), 'x')
+        self.assertEqual(parent_cache_store.trace, 'store(k1, x);restore(k1, S/x);')
+
+
+class StripedCacheTest(TestCase):
+    def test_store_and_restore_and_discard(self):
+        cache_store = TracingCacheStore()
+        cache = StripedCache(store=cache_store, capacity=4000, num_stripes=4)
+
+        self.assertIs(cache.store, cache_store)
+        self.assertEqual(cache.num_stripes, 4)
+        self.assertEqual(cache.size, 0)
+        self.assertEqual(cache.max_size, 3000)
+
+        for i in range(100):
+            cache.put_value('k%s' % i, 'x')
+        self.assertTrue(0 < cache.size <= cache.max_size)
+        self.assertEqual(cache.get_value('k99'), 'x')
+
+        cache.remove_value('k99')
+        self.assertEqual(cache.get_value('k99'), None)
+
+        cache.clear()
+        self.assertEqual(cache.size, 0)
+
+    def test_invalid_num_stripes(self):
+        with self.assertRaises(ValueError):
+            StripedCache(num_stripes=0)
+
+    def test_concurrent_access(self):
+        import threading
+
+        cache = StripedCache(store=MemoryCacheStore(), capacity=100 * sys.getsizeof(0), num_stripes=8)
+
+        def worker(offset):
+            for i in range(1000):
+                key = (offset + i) % 200
+                if cache.get_value(key) is None:
+                    cache.put_value(key, key)
+
+        threads = [threading.Thread(target=worker, args=(100 * i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(0 < cache.size <= cache.max_size)
@@ -1,8 +1,10 @@
 import os.path
 import sys
-from unittest import TestCase
+import threading
+import time
+from unittest import TestCase, skipIf
 
-from cate.util.process import run_subprocess, ProcessOutputMonitor
+from cate.util.process import run_subprocess, ProcessOutputMonitor, ProcessPool
 from .test_monitor import RecordingMonitor
 
 DIR = os.path.dirname(__file__)
@@ -102,3 +104,62 @@ class ProcessTest(TestCase):
                                                 ('progress', 1.0, None, 80),
                                                 ('progress', 1.0, None, 100),
                                                 ('done',)])
+
+
+class ProcessPoolTest(TestCase):
+    def test_run_all(self):
+        pool = ProcessPool(max_processes=2)
+        max_num_running = []
+
+        def record_num_running(process):
+            max_num_running.append(pool.num_running)
+
+        t0 = time.perf_counter()
+        exit_codes = pool.run_all([[sys.executable, '-c', 'import time; time.sleep(0.5); exit(%d)' % i]
+                                   for i in range(4)],
+                                  started_handler=record_num_running)
+        t1 = time.perf_counter()
+        self.assertEqual(exit_codes, [0, 1, 2, 3])
+        self.assertEqual(len(max_num_running), 4)
+        # Processes run concurrently, but never more than two
+        self.assertEqual(max(max_num_running), 2)
+        # At least two batches of two processes each, no upper bound as process startup may be slow
+        self.assertGreater(t1 - t0, 0.9)
+        self.assertEqual(pool.num_running, 0)
+        self.assertEqual(pool.num_waiting, 0)
+
+    def test_run_cancelled_while_waiting(self):
+        pool = ProcessPool(max_processes=1)
+        cancelled = threading.Event()
+        thread = threading.Thread(target=pool.run,
+                                  args=([sys.executable, '-c', 'import time; time.sleep(1)'],))
+        thread.start()
+        time.sleep(0.2)
+        threading.Timer(0.1, cancelled.set).start()
+        exit_code = pool.run([sys.executable, '-c', 'exit(0)'], is_cancelled=cancelled.is_set,
+                             cancelled_check_period=0.02)
+        self.assertIsNone(exit_code)
+        thread.join()
+
+    @skipIf(sys.platform == 'win32', 'CPU time of killed processes is not reliable on Windows')
+    def test_run_with_cpu_time_limit(self):
+        pool = ProcessPool(max_processes=1, cpu_time_limit=1)
+        t0 = time.perf_counter()
+        exit_code = pool.run([sys.executable, '-c', 'while True: pass'])
+        self.assertNotEqual(exit_code, 0)
+        self.assertLess(time.perf_counter() - t0, 10)
+
+    @skipIf(not sys.platform.startswith('linux'), 'memory limits are only set as resource limits on Linux')
+    def test_run_with_memory_limit(self):
+        pool = ProcessPool(max_processes=1, memory_limit=512 * 1024 * 1024)
+        exit_code = pool.run([sys.executable, '-c', 'import time; time.sleep(0.5); b = bytearray(1024 ** 3)'])
+        self.assertNotEqual(exit_code, 0)
+        exit_code = pool.run([sys.executable, '-c', 'import time; time.sleep(0.5); b = bytearray(1024 ** 2)'])
+        self.assertEqual(exit_code, 0)
+
+    @skipIf(sys.platform == 'win32', 'CPU time of killed processes is not reliable on Windows')
+    def test_run_with_limits_from_many_threads(self):
+        # Limits must be set without a preexec_fn, which may deadlock children forked while other threads run
+        pool = ProcessPool(max_processes=4, cpu_time_limit=5, memory_limit=1024 ** 3)
+        exit_codes = pool.run_all([[sys.executable, '-c', 'exit(0)']] * 16)
+        self.assertEqual(exit_codes, [0] * 16)
@@ -1,7 +1,18 @@
+import json
+import threading
 import unittest
 
+import numpy as np
+
 from cate.util import Monitor
-from cate.util.web.jsonrpchandler import JsonRpcWebSocketHandler, set_debug_web_socket_rpc
+from cate.util.web import JsonRpcScheduler
+from cate.util.web.jsonrpchandler import JsonRpcWebSocketHandler, set_debug_web_socket_rpc, JSON_SUBPROTOCOL, \
+    MSGPACK_SUBPROTOCOL, MSGPACK_EXT_TYPE_NDARRAY
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 set_debug_web_socket_rpc(True)
 
@@ -18,8 +29,11 @@ class ConnectionMock:
 
 
 class WsConnectionMock:
+    def __init__(self):
+        self.messages = []
+
     def write_message(self, message, binary=False):
-        pass
+        self.messages.append((message, binary))
 
 
 class RequestMock:
@@ -63,6 +77,30 @@ class JsonRpcWebSocketHandlerTest(unittest.TestCase):
         self.handler.on_close()
         self.assertIsNone(self.handler._service)
 
+    def test_on_close_cancels_waiting_calls(self):
+        scheduler = JsonRpcScheduler(fast_max_workers=1)
+        handler = JsonRpcWebSocketHandler(ApplicationMock(),
+                                          RequestMock(),
+                                          lambda app: DoItService(app),
+                                          scheduler=scheduler)
+        handler.open()
+        handler.ws_connection = WsConnectionMock()
+        blocker = threading.Event()
+        # Occupy the only worker of the fast lane
+        blocking_future = scheduler.submit(blocker.wait, 10)
+
+        handler.on_message('{"id": 1, "method": "doit1", "params": {"a": 2, "b": 4.2, "c": "1.6"}}')
+        future = handler._active_futures[1]
+        self.assertFalse(future.done())
+
+        handler.on_close()
+        self.assertTrue(future.cancelled())
+        self.assertEqual(handler._active_futures, {})
+
+        blocker.set()
+        self.assertTrue(blocking_future.result(timeout=10))
+        self.assertEqual(scheduler.get_metrics()['lanes']['fast']['num_waiting'], 0)
+
     def test_check_origin(self):
         self.assertTrue(self.handler.check_origin(None))
 
@@ -105,3 +143,48 @@ class JsonRpcWebSocketHandlerTest(unittest.TestCase):
 
         ret = self.handler.on_message('{"id": 4, "method": "doit3"}')
         self.assertEqual(ret, 6)
+
+    def test_compression_options(self):
+        self.assertIsNone(self.handler.get_compression_options())
+        handler = JsonRpcWebSocketHandler(ApplicationMock(),
+                                          RequestMock(),
+                                          lambda app: DoItService(app),
+                                          compression_level=6)
+        self.assertEqual(handler.get_compression_options(), dict(compression_level=6))
+
+    def test_json_responses(self):
+        self.assertEqual(self.handler.select_subprotocol([JSON_SUBPROTOCOL]), JSON_SUBPROTOCOL)
+        self.assertIsNone(self.handler.select_subprotocol(['other']))
+        self.handler.open()
+        self.handler.ws_connection = WsConnectionMock()
+
+        self.assertTrue(self.handler._write_json_rpc_result_response(1, 'doit1', result=[1.5, 2.5]))
+        message, binary = self.handler.ws_connection.messages[0]
+        self.assertFalse(binary)
+        self.assertEqual(json.loads(message), dict(jsonrpc='2.0', id=1, response=[1.5, 2.5]))
+
+    @unittest.skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_responses(self):
+        self.assertEqual(self.handler.select_subprotocol([MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL]),
+                         MSGPACK_SUBPROTOCOL)
+        self.handler.open()
+        self.handler.ws_connection = WsConnectionMock()
+
+        result = dict(min=np.float32(0.5), values=np.arange(6, dtype=np.float64).reshape((2, 3)))
+        self.assertTrue(self.handler._write_json_rpc_result_response(1, 'doit1', result=result))
+        message, binary = self.handler.ws_connection.messages[0]
+        self.assertTrue(binary)
+
+        def ext_hook(code, data):
+            self.assertEqual(code, MSGPACK_EXT_TYPE_NDARRAY)
+            dtype, shape, buffer = msgpack.unpackb(data, raw=False)
+            return np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+        response = msgpack.unpackb(message, raw=False, ext_hook=ext_hook)
+        self.assertEqual(response['id'], 1)
+        self.assertEqual(response['response']['min'], 0.5)
+        np.testing.assert_array_equal(response['response']['values'], result['values'])
+
+        # Requests may be sent as MessagePack too
+        ret = self.handler.on_message(msgpack.packb(dict(id=2, method='doit3'), use_bin_type=True))
+        self.assertEqual(ret, 6)
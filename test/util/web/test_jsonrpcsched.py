@@ -0,0 +1,127 @@
+import threading
+import time
+from unittest import TestCase
+
+from cate.util.web.jsonrpcsched import JsonRpcScheduler, get_default_scheduler
+
+
+class _Probe:
+    """Records the maximum number of calls running in parallel, per key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._num_running = dict()
+        self.max_num_running = dict()
+
+    def run(self, key, duration=0.05):
+        with self._lock:
+            num_running = self._num_running.get(key, 0) + 1
+            self._num_running[key] = num_running
+            self.max_num_running[key] = max(self.max_num_running.get(key, 0), num_running)
+        time.sleep(duration)
+        with self._lock:
+            self._num_running[key] -= 1
+        return key
+
+
+class JsonRpcSchedulerTest(TestCase):
+    def test_results_and_errors(self):
+        scheduler = JsonRpcScheduler()
+
+        def fail():
+            raise ValueError('oops')
+
+        self.assertEqual(scheduler.submit(lambda x, y=0: x + y, 1, y=2).result(timeout=5), 3)
+        with self.assertRaises(ValueError):
+            scheduler.submit(fail).result(timeout=5)
+
+    def test_max_workers(self):
+        scheduler = JsonRpcScheduler(fast_max_workers=2)
+        probe = _Probe()
+        futures = [scheduler.submit(probe.run, 'all') for _ in range(8)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(probe.max_num_running['all'], 2)
+        self.assertEqual(scheduler.get_metrics()['lanes']['fast']['num_workers'], 2)
+
+    def test_max_calls_per_connection(self):
+        scheduler = JsonRpcScheduler(fast_max_workers=4, max_calls_per_connection=1)
+        probe = _Probe()
+        connection_1 = object()
+        connection_2 = object()
+        futures = [scheduler.submit(probe.run, 'c1', connection=connection_1) for _ in range(3)]
+        futures += [scheduler.submit(probe.run, 'c2', connection=connection_2) for _ in range(3)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(probe.max_num_running, {'c1': 1, 'c2': 1})
+
+    def test_method_limits(self):
+        scheduler = JsonRpcScheduler(fast_max_workers=4, method_limits=dict(open_workspace=1))
+        probe = _Probe()
+        futures = [scheduler.submit(probe.run, 'open_workspace', method_name='open_workspace') for _ in range(3)]
+        futures += [scheduler.submit(probe.run, 'get_config', method_name='get_config') for _ in range(3)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(probe.max_num_running['open_workspace'], 1)
+        self.assertGreater(probe.max_num_running['get_config'], 1)
+
+    def test_fast_calls_do_not_wait_for_slow_calls(self):
+        scheduler = JsonRpcScheduler(fast_max_workers=1, slow_max_workers=1)
+        event = threading.Event()
+        slow_future = scheduler.submit(event.wait, 5, slow=True)
+        fast_future = scheduler.submit(lambda: 'fast')
+        self.assertEqual(fast_future.result(timeout=5), 'fast')
+        self.assertFalse(slow_future.done())
+        event.set()
+        self.assertTrue(slow_future.result(timeout=5))
+
+    def test_cancelled_calls_are_dropped(self):
+        scheduler = JsonRpcScheduler(fast_max_workers=1)
+        event = threading.Event()
+        calls = []
+        blocking_future = scheduler.submit(event.wait, 5)
+        cancelled_future = scheduler.submit(calls.append, 'cancelled')
+        self.assertTrue(cancelled_future.cancel())
+        last_future = scheduler.submit(calls.append, 'last')
+        event.set()
+        blocking_future.result(timeout=5)
+        last_future.result(timeout=5)
+        self.assertEqual(calls, ['last'])
+
+    def test_is_slow_method(self):
+        self.assertTrue(JsonRpcScheduler().is_slow_method('open_workspace', has_monitor=True))
+        self.assertFalse(JsonRpcScheduler().is_slow_method('get_config'))
+        scheduler = JsonRpcScheduler(slow_methods=['get_color_maps'])
+        self.assertTrue(scheduler.is_slow_method('get_color_maps'))
+        self.assertTrue(scheduler.is_slow_method('get_data_sources', has_monitor=True))
+        self.assertFalse(scheduler.is_slow_method('get_config'))
+
+    def test_get_metrics(self):
+        scheduler = JsonRpcScheduler(fast_max_workers=1)
+        event = threading.Event()
+        connection = object()
+        futures = [scheduler.submit(event.wait, 5, connection=connection, method_name='wait') for _ in range(3)]
+        time.sleep(0.05)
+        metrics = scheduler.get_metrics()
+        self.assertEqual(metrics['lanes']['fast']['num_running'], 1)
+        self.assertEqual(metrics['lanes']['fast']['num_waiting'], 2)
+        self.assertEqual(metrics['num_connections'], 1)
+        event.set()
+        for future in futures:
+            future.result(timeout=5)
+        metrics = scheduler.get_metrics()
+        self.assertEqual(metrics['lanes']['fast']['num_running'], 0)
+        self.assertEqual(metrics['lanes']['fast']['num_waiting'], 0)
+        self.assertEqual(metrics['lanes']['fast']['num_completed'], 3)
+        self.assertEqual(metrics['lanes']['slow']['num_completed'], 0)
+        self.assertGreater(metrics['lanes']['fast']['max_wait_time'], 0.)
+        self.assertEqual(metrics['num_connections'], 0)
+
+    def test_invalid_args(self):
+        with self.assertRaises(ValueError):
+            JsonRpcScheduler(fast_max_workers=0)
+        with self.assertRaises(ValueError):
+            JsonRpcScheduler(max_calls_per_connection=0)
+
+    def test_get_default_scheduler(self):
+        self.assertIs(get_default_scheduler(), get_default_scheduler())
@@ -1,8 +1,14 @@
 import json
 import os
+import shutil
+import tempfile
 import unittest
+import urllib.parse
 
+import numpy as np
+import xarray as xr
 from tornado.testing import AsyncHTTPTestCase
+
 from cate.webapi.main import create_application
 
 NETCDF_TEST_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'precip_and_temp.nc')
@@ -23,3 +29,61 @@ class WebAPITest(AsyncHTTPTestCase):
         self.assertIn('content', json_dict)
         self.assertIn('name', json_dict['content'])
         self.assertIn('version', json_dict['content'])
+
+    def test_metrics(self):
+        response = self.fetch('/api/metrics')
+        self.assertEqual(response.code, 200)
+        json_dict = json.loads(response.body.decode('utf-8'))
+        self.assertEqual(json_dict['status'], 'ok')
+        self.assertEqual(set(json_dict['content']['lanes'].keys()), {'fast', 'slow'})
+        self.assertEqual(json_dict['content']['lanes']['fast']['num_waiting'], 0)
+
+    def test_slow_methods(self):
+        scheduler = self._app.json_rpc_scheduler
+        # Heavy methods not reporting progress run in the slow lane, too
+        self.assertTrue(scheduler.is_slow_method('get_workspace_variable_statistics'))
+        self.assertTrue(scheduler.is_slow_method('get_color_maps'))
+        self.assertTrue(scheduler.is_slow_method('open_workspace', has_monitor=True))
+        self.assertFalse(scheduler.is_slow_method('get_config'))
+
+    def test_res_coords(self):
+        base_dir = tempfile.mkdtemp()
+        try:
+            workspace = self._app.workspace_manager.new_workspace(base_dir)
+            workspace.resource_cache['ds'] = xr.Dataset({'a': (('lat', 'lon'), np.zeros((3, 4)))},
+                                                        coords={'lat': [10., 20., 30.], 'lon': [1., 2., 3., 4.]})
+            url = '/ws/res/coords/%s/ds' % urllib.parse.quote(workspace.base_dir, safe='')
+
+            response = self.fetch(url + '?var=lon&offset=1&count=2')
+            self.assertEqual(response.code, 200)
+            json_dict = json.loads(response.body.decode('utf-8'))
+            self.assertEqual(json_dict['status'], 'ok')
+            self.assertEqual(json_dict['content'], dict(name='lon', dataType='float64', offset=1, count=2, size=4,
+                                                        values=[2., 3.]))
+
+            response = self.fetch(url + '?var=lat&format=binary')
+            self.assertEqual(response.code, 200)
+            self.assertEqual(response.headers['Content-Type'], 'application/octet-stream')
+            self.assertEqual(response.headers['X-Cate-Size'], '3')
+            values = np.frombuffer(response.body, dtype=response.headers['X-Cate-Data-Type'])
+            self.assertEqual(values.tolist(), [10., 20., 30.])
+
+            # Page starting at the end
+            response = self.fetch(url + '?var=lon&offset=4')
+            json_dict = json.loads(response.body.decode('utf-8'))
+            self.assertEqual(json_dict['content']['values'], [])
+
+            for query, message in (('?var=a', 'no 1D coordinate variable'),
+                                   ('?var=lon&offset=x', 'must be integers'),
+                                   ('?var=lon&count=2.5', 'must be integers'),
+                                   ('?var=lon&offset=5', 'must not exceed'),
+                                   ('?var=lon&offset=1&count=-1', 'must not be negative')):
+                response = self.fetch(url + query)
+                self.assertEqual(response.code, 200)
+                json_dict = json.loads(response.body.decode('utf-8'))
+                self.assertEqual(json_dict['status'], 'error')
+                self.assertIn(message, json_dict['error']['message'])
+
+            self._app.workspace_manager.close_workspace(workspace.base_dir)
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
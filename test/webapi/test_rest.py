@@ -0,0 +1,239 @@
+import functools
+import io
+import os
+import threading
+import unittest
+
+import numpy as np
+import tornado.testing
+import xarray as xr
+from PIL import Image
+from tornado.web import Application
+
+from cate.core.workflow import ValueCache
+from cate.util.web.webapi import url_pattern
+from cate.webapi.rest import ResVarTileHandler, TileExecutor, ImagePyramidRegistry, IMAGE_PYRAMIDS
+
+
+class FakeWorkspace:
+    def __init__(self, resources):
+        self.base_dir = 'ws1'
+        self.resource_cache = ValueCache()
+        for res_name, value in resources.items():
+            self.resource_cache[res_name] = value
+
+
+class FakeWorkspaceManager:
+    def __init__(self, workspace):
+        self.workspace = workspace
+
+    def get_workspace(self, base_dir):
+        return self.workspace
+
+
+def new_dataset():
+    lon = np.linspace(-179.5, 179.5, 360)
+    lat = np.linspace(89.5, -89.5, 180)
+    sst = np.random.uniform(270., 310., size=(2, 180, 360))
+    return xr.Dataset({'sst': (('time', 'lat', 'lon'), sst)},
+                      coords={'lon': lon, 'lat': lat, 'time': [1, 2]})
+
+
+class TileExecutorTest(unittest.TestCase):
+    def test_priority_and_cancellation(self):
+        executor = TileExecutor(max_workers=1, max_queue_size=5)
+        blocker_started = threading.Event()
+        blocker = threading.Event()
+        trace = []
+
+        def compute(name):
+            trace.append(name)
+            return name
+
+        def block():
+            blocker_started.set()
+            return blocker.wait()
+
+        blocking_future = executor.submit(block)
+        blocker_started.wait()
+        future_a = executor.submit(functools.partial(compute, 'a'), group='ws', level=1)
+        future_b = executor.submit(functools.partial(compute, 'b'), group='ws', level=2)
+        future_c = executor.submit(functools.partial(compute, 'c'), group='ws', level=2)
+        future_d = executor.submit(functools.partial(compute, 'd'), group='ws', level=2)
+        self.assertEqual(executor.num_pending, 5)
+        self.assertIsNone(executor.submit(functools.partial(compute, 'e'), group='ws', level=2))
+
+        self.assertTrue(future_c.cancel())
+        self.assertEqual(executor.num_pending, 4)
+
+        blocker.set()
+        self.assertTrue(blocking_future.result(timeout=10))
+        self.assertEqual(future_a.result(timeout=10), 'a')
+        self.assertEqual(future_b.result(timeout=10), 'b')
+        self.assertEqual(future_d.result(timeout=10), 'd')
+        # Most recent level first, most recent request first
+        self.assertEqual(trace, ['d', 'b', 'a'])
+
+    def test_error(self):
+        executor = TileExecutor(max_workers=2, max_queue_size=2)
+        future = executor.submit(functools.partial(int, 'x'))
+        with self.assertRaises(ValueError):
+            future.result(timeout=10)
+
+    def test_keyword_arguments(self):
+        executor = TileExecutor(max_workers=1, max_queue_size=2)
+
+        def compute(group=None, level=None):
+            return group, level
+
+        future = executor.submit(functools.partial(compute, group='g', level=3), group='ws', level=1)
+        self.assertEqual(future.result(timeout=10), ('g', 3))
+
+    def test_forget_group(self):
+        executor = TileExecutor(max_workers=1, max_queue_size=4)
+        executor.submit(functools.partial(int, '1'), group='ws1', level=1).result(timeout=10)
+        executor.submit(functools.partial(int, '2'), group='ws2', level=2).result(timeout=10)
+        self.assertEqual(executor._latest_levels, {'ws1': 1, 'ws2': 2})
+        executor.forget_group('ws1')
+        self.assertEqual(executor._latest_levels, {'ws2': 2})
+        executor.forget_group()
+        self.assertEqual(executor._latest_levels, {})
+
+
+class FakePyramid:
+    def __init__(self, name):
+        self.name = name
+        self.disposed = False
+
+    def dispose(self):
+        self.disposed = True
+
+
+class ImagePyramidRegistryTest(unittest.TestCase):
+    def test_update_count(self):
+        registry = ImagePyramidRegistry(capacity=4)
+        p1 = FakePyramid('p1')
+        self.assertIs(registry.put(('ws', 1, 'sst'), 0, p1), p1)
+        self.assertIs(registry.get(('ws', 1, 'sst'), 0), p1)
+        self.assertIs(registry.put(('ws', 1, 'sst'), 0, FakePyramid('p2')), p1)
+        self.assertFalse(p1.disposed)
+
+        # Resource has been updated
+        self.assertIsNone(registry.get(('ws', 1, 'sst'), 1))
+        self.assertTrue(p1.disposed)
+        self.assertEqual(registry.size, 0)
+
+    def test_lru_eviction(self):
+        registry = ImagePyramidRegistry(capacity=2)
+        p1, p2, p3, d3 = FakePyramid('p1'), FakePyramid('p2'), FakePyramid('p3'), FakePyramid('d3')
+        registry.put(('ws', 1, 'sst'), 0, p1)
+        registry.put(('ws', 2, 'sst'), 0, p2)
+        registry.get(('ws', 1, 'sst'), 0)
+        registry.put(('ws', 3, 'sst'), 0, p3, [d3])
+        self.assertEqual(registry.size, 2)
+        self.assertFalse(p1.disposed)
+        self.assertTrue(p2.disposed)
+        self.assertIsNone(registry.get(('ws', 2, 'sst'), 0))
+
+        registry.put(('ws', 4, 'sst'), 0, FakePyramid('p4'))
+        self.assertTrue(p1.disposed)
+        self.assertFalse(p3.disposed)
+        self.assertFalse(d3.disposed)
+
+    def test_dispose_workspace(self):
+        registry = ImagePyramidRegistry(capacity=4)
+        p1, p2, p3 = FakePyramid('p1'), FakePyramid('p2'), FakePyramid('p3')
+        registry.put(('ws1', 1, 'sst'), 0, p1)
+        registry.put(('ws2', 1, 'sst'), 0, p2)
+        registry.put(('ws1', 2, 'sst'), 0, p3)
+        registry.dispose_workspace('ws1')
+        self.assertEqual([p1.disposed, p2.disposed, p3.disposed], [True, False, True])
+        self.assertEqual(registry.size, 1)
+        registry.dispose_workspace()
+        self.assertTrue(p2.disposed)
+        self.assertEqual(registry.size, 0)
+
+
+@unittest.skipIf(os.environ.get('CATE_DISABLE_WEB_TESTS', None) == '1', 'CATE_DISABLE_WEB_TESTS = 1')
+class ResVarTileHandlerTest(tornado.testing.AsyncHTTPTestCase):
+    def get_app(self):
+        application = Application([
+            (url_pattern('/ws/res/tile/{{base_dir}}/{{res_name}}/{{z}}/{{y}}/{{x}}.png'), ResVarTileHandler),
+        ])
+        self.workspace = FakeWorkspace(dict(ds=new_dataset(), n=42))
+        application.workspace_manager = FakeWorkspaceManager(self.workspace)
+        return application
+
+    def tearDown(self):
+        IMAGE_PYRAMIDS.dispose_workspace()
+        super().tearDown()
+
+    def test_tile(self):
+        response = self.fetch('/ws/res/tile/ws1/ds/0/0/0.png?var=sst&index=1&cmap=jet&min=270&max=310')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'image/png')
+        self.assertEqual(response.body[:4], b'\x89PNG')
+        # Palette PNGs are opt-in
+        self.assertEqual(Image.open(io.BytesIO(response.body)).mode, 'RGBA')
+
+    def test_tile_formats(self):
+        url = '/ws/res/tile/ws1/ds/0/0/0.png?var=sst&index=1&cmap=jet&min=270&max=310'
+        response = self.fetch(url + '&format=png8&compress_level=1')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'image/png')
+        self.assertEqual(Image.open(io.BytesIO(response.body)).mode, 'P')
+
+        response = self.fetch(url + '&format=png')
+        self.assertEqual(Image.open(io.BytesIO(response.body)).mode, 'RGBA')
+
+        response = self.fetch(url + '&format=webp&quality=50')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'image/webp')
+        self.assertEqual(response.body[8:12], b'WEBP')
+
+        response = self.fetch(url + '&format=gif')
+        self.assertEqual(response.code, 200)
+        self.assertIn(b'Unknown tile format', response.body)
+
+        response = self.fetch(url + '&compress_level=high')
+        self.assertEqual(response.code, 200)
+        self.assertIn(b'compress_level and quality must be integers', response.body)
+
+        response = self.fetch(url + '&format=webp&quality=500')
+        self.assertEqual(response.code, 200)
+        self.assertIn(b'quality in the range 0 to 100', response.body)
+
+    def test_tile_of_updated_resource(self):
+        url = '/ws/res/tile/ws1/ds/0/0/0.png?var=sst&index=1&cmap=jet&min=270&max=310'
+        response1 = self.fetch(url)
+        self.assertEqual(response1.code, 200)
+        self.assertEqual(self.fetch(url).body, response1.body)
+        self.assertEqual(IMAGE_PYRAMIDS.size, 1)
+
+        dataset = new_dataset()
+        dataset.sst[1, :, :] = 300.
+        self.workspace.resource_cache['ds'] = dataset
+        response2 = self.fetch(url)
+        self.assertEqual(response2.code, 200)
+        self.assertNotEqual(response2.body, response1.body)
+        self.assertEqual(IMAGE_PYRAMIDS.size, 1)
+
+    def test_tile_with_default_min_max(self):
+        url = '/ws/res/tile/ws1/ds/0/0/0.png?var=sst&index=1&cmap=jet'
+        response1 = self.fetch(url)
+        self.assertEqual(response1.code, 200)
+        response2 = self.fetch(url)
+        self.assertEqual(response2.code, 200)
+        self.assertEqual(response2.body, response1.body)
+        # The pyramid of the first request is reused
+        self.assertEqual(IMAGE_PYRAMIDS.size, 1)
+
+    def test_unknown_resource(self):
+        response = self.fetch('/ws/res/tile/ws1/xy/0/0/0.png?var=sst')
+        self.assertEqual(response.code, 200)
+        self.assertIn(b'Unknown resource', response.body)
+
+    def test_resource_not_a_dataset(self):
+        response = self.fetch('/ws/res/tile/ws1/n/0/0/0.png?var=sst')
+        self.assertEqual(response.code, 200)
+        self.assertIn(b'must be a Dataset', response.body)
@@ -1,6 +1,9 @@
-import unittest
 import os
+import shutil
+import tempfile
+import unittest
 
+from cate.core.workspace import mk_op_kwargs
 from cate.core.wsmanag import FSWorkspaceManager
 from cate.util.monitor import Monitor
 from cate.webapi.websocket import WebSocketService
@@ -70,3 +73,47 @@ class WebSocketServiceTest(unittest.TestCase):
         self.assertEqual(op['inputs'][0]['name'], 'a')
         self.assertEqual(len(op['outputs']), 1)
         self.assertEqual(op['outputs'][0]['name'], 'v')
+
+    def test_workspace_changes_are_sent_as_deltas(self):
+        base_dir = tempfile.mkdtemp()
+        try:
+            workspace_json = self.service.new_workspace(base_dir)
+            base_dir = workspace_json['base_dir']
+            self.assertEqual(workspace_json['resources'], [])
+            self.assertEqual(workspace_json['version'], 1)
+            self.assertNotIn('base_version', workspace_json)
+
+            workspace_json, _ = self.service.set_workspace_resource(base_dir, 'cate.ops.utility.identity',
+                                                                    mk_op_kwargs(value=1), 'res_1', False,
+                                                                    Monitor.NONE)
+            workspace_json, _ = self.service.set_workspace_resource(base_dir, 'cate.ops.utility.identity',
+                                                                    mk_op_kwargs(value=2), 'res_2', False,
+                                                                    Monitor.NONE)
+            self.assertEqual(workspace_json['version'], 3)
+            self.assertEqual(workspace_json['base_version'], 2)
+            self.assertEqual([resource['name'] for resource in workspace_json['resources']], ['res_2'])
+            res_1_id, res_2_id = workspace_json['resource_ids']
+
+            workspace_json, _ = self.service.set_workspace_resource(base_dir, 'cate.ops.utility.identity',
+                                                                    mk_op_kwargs(value=3), 'res_1', True,
+                                                                    Monitor.NONE)
+            self.assertEqual([(resource['id'], resource['updateCount']) for resource in workspace_json['resources']],
+                             [(res_1_id, 2)])
+
+            workspace_json = self.service.rename_workspace_resource(base_dir, 'res_2', 'res_3')
+            self.assertEqual([(resource['id'], resource['name']) for resource in workspace_json['resources']],
+                             [(res_2_id, 'res_3')])
+
+            workspace_json = self.service.delete_workspace_resource(base_dir, 'res_1')
+            self.assertEqual(workspace_json['resources'], [])
+            self.assertEqual(workspace_json['resource_ids'], [res_2_id])
+
+            # The full state is sent on request
+            workspace_json = self.service.get_workspace(base_dir)
+            self.assertEqual(workspace_json['version'], 7)
+            self.assertEqual([resource['name'] for resource in workspace_json['resources']], ['res_3'])
+            self.assertNotIn('resource_ids', workspace_json)
+
+            self.service.close_workspace(base_dir)
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)